@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # Путь к проекту
@@ -14,9 +15,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Транзакция сразу берёт блокировку записи: иначе «прочитать, затем записать»
+            # (оформление заказа, списание резервов) под нагрузкой падает с database is locked
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Постоянные соединения: PRAGMA (shop.database) применяются один раз на соединение
+        'CONN_MAX_AGE': int(os.environ.get('SHOP_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# PRAGMA каждого нового соединения SQLite — shop.database.DEFAULT_PRAGMAS;
+# переопределяются словарём SHOP_SQLITE_PRAGMAS
+
+# Чтения через отдельное соединение только для чтения (shop.database.ReadReplicaRouter):
+# SHOP_DB_REPLICA=readonly — тот же файл (в WAL читатели не ждут писателя),
+# SHOP_DB_REPLICA=<путь> — снимок из manage.py snapshot_database, из него читается только каталог
+# в страницах shop.database.snapshot_reads и только гостями, которые последние
+# SHOP_DB_REPLICA_STICKY секунд ничего не меняли.
+# Тесты запускаются без реплики
+SHOP_DB_REPLICA = os.environ.get('SHOP_DB_REPLICA', '')
+if SHOP_DB_REPLICA:
+    _replica_path = DATABASES['default']['NAME'] if SHOP_DB_REPLICA == 'readonly' else SHOP_DB_REPLICA
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': f'file:{_replica_path}?mode=ro',
+        'OPTIONS': {},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['shop.database.ReadReplicaRouter']
+
 # Язык и часовой пояс
 LANGUAGE_CODE = 'ru'
 TIME_ZONE = 'Europe/Moscow'
@@ -63,6 +92,8 @@ LOGOUT_REDIRECT_URL = 'index'  # куда отправлять после вых
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.QueryInstrumentationMiddleware',  # SQL по запросам, N+1 и Server-Timing
+    'shop.database.PrimaryAfterWriteMiddleware',  # после записи — чтения из основной базы
     'django.contrib.sessions.middleware.SessionMiddleware',  # Добавленное middleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,4 +118,51 @@ DEBUG = True  # Установи в False на продакшн сервере
 
 ROOT_URLCONF = 'bookie.urls'
 
+# Общий кэш (второй уровень shop.caching, версии каталога, корзины гостей, главная).
+# По умолчанию — в памяти процесса; при нескольких воркерах нужен общий:
+# SHOP_CACHE_BACKEND=file (каталог SHOP_CACHE_LOCATION) или redis (адрес в SHOP_CACHE_LOCATION)
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bookie'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_cache_backend, _cache_location = _CACHE_BACKENDS[os.environ.get('SHOP_CACHE_BACKEND', 'locmem')]
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('SHOP_CACHE_LOCATION', _cache_location),
+        'TIMEOUT': 60 * 15,
+    },
+}
+if 'redis' not in _cache_backend:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+# Первый уровень: записей в LRU процесса (справочники целиком — по записи на таблицу и версию)
+SHOP_LOCAL_CACHE_SIZE = 128
+# Готовые страницы каталога для гостей (shop.pagecache); сбрасываются версиями каталога
+SHOP_PAGE_CACHE = os.environ.get('SHOP_PAGE_CACHE', '1') == '1'
+SHOP_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Инструментирование SQL (shop.middleware): доля запросов и порог повторов для N+1.
+# Под manage.py test выключено: иначе каждый запрос тестового клиента печатает строку лога
+# (тесты инструментирования включают его сами через override_settings)
+_TESTING = sys.argv[1:2] == ['test']
+SHOP_SQL_SAMPLE_RATE = float(os.environ.get('SHOP_SQL_SAMPLE_RATE', 0.0 if _TESTING else 1.0 if DEBUG else 0.01))
+SHOP_SQL_N_PLUS_ONE_THRESHOLD = 5
+
+# Отдача файлов книг прокси: '' — сам Django, 'x-accel-redirect' (nginx) или 'x-sendfile'.
+# Для nginx нужен internal location SHOP_DOWNLOAD_ACCEL_PREFIX с alias на MEDIA_ROOT
+SHOP_DOWNLOAD_OFFLOAD = os.environ.get('SHOP_DOWNLOAD_OFFLOAD', '')
+SHOP_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'shop.sql': {'handlers': ['console'], 'level': 'INFO' if DEBUG else 'WARNING', 'propagate': False},
+    },
+}
+
 SECRET_KEY = 'django-insecure-4^1#z+9&os8!y&34@7m()u%wxw3z53c*m7!z-5u_0bz-66y'
@@ -1,41 +1,50 @@
-from django.contrib import admin
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
+import os
+
+from django.contrib import admin, messages
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from . import exports, repricing, stock
 from .models import (
     User, Author, Genre, Series, Book, Review,
-    Order, OrderItem, Cart, Promotion, PromoBook, Category
+    Order, OrderItem, Cart, Promotion, PromoBook, Category, ExportJob,
+    Repricing, PriceChange, BookStock, StockReservation
 )
 
 # =====================
 # Экспорт книг в PDF
 # =====================
+def _queue_export(modeladmin, request, queryset, workers):
+    # Документ строит обработчик очереди (manage.py export_books_pdf --queue); здесь только ставим задачу
+    job = exports.start_export(queryset, user=request.user, workers=workers)
+    url = reverse('admin:shop_exportjob_change', args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html('Выгрузка <a href="{}">#{}</a> поставлена в очередь: {} книг', url, job.pk, job.total),
+        messages.SUCCESS,
+    )
+
+
 def export_books_pdf(modeladmin, request, queryset):
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = "attachment; filename=books.pdf"
-    p = canvas.Canvas(response)
-
-    y = 800
-    for book in queryset:
-        p.drawString(100, y, "{} - {} - {}".format(book.title, book.author.full_name, book.price))
-        y -= 20
-        if y < 50:
-            p.showPage()
-            y = 800
-
-    p.showPage()
-    p.save()
-    return response
+    _queue_export(modeladmin, request, queryset, workers=1)
 
 export_books_pdf.short_description = "Экспортировать книги в PDF"
 
+
+def export_books_pdf_parallel(modeladmin, request, queryset):
+    _queue_export(modeladmin, request, queryset, workers=min(os.cpu_count() or 1, exports.MAX_WORKERS))
+
+export_books_pdf_parallel.short_description = "Экспортировать книги в PDF (несколько процессов)"
+
 # =====================
 # Скидка 10%
 # =====================
 def apply_discount(modeladmin, request, queryset):
-    for book in queryset:
-        book.price *= 0.9
-        book.save()
+    # Один UPDATE на пачку книг с историей цен (shop.repricing)
+    result = repricing.reprice(queryset, percent=-10, reason="Скидка 10% из админки", user=request.user)
+    modeladmin.message_user(request, f"Переоценено книг: {result.count}", messages.SUCCESS)
 
 apply_discount.short_description = "Сделать скидку 10 процентов"
 
@@ -101,7 +110,7 @@ class BookAdmin(admin.ModelAdmin):
     readonly_fields = ('id',)
     list_display_links = ('title',)
     ordering = ('price',)
-    actions = [export_books_pdf, apply_discount]
+    actions = [export_books_pdf, export_books_pdf_parallel, apply_discount]
 
     def author_name(self, obj):
         return obj.author.full_name if obj.author else "-"
@@ -135,7 +144,7 @@ class ReviewAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user_name', 'date', 'status', 'delivery_address', 'payment_method')
+    list_display = ('id', 'user_name', 'date', 'status', 'total', 'delivery_address', 'payment_method')
     list_filter = ('status', 'payment_method', 'date')
     search_fields = ('user__username', 'delivery_address')
     raw_id_fields = ('user',)
@@ -211,3 +220,115 @@ class PromoBookAdmin(admin.ModelAdmin):
     book_title.short_description = 'Книга'
 
 admin.site.register(Category)
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress_bar', 'workers', 'created_by', 'created_at', 'finished_at', 'download_link')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'progress_bar', 'total', 'processed', 'workers', 'created_by',
+                       'created_at', 'heartbeat_at', 'finished_at', 'download_link', 'error')
+    exclude = ('book_ids', 'file')
+    list_display_links = ('id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_bar(self, obj):
+        return format_html(
+            '<progress value="{}" max="100"></progress> {}% ({} из {})',
+            obj.progress, obj.progress, obj.processed, obj.total,
+        )
+    progress_bar.short_description = 'Прогресс'
+
+    def download_link(self, obj):
+        if obj.status != 'done' or not obj.file:
+            return "-"
+        url = reverse('admin:shop_exportjob_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, os.path.basename(obj.file.name))
+    download_link.short_description = 'Файл'
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='shop_exportjob_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk, status='done')
+        if not self.has_view_permission(request, job) or not job.file or not job.file.storage.exists(job.file.name):
+            raise Http404
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
+
+@admin.register(Repricing)
+class RepricingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'percent', 'amount', 'books_count', 'changes_link', 'reason', 'created_by')
+    readonly_fields = ('created_at', 'percent', 'amount', 'books_count', 'reason', 'created_by')
+    list_display_links = ('id',)
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def changes_link(self, obj):
+        # Изменений может быть сотни тысяч — отдельный список вместо inline
+        url = reverse('admin:shop_pricechange_changelist') + f'?repricing__id__exact={obj.pk}'
+        return format_html('<a href="{}">История цен</a>', url)
+    changes_link.short_description = 'Изменения'
+
+@admin.register(PriceChange)
+class PriceChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'repricing', 'book_title', 'old_price', 'new_price')
+    list_filter = ('repricing',)
+    list_select_related = ('book', 'repricing')
+    raw_id_fields = ('repricing', 'book')
+    search_fields = ('book__title',)
+    readonly_fields = ('repricing', 'book', 'old_price', 'new_price')
+    list_display_links = ('id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def book_title(self, obj):
+        return obj.book.title
+    book_title.short_description = 'Книга'
+
+
+@admin.register(BookStock)
+class BookStockAdmin(admin.ModelAdmin):
+    list_display = ('book_title', 'quantity', 'book_status')
+    list_select_related = ('book',)
+    raw_id_fields = ('book',)
+    search_fields = ('book__title', 'book__isbn')
+    ordering = ('quantity',)
+
+    def save_model(self, request, obj, form, change):
+        # Через shop.stock: заодно переключается статус книги
+        stock.set_stock(obj.book_id, obj.quantity)
+
+    def book_title(self, obj):
+        return obj.book.title
+    book_title.short_description = 'Книга'
+
+    def book_status(self, obj):
+        return obj.book.get_status_display()
+    book_status.short_description = 'Статус'
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'book', 'user', 'quantity', 'created_at', 'expires_at')
+    list_select_related = ('book', 'user')
+    raw_id_fields = ('book', 'user')
+    readonly_fields = ('book', 'user', 'quantity', 'created_at', 'expires_at')
+    actions = ['release_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Удаление без возврата остатка потеряло бы экземпляры — только через действие
+        return False
+
+    @admin.action(description="Отменить резервы и вернуть экземпляры в остаток")
+    def release_selected(self, request, queryset):
+        released = sum(stock.release(reservation) for reservation in queryset)
+        self.message_user(request, f"Отменено резервов: {released}", messages.SUCCESS)
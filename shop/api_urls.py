@@ -1,8 +1,15 @@
 from django.urls import path
-from .api_views import BookListAPI, AuthorListAPI, ReviewListAPI
+from .api_views import BookListAPI, BookExportAPI, AuthorListAPI, ReviewListAPI, CartAPI, CartTotalsAPI, CheckoutAPI
+from .api_views import StockReservationAPI, StockReservationCancelAPI
 
 urlpatterns = [
     path('books/', BookListAPI.as_view(), name='api_books'),
+    path('books/export/', BookExportAPI.as_view(), name='api_books_export'),
     path('authors/', AuthorListAPI.as_view(), name='api_authors'),
     path('books/<int:book_id>/reviews/', ReviewListAPI.as_view(), name='api_reviews'),
+    path('cart/', CartAPI.as_view(), name='api_cart'),
+    path('cart/totals/', CartTotalsAPI.as_view(), name='api_cart_totals'),
+    path('checkout/', CheckoutAPI.as_view(), name='api_checkout'),
+    path('books/<int:book_id>/reserve/', StockReservationAPI.as_view(), name='api_reserve'),
+    path('reservations/<int:pk>/', StockReservationCancelAPI.as_view(), name='api_reservation'),
 ]
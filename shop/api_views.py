@@ -1,48 +1,185 @@
-from django.db.models import Avg, Count, Sum
-from rest_framework import generics
-from .models import Book, Author, Review, OrderItem, Favorite
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.generics import get_object_or_404
+from rest_framework.views import APIView
+from .models import Book, Author, Review, StockReservation
 from django_filters.rest_framework import DjangoFilterBackend
+from .cart import cart_totals, price_request_cart
+from .checkout import CheckoutError, checkout
+from . import facets, stock
+from .feeds import iter_json_lines
 from .filters import BookFilter
+from .pagination import AuthorPagination, KeysetCursorPagination
+from .pricing import ensure_prices_current, prime_prices
+from .stats import annotate_stats
+from .versioning import author_directory_condition, book_reviews_condition, catalog_condition
 from .serializers import (
+    optimize_queryset,
     BookSerializer,
     AuthorSerializer,
     ReviewSerializer,
-    BookAnnotatedSerializer
+    BookAnnotatedSerializer,
+    CartSerializer,
+    CheckoutSerializer,
+    OrderSerializer,
+    StockReservationSerializer,
 )
 
 filter_backends = [DjangoFilterBackend]
 
 
-# Список книг с аннотациями
+# Список книг с аннотациями: рейтинг, продажи и избранное читаются из BookStats
 class BookAnnotatedListAPI(generics.ListAPIView):
-    queryset = Book.objects.all().annotate(
-        avg_rating=Avg('review__rating'),            # средний рейтинг
-        sold_count=Sum('orderitem__quantity'),       # сколько купили (если есть OrderItem)
-        favorites_count=Count('favorite', distinct=True)  # сколько раз в избранное
-    )
+    queryset = annotate_stats(Book.objects.all())
     serializer_class = BookAnnotatedSerializer
 
 
-# Список книг
+# Список книг: курсорная пагинация, ?fields=id,title,price, фильтры BookFilter
+# и ?facets=1 — счётчики фасетов (shop.facets) рядом с результатами
+@method_decorator(catalog_condition, name='get')
 class BookListAPI(generics.ListAPIView):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    pagination_class = KeysetCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = BookFilter
+
+    def requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name.strip() for name in fields.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        # JOIN'ы и колонки выводятся из запрошенных полей сериализатора;
+        # цена со скидкой читается из BookPrice, без запроса на каждую книгу
+        ensure_prices_current()
+        return optimize_queryset(
+            super().get_queryset(),
+            self.get_serializer(),
+            extra_fields=self.pagination_class.ordering,
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and 'discounted_price' in self.get_serializer().fields:
+            prime_prices(page)
+        return page
 
     def get_serializer_context(self):
         # Передаем request в сериализатор
         return {'request': self.request}
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            filters = facets.normalize(request.query_params)
+            response.data['facets'] = {
+                name: [{'value': value, 'label': label, 'count': count} for value, label, count in items]
+                for name, items in facets.facet_counts(filters, request).items()
+            }
+        return response
+
+
+# Полная выгрузка каталога потоком JSON Lines (поля как у BookSerializer)
+class BookExportAPI(APIView):
+
+    def get(self, request):
+        response = StreamingHttpResponse(iter_json_lines(), content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="books.jsonl"'
+        return response
+
 
 # Список авторов
+@method_decorator(author_directory_condition, name='get')
 class AuthorListAPI(generics.ListAPIView):
-    queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    pagination_class = AuthorPagination
+
+    def get_queryset(self):
+        # ?sort=name|-name|books|-books
+        return Author.objects.directory(self.request.query_params.get('sort', 'name')).only('id', 'full_name')
 
 
 # Список отзывов для книги
+@method_decorator(book_reviews_condition, name='get')
 class ReviewListAPI(generics.ListAPIView):
     serializer_class = ReviewSerializer
 
     def get_queryset(self):
         book_id = self.kwargs.get('book_id')
-        return Review.objects.filter(book_id=book_id)
+        return Review.objects.filter(book_id=book_id).select_related('user')
+
+
+# Корзина текущего пользователя: позиции, скидки и итог
+class CartAPI(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return Response(CartSerializer(price_request_cart(request)).data)
+
+
+# Только итоги корзины (бейдж в шапке) — один агрегирующий запрос
+class CartTotalsAPI(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        if request.user.is_authenticated:
+            totals = cart_totals(request.user)
+        else:
+            summary = price_request_cart(request)
+            totals = {'items_count': summary.items_count, 'subtotal': summary.subtotal, 'total': summary.total}
+        return Response({
+            'items_count': totals['items_count'],
+            'subtotal': f"{totals['subtotal']:.2f}",
+            'total': f"{totals['total']:.2f}",
+        })
+
+
+# Оформление заказа; ключ идемпотентности — заголовок Idempotency-Key или поле idempotency_key
+class CheckoutAPI(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        try:
+            order, created = checkout(request.user, data['delivery_address'], data['payment_method'], key)
+        except CheckoutError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+# Резерв экземпляров книги на время оформления; 409 — если остатка не хватает
+class StockReservationAPI(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, book_id):
+        get_object_or_404(Book.objects.only('pk'), pk=book_id)
+        serializer = StockReservationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reservation = stock.reserve(request.user, book_id, serializer.validated_data['quantity'])
+        except stock.OutOfStock as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(StockReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+
+class StockReservationCancelAPI(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request, pk):
+        reservation = get_object_or_404(StockReservation, pk=pk, user=request.user)
+        stock.release(reservation)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,187 @@
+"""
+Двухуровневый кэш справочников каталога.
+
+Первый уровень — ограниченный LRU в памяти процесса: небольшие таблицы
+Author, Genre, Series и Category целиком, без сетевых обращений и
+распаковки. Второй — общий кэш Django (settings.CACHES, между
+процессами). Ключи содержат версию справочников (versioning.DIMENSIONS),
+которую поднимают сигналы при изменении любого из них, так что старые
+значения просто перестают читаться; LRU процесса, где произошло
+изменение, очищается сразу.
+
+Одновременные промахи по одному ключу сливаются в одно заполнение
+(single-flight): потоки процесса ждут лидера, а другие процессы —
+блокировку в общем кэше. Холодный старт не превращается в лавину
+одинаковых запросов к SQLite.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import versioning
+from .models import Author, Book, Category, Genre, Series
+
+MISSING = object()
+CACHE_PREFIX = 'shop:dim:'
+CACHE_TIMEOUT = 60 * 60 * 24
+LOCK_TIMEOUT = 10
+LOCK_POLL = 0.05
+
+# Справочник -> (модель, колонки для карточек)
+DIMENSIONS = {
+    'author': (Author, ('id', 'full_name')),
+    'genre': (Genre, ('id', 'name')),
+    'series': (Series, ('id', 'name')),
+    'category': (Category, ('id', 'name')),
+}
+
+
+class LRUCache:
+    """Потокобезопасный LRU на maxsize записей."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Для каждого ключа одновременно выполняется одно заполнение; остальные потоки ждут его результат."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fill):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fill()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+local = LRUCache(getattr(settings, 'SHOP_LOCAL_CACHE_SIZE', 128))
+_flight = SingleFlight()
+
+
+def _fill_shared(key, fill, timeout):
+    """Заполняет общий кэш под блокировкой: другие процессы ждут значение, а не считают его сами."""
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            value = cache.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        # Держатель блокировки завис или упал — считаем сами
+    try:
+        value = fill()
+        cache.set(key, value, timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def get_or_fill(key, fill, timeout=CACHE_TIMEOUT):
+    """Значение из LRU процесса, затем из общего кэша, иначе fill() — один раз на ключ."""
+    value = local.get(key, MISSING)
+    if value is not MISSING:
+        return value
+
+    def load():
+        value = cache.get(key, MISSING)
+        if value is MISSING:
+            value = _fill_shared(key, fill, timeout)
+        local.set(key, value)
+        return value
+
+    return _flight.do(key, load)
+
+
+def _dimension_key(name):
+    version, _ = versioning.get_versions([versioning.DIMENSIONS])[versioning.DIMENSIONS]
+    return f'{CACHE_PREFIX}{name}:v{version}'
+
+
+def dimension(name):
+    """{pk: объект} справочника name с колонками для карточек."""
+    model, columns = DIMENSIONS[name]
+    return get_or_fill(_dimension_key(name), lambda: model.objects.only(*columns).in_bulk())
+
+
+def invalidate_local():
+    """Сбрасывает справочники в LRU этого процесса (другие процессы уйдут на новую версию ключа)."""
+    local.delete_prefix(CACHE_PREFIX)
+
+
+def attach_dimensions(objects, *names):
+    """
+    Подставляет книгам objects связанные справочники из кэша вместо JOIN:
+    attach_dimensions(page, 'author') — и book.author.full_name не идёт в базу.
+    Записи, которых ещё нет в кэше (созданы только что), дочитываются одним запросом.
+    """
+    objects = list(objects)
+    for name in names:
+        field = Book._meta.get_field(name)
+        rows = dimension(name)
+        missing = {getattr(obj, field.attname) for obj in objects} - rows.keys() - {None}
+        if missing:
+            model, columns = DIMENSIONS[name]
+            rows = {**rows, **model.objects.only(*columns).in_bulk(missing)}
+        for obj in objects:
+            related_id = getattr(obj, field.attname)
+            field.set_cached_value(obj, rows.get(related_id) if related_id is not None else None)
+    return objects
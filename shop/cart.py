@@ -0,0 +1,207 @@
+"""
+Корзина: хранение и расчёт.
+
+Корзина гостя живёт в кэше под случайным токеном из cookie и не пишет
+в базу; при входе она сливается в таблицу Cart одним upsert. Для
+вошедших пользователей количество меняется атомарно через F().
+
+Позиции читаются одним запросом вместе с книгами, авторами и
+материализованными ценами (BookPrice); акции для книг без актуальной
+цены подставляются ещё одним запросом на всю корзину. Итоги без позиций
+(бейдж, сводка API) считаются одним агрегатом в базе.
+"""
+import re
+import secrets
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Book, Cart
+from .pricing import ensure_prices_current, prime_prices
+
+ZERO = Decimal('0.00')
+
+
+class CartLine:
+    """Позиция корзины с ценой на сегодня."""
+
+    def __init__(self, book, quantity):
+        self.book = book
+        self.quantity = quantity
+        self.unit_price = book.price
+        self.promo = book.active_promo
+        self.price = book.discounted_price
+        self.total_price = self.price * quantity
+        self.discount = (self.unit_price - self.price) * quantity
+
+
+class CartSummary:
+    def __init__(self, lines):
+        self.lines = lines
+        self.items_count = sum(line.quantity for line in lines)
+        self.subtotal = sum((line.unit_price * line.quantity for line in lines), ZERO)
+        self.discount = sum((line.discount for line in lines), ZERO)
+        self.total = sum((line.total_price for line in lines), ZERO)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def price_lines(items):
+    """items — пары (книга, количество); книги должны быть загружены с price_index."""
+    items = list(items)
+    prime_prices([book for book, _ in items])
+    return CartSummary([CartLine(book, quantity) for book, quantity in items])
+
+
+def cart_items(user):
+    ensure_prices_current()
+    return (
+        Cart.objects.filter(user=user)
+        .select_related('book__author', 'book__price_index__promotion')
+        .order_by('pk')
+    )
+
+
+def price_cart(user):
+    """Позиции, скидки и итог корзины пользователя за один-два запроса."""
+    return price_lines((item.book, item.quantity) for item in cart_items(user))
+
+
+def cart_totals(user):
+    """
+    {'items_count', 'subtotal', 'total'} одним агрегатом по BookPrice.
+    Если у какой-то книги цена не актуальна, итоги считаются через price_cart().
+    """
+    ensure_prices_current()
+    today = timezone.localdate()
+    fresh = Q(book__price_index__valid_from__lte=today, book__price_index__valid_until__gte=today)
+    money = DecimalField(max_digits=12, decimal_places=2)
+    totals = Cart.objects.filter(user=user).aggregate(
+        items_count=Coalesce(Sum('quantity'), 0),
+        subtotal=Coalesce(Sum(F('book__price') * F('quantity'), output_field=money), ZERO, output_field=money),
+        total=Coalesce(Sum(
+            Case(When(fresh, then=F('book__price_index__effective_price')), default=F('book__price'))
+            * F('quantity'), output_field=money,
+        ), ZERO, output_field=money),
+        stale=Count('pk', filter=~fresh),
+    )
+    if totals.pop('stale'):
+        summary = price_cart(user)
+        return {'items_count': summary.items_count, 'subtotal': summary.subtotal, 'total': summary.total}
+    return totals
+
+
+# ======================
+# Корзина гостя (кэш)
+# ======================
+
+COOKIE_NAME = 'cart'
+CACHE_PREFIX = 'shop:cart:'
+CART_TIMEOUT = 60 * 60 * 24 * 14
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{22}')
+
+
+class AnonymousCart:
+    """{book_id: количество} в кэше; токен — в cookie COOKIE_NAME."""
+
+    def __init__(self, request):
+        token = request.COOKIES.get(COOKIE_NAME, '')
+        self.token = token if _TOKEN_RE.fullmatch(token) else None
+        self.items = cache.get(self.key, {}) if self.token else {}
+        self.modified = False
+
+    @property
+    def key(self):
+        return CACHE_PREFIX + self.token
+
+    def add(self, book_id, quantity=1):
+        self.items[book_id] = self.items.get(book_id, 0) + quantity
+        self.modified = True
+
+    def remove(self, book_id):
+        if self.items.pop(book_id, None) is None:
+            return False
+        self.modified = True
+        return True
+
+    def clear(self):
+        if self.token:
+            cache.delete(self.key)
+        self.items = {}
+
+    def save(self, response):
+        """Записывает изменения в кэш и выдаёт cookie новому гостю."""
+        if not self.modified:
+            return response
+        if self.token is None:
+            self.token = secrets.token_urlsafe(16)
+            response.set_cookie(COOKIE_NAME, self.token, max_age=CART_TIMEOUT, httponly=True, samesite='Lax')
+        cache.set(self.key, self.items, CART_TIMEOUT)
+        self.modified = False
+        return response
+
+
+def price_anonymous_cart(anonymous):
+    ensure_prices_current()
+    books = Book.objects.select_related('author', 'price_index__promotion').in_bulk(list(anonymous.items))
+    return price_lines(
+        (books[book_id], quantity) for book_id, quantity in anonymous.items.items() if book_id in books
+    )
+
+
+def price_request_cart(request):
+    """Корзина текущего посетителя: из таблицы Cart или из кэша гостя."""
+    if request.user.is_authenticated:
+        return price_cart(request.user)
+    return price_anonymous_cart(AnonymousCart(request))
+
+
+# ======================
+# Корзина пользователя (БД)
+# ======================
+
+def add_item(user, book_id, quantity=1):
+    """Атомарно увеличивает количество; строка создаётся только при первом добавлении."""
+    with transaction.atomic():
+        if Cart.objects.filter(user=user, book_id=book_id).update(quantity=F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                Cart.objects.create(user=user, book_id=book_id, quantity=quantity)
+        except IntegrityError:
+            # Параллельный запрос (двойной клик) успел вставить строку — прибавляем к ней
+            Cart.objects.filter(user=user, book_id=book_id).update(quantity=F('quantity') + quantity)
+
+
+def remove_item(user, book_id):
+    deleted, _ = Cart.objects.filter(user=user, book_id=book_id).delete()
+    return bool(deleted)
+
+
+def merge_anonymous_cart(request, user):
+    """Переносит корзину гостя в таблицу Cart: одно чтение и один upsert."""
+    anonymous = AnonymousCart(request)
+    if not anonymous.items:
+        return 0
+    with transaction.atomic():
+        existing = dict(
+            Cart.objects.filter(user=user, book_id__in=list(anonymous.items)).values_list('book_id', 'quantity')
+        )
+        existing_books = set(Book.objects.filter(pk__in=list(anonymous.items)).order_by().values_list('pk', flat=True))
+        Cart.objects.bulk_create(
+            [
+                Cart(user=user, book_id=book_id, quantity=existing.get(book_id, 0) + quantity)
+                for book_id, quantity in anonymous.items.items() if book_id in existing_books
+            ],
+            update_conflicts=True, unique_fields=['user', 'book'], update_fields=['quantity'],
+        )
+    anonymous.clear()
+    return len(existing_books)
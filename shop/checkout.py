@@ -0,0 +1,78 @@
+"""
+Оформление заказа из корзины.
+
+Вся конверсия — одна короткая транзакция: позиции корзины блокируются
+и оцениваются одним запросом (shop.cart), остатки списываются условным
+UPDATE (shop.stock), затем создаются Order, все OrderItem одним
+bulk_create с ценами на момент покупки, счётчики продаж обновляются
+пачкой, а корзина очищается одним DELETE. bulk_create не
+вызывает сигналы OrderItem, поэтому статистика и кэш главной обновляются
+здесь явно.
+
+Клиент передаёт ключ идемпотентности: повтор запроса с тем же ключом
+(ретрай после таймаута, двойной клик) возвращает уже созданный заказ.
+"""
+from django.db import IntegrityError, transaction
+
+from . import homepage, stats, stock
+from .cart import cart_items, price_lines
+from .models import Cart, Order, OrderItem
+from .pricing import ensure_prices_current
+
+
+class CheckoutError(ValueError):
+    pass
+
+
+def _existing_order(user, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def checkout(user, delivery_address, payment_method, idempotency_key=None):
+    """Превращает корзину пользователя в заказ. Возвращает (заказ, создан ли он сейчас)."""
+    order = _existing_order(user, idempotency_key)
+    if order is not None:
+        return order, False
+    if not delivery_address or not payment_method:
+        raise CheckoutError("Укажите адрес доставки и способ оплаты")
+    # Досчёт устаревших цен пишет в БД — до транзакции, чтобы не удлинять её
+    ensure_prices_current()
+
+    try:
+        with transaction.atomic():
+            items = list(cart_items(user).select_for_update(of=('self',)))
+            if not items:
+                # Параллельный запрос с тем же ключом уже оформил эту корзину
+                order = _existing_order(user, idempotency_key)
+                if order is not None:
+                    return order, False
+                raise CheckoutError("Корзина пуста")
+            summary = price_lines((item.book, item.quantity) for item in items)
+            try:
+                stock.consume(user, {line.book.pk: line.quantity for line in summary})
+            except stock.OutOfStock as exc:
+                raise CheckoutError(str(exc)) from exc
+
+            order = Order.objects.create(
+                user=user,
+                delivery_address=delivery_address,
+                payment_method=payment_method,
+                total=summary.total,
+                idempotency_key=idempotency_key or None,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, book=line.book, quantity=line.quantity, price=line.price)
+                for line in summary
+            ])
+            stats.add_sales_many((line.book.pk, line.book.author_id, line.quantity) for line in summary)
+            Cart.objects.filter(pk__in=[item.pk for item in items]).delete()
+            transaction.on_commit(lambda: homepage.invalidate('popular_books'))
+    except IntegrityError:
+        # Гонка двух запросов с одним ключом: уникальный индекс пропустил только один
+        order = _existing_order(user, idempotency_key)
+        if order is None:
+            raise
+        return order, False
+    return order, True
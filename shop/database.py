@@ -0,0 +1,175 @@
+"""
+Профиль SQLite для нескольких воркеров.
+
+Каждое новое соединение настраивается PRAGMA из DEFAULT_PRAGMAS (или
+SHOP_SQLITE_PRAGMAS, если задан в настройках; сигнал connection_created, см. shop.signals): WAL — читатели не ждут
+писателя и наоборот, synchronous=NORMAL — fsync только на контрольных
+точках WAL, mmap и большой кэш страниц — чтение каталога без системных
+вызовов, busy_timeout — запись ждёт блокировку, а не падает сразу с
+«database is locked». Соединения живут CONN_MAX_AGE секунд, так что
+настройка выполняется один раз на соединение, а не на запрос.
+
+ReadReplicaRouter отправляет чтения в соединение 'replica' (если оно
+задано через SHOP_DB_REPLICA), запись — в основное. Внутри транзакции
+чтения остаются в основном соединении: свои незакоммиченные изменения
+видны только ему. Реплика — тот же файл в режиме только для чтения или
+снимок из manage.py snapshot_database. Снимок отстаёт, поэтому из него
+читаются только таблицы каталога (CATALOG_MODELS) и только в страницах,
+помеченных snapshot_reads, — GET посетителя, который недавно ничего не менял
+(после записи PrimaryAfterWriteMiddleware на SHOP_DB_REPLICA_STICKY секунд
+закрепляет посетителя за основной базой). Проверка форм, редиректы после
+записи и всё вне запросов читают основную базу; страница, прочитанная из
+снимка, не кэшируется (shop.pagecache) и уходит без ETag.
+"""
+import os
+import sqlite3
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+READ_PRIMARY_COOKIE = 'shop_read_primary'
+STICKY_SECONDS = getattr(settings, 'SHOP_DB_REPLICA_STICKY', 5 * 60)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ: 64 МиБ на соединение
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
+}
+
+# Таблицы, которые можно читать из отстающего снимка: корзины, заказы,
+# пользователи и сессии всегда читаются из основной базы
+CATALOG_MODELS = {
+    'shop.Book', 'shop.Author', 'shop.Genre', 'shop.Series', 'shop.Category',
+    'shop.BookPrice', 'shop.BookStats', 'shop.AuthorStats', 'shop.Promotion', 'shop.PromoBook',
+    'shop.Review',
+}
+
+
+# Состояние страницы под snapshot_reads: {'used': читалась ли она из снимка}
+_snapshot_reads = ContextVar('shop_snapshot_reads', default=None)
+
+
+def snapshot_mode():
+    """Реплика — отстающий снимок, а не тот же файл."""
+    mode = getattr(settings, 'SHOP_DB_REPLICA', '')
+    return bool(mode) and mode != 'readonly'
+
+
+def read_from_snapshot():
+    """Читала ли текущая страница каталог из снимка."""
+    state = _snapshot_reads.get()
+    return state is not None and state['used']
+
+
+def snapshot_reads(view):
+    """
+    Декоратор страниц только для чтения: каталог в них может читаться из
+    снимка. Ставится над декоратором условного GET.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not snapshot_mode()
+            or request.method not in ('GET', 'HEAD')
+            or READ_PRIMARY_COOKIE in request.COOKIES
+        ):
+            return view(request, *args, **kwargs)
+        state = {'used': False}
+        token = _snapshot_reads.set(state)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _snapshot_reads.reset(token)
+        if state['used']:
+            # ETag считается по версиям основной базы: устаревшая страница не должна закрепиться под ним
+            del response['ETag']
+            del response['Last-Modified']
+        return response
+    return wrapper
+
+
+class PrimaryAfterWriteMiddleware:
+    """После записи посетитель читает основную базу, пока снимок его не догонит."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if snapshot_mode() and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(READ_PRIMARY_COOKIE, '1', max_age=STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def configure_connection(connection):
+    """Применяет PRAGMA к только что открытому соединению SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SHOP_SQLITE_PRAGMAS', DEFAULT_PRAGMAS))
+    read_only = is_read_only(connection)
+    if read_only:
+        # Режим журнала хранится в файле, его задаёт основное соединение
+        pragmas.pop('journal_mode', None)
+        pragmas['query_only'] = 1
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def snapshot(path):
+    """
+    Согласованная копия основной базы в path через backup API SQLite — без
+    остановки записи. Файл подменяется целиком: открытые соединения дочитывают
+    старый снимок, новые видят свежий.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite':
+        raise ValueError("Снимок поддерживается только для SQLite")
+    connection.ensure_connection()
+    tmp = f'{path}.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    target = sqlite3.connect(tmp)
+    try:
+        connection.connection.backup(target)
+        # Снимок открывают только для чтения: без -wal и -shm рядом с ним
+        target.execute('PRAGMA journal_mode = delete')
+    finally:
+        target.close()
+    os.replace(tmp, path)
+
+
+class ReadReplicaRouter:
+    """Чтения — в реплику (вне транзакций), запись и миграции — в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        if not getattr(settings, 'SHOP_DB_REPLICA', ''):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if snapshot_mode():
+            state = _snapshot_reads.get()
+            if state is None or model._meta.label not in CATALOG_MODELS:
+                return DEFAULT_DB_ALIAS
+            state['used'] = True
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия той же базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
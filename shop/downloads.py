@@ -0,0 +1,158 @@
+"""
+Выдача файлов купленных книг.
+
+Файл отдаётся только покупателю (есть OrderItem в неотменённом заказе)
+и сотрудникам. Поддерживаются ETag/Last-Modified по размеру и времени
+изменения, If-None-Match и Range с If-Range: читалка может докачивать
+и перематывать PDF.
+
+Если задан SHOP_DOWNLOAD_OFFLOAD, Django только проверяет доступ, а сам
+файл отдаёт прокси: 'x-accel-redirect' (nginx, внутренний location
+SHOP_DOWNLOAD_ACCEL_PREFIX, смотрящий в MEDIA_ROOT) или 'x-sendfile'
+(Apache mod_xsendfile, lighttpd). Range прокси обрабатывает сам, и
+Python-воркер не занят на время скачивания.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+from .models import OrderItem
+
+CONTENT_TYPE = 'application/pdf'
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def has_purchased(user, book):
+    if user.is_staff:
+        return True
+    return (
+        OrderItem.objects.filter(order__user=user, book=book)
+        .exclude(order__status='cancelled').exists()
+    )
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    (начало, конец включительно) для одного диапазона; None — отдать файл
+    целиком (заголовка нет, он некорректен или диапазонов несколько).
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-500: последние 500 байт
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # Слабый ETag не годится для склейки кусков
+        return value == etag
+    return parse_http_date_safe(value) == int(mtime)
+
+
+class _FileRange:
+    """Читает из файла не больше length байт начиная с offset."""
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _offloaded(field, filename):
+    mode = getattr(settings, 'SHOP_DOWNLOAD_OFFLOAD', '')
+    if not mode:
+        return None
+    response = HttpResponse(content_type=CONTENT_TYPE)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'SHOP_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(field.name)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = field.path
+    else:
+        raise ValueError(f"Неизвестный SHOP_DOWNLOAD_OFFLOAD: {mode}")
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def serve(request, field):
+    """Ответ с содержимым FileField field (файл в локальном хранилище)."""
+    filename = os.path.basename(field.name)
+    response = _offloaded(field, filename)
+    if response is not None:
+        return response
+
+    stat = os.stat(field.path)
+    etag = file_etag(stat)
+    validators = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime), 'Accept-Ranges': 'bytes'}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if 'Range' in request.headers and _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(field.path, 'rb')
+    if byte_range is None:
+        # Целиком: сервер с wsgi.file_wrapper отдаст файл через sendfile()
+        response = FileResponse(file, as_attachment=True, filename=filename, content_type=CONTENT_TYPE)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            _FileRange(file, start, end - start + 1),
+            as_attachment=True, filename=filename, content_type=CONTENT_TYPE, status=206,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    for header, value in validators.items():
+        response[header] = value
+    return response
@@ -0,0 +1,186 @@
+"""
+Фоновая выгрузка каталога в PDF.
+
+Админ-действие только ставит задачу (ExportJob) в очередь; её выполняет
+отдельный процесс manage.py export_books_pdf --queue, а не воркер
+веб-сервера: перезапуск сервера не обрывает выгрузку, а пул процессов не
+порождается из многопоточного сервера. Документ строится пачками книг с
+select_related('author') и пишется в файл в MEDIA_ROOT/exports/, прогресс
+сохраняется в ExportJob.processed и heartbeat_at. Задача без прогресса
+дольше STALE_AFTER (обработчик упал или был убит) помечается ошибкой.
+Очень большие выгрузки можно разбить на части по нескольким процессам —
+части склеиваются через pypdf, а без него отдаются zip-архивом.
+"""
+import datetime
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from .models import Book, ExportJob
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # pragma: no cover - склейка частей необязательна
+    PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+# Меньше этого число процессов не имеет смысла: запуск пула дороже самой выгрузки
+PARALLEL_MIN_BOOKS = 5000
+MAX_WORKERS = 4
+# Дольше этого без прогресса задача считается брошенной
+STALE_AFTER = datetime.timedelta(seconds=getattr(settings, 'SHOP_EXPORT_STALE_AFTER', 15 * 60))
+
+TOP, BOTTOM, LINE = 800, 50, 20
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def render_part(job_id, book_ids, path):
+    """Пишет книги book_ids (в их порядке) в PDF path; прогресс — после каждой пачки."""
+    pdf = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+    y = TOP
+    for chunk in _chunks(book_ids, CHUNK_SIZE):
+        books = Book.objects.select_related('author').only('title', 'price', 'author__full_name').in_bulk(chunk)
+        for pk in chunk:
+            book = books.get(pk)
+            if book is None:  # удалена после постановки задачи
+                continue
+            pdf.drawString(100, y, f"{book.title} - {book.author.full_name} - {book.price}")
+            y -= LINE
+            if y < BOTTOM:
+                pdf.showPage()
+                y = TOP
+        ExportJob.objects.filter(pk=job_id).update(
+            processed=F('processed') + len(chunk), heartbeat_at=timezone.now(),
+        )
+    pdf.showPage()
+    pdf.save()
+    return path
+
+
+def _init_worker():
+    # Дочерний процесс не должен пользоваться соединениями родителя
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _render_parallel(job, book_ids, path):
+    parts = [f'{path}.{i}' for i in range(job.workers)]
+    size = -(-len(book_ids) // job.workers)
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=job.workers, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(render_part, job.pk, book_ids[i * size:(i + 1) * size], part)
+            for i, part in enumerate(parts)
+        ]
+        for future in futures:
+            future.result()
+    try:
+        return merge_parts(parts, path)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def merge_parts(parts, path):
+    """Склеивает части в один PDF; без pypdf складывает их в zip рядом. Возвращает итоговый путь."""
+    if PdfWriter is not None:
+        writer = PdfWriter()
+        for part in parts:
+            writer.append(part)
+        with open(path, 'wb') as output:
+            writer.write(output)
+        return path
+    path = os.path.splitext(path)[0] + '.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for number, part in enumerate(parts, 1):
+            archive.write(part, f'books-{number}.pdf')
+    return path
+
+
+def _book_ids(job):
+    if job.book_ids is not None:
+        return list(job.book_ids)
+    return list(Book.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def run_export(job_id):
+    """Выполняет задачу выгрузки (из manage.py export_books_pdf)."""
+    job = ExportJob.objects.get(pk=job_id)
+    book_ids = _book_ids(job)
+    ExportJob.objects.filter(pk=job_id).update(
+        status='running', processed=0, total=len(book_ids), error='', heartbeat_at=timezone.now(),
+    )
+
+    storage = job.file.storage
+    name = storage.generate_filename(f'exports/books-{job.pk}.pdf')
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        if job.workers > 1 and len(book_ids) >= PARALLEL_MIN_BOOKS:
+            path = _render_parallel(job, book_ids, path)
+        else:
+            render_part(job.pk, book_ids, path)
+    except Exception as exc:
+        logger.exception("Выгрузка #%s завершилась ошибкой", job_id)
+        ExportJob.objects.filter(pk=job_id).update(status='failed', error=str(exc), finished_at=timezone.now())
+        return
+    ExportJob.objects.filter(pk=job_id).update(
+        status='done', file=os.path.join(os.path.dirname(name), os.path.basename(path)),
+        finished_at=timezone.now(),
+    )
+
+
+def start_export(queryset=None, user=None, workers=1):
+    """
+    Ставит в очередь выгрузку книг queryset (None — весь каталог).
+    Возвращает ExportJob; выполнит её manage.py export_books_pdf --queue.
+    """
+    book_ids = None if queryset is None else list(queryset.values_list('pk', flat=True))
+    return ExportJob.objects.create(
+        created_by=user if user is not None and user.is_authenticated else None,
+        book_ids=book_ids,
+        total=len(book_ids) if book_ids is not None else 0,
+        workers=max(1, min(workers, MAX_WORKERS)),
+    )
+
+
+def fail_stale():
+    """Помечает ошибкой выполняющиеся задачи без прогресса дольше STALE_AFTER. Возвращает их число."""
+    now = timezone.now()
+    return ExportJob.objects.filter(status='running', heartbeat_at__lt=now - STALE_AFTER).update(
+        status='failed', error="Выгрузка прервана: обработчик перестал отвечать", finished_at=now,
+    )
+
+
+def claim_next():
+    """
+    Забирает самую старую задачу из очереди и возвращает её id (None — очередь
+    пуста). Условный UPDATE не даёт двум обработчикам взять одну задачу.
+    """
+    while True:
+        job_id = ExportJob.objects.filter(status='pending').order_by('created_at', 'pk').values_list(
+            'pk', flat=True
+        ).first()
+        if job_id is None:
+            return None
+        claimed = ExportJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', heartbeat_at=timezone.now(),
+        )
+        if claimed:
+            return job_id
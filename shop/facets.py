@@ -0,0 +1,184 @@
+"""
+Фасеты каталога: сколько книг в каждом жанре, у каждого автора, в
+категории, статусе, году и ценовой корзине.
+
+Счётчики фасета считаются по выборке со всеми фильтрами, кроме его
+собственного, — так видно, сколько добавит ещё одно значение того же
+фильтра. Каждый фасет — один запрос к shop_book без JOIN: GROUP BY по id
+или индексированной колонке, ценовые корзины — условной агрегацией.
+Подписи справочников берутся из кэша (shop.caching).
+
+Результат кэшируется в общем кэше под версией каталога
+(versioning.GLOBAL) — любое изменение книг, акций или справочников
+делает старые записи недостижимыми. Кэшируются только частые сочетания:
+не больше CACHE_MAX_FILTERS активных фильтров у фасета; редкие сочетания
+считаются заново, чтобы не вытеснять из кэша полезное.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import caching, versioning
+from .filters import PRICE_BUCKETS, BookFilter, parse_id, price_bucket_q
+from .models import Book
+
+CACHE_PREFIX = 'shop:facets:'
+CACHE_TIMEOUT = 60 * 60
+CACHE_MAX_FILTERS = getattr(settings, 'SHOP_FACET_CACHE_MAX_FILTERS', 2)
+# Авторов много: показываем самых многочисленных
+AUTHOR_LIMIT = 20
+
+# Параметры запроса, от которых зависит выборка (порядок — порядок фасетов на странице)
+FILTER_PARAMS = ('genre', 'author', 'category', 'status', 'year', 'price', 'min_price', 'max_price')
+FACETS = ('genre', 'author', 'category', 'status', 'year', 'price')
+TITLES = {
+    'genre': "Жанр",
+    'author': "Автор",
+    'category': "Категория",
+    'status': "Наличие",
+    'year': "Год издания",
+    'price': "Цена",
+}
+
+
+def _valid(name, value):
+    # Те же правила, что у BookFilter: иначе отброшенное фильтром значение осталось бы в ссылках фасетов
+    if name in ('genre', 'author', 'category', 'year'):
+        return parse_id(value) is not None
+    if name == 'status':
+        return value in dict(Book.STATUS_CHOICES)
+    if name == 'price':
+        return value in PRICE_BUCKETS
+    try:
+        return Decimal(value).is_finite()
+    except InvalidOperation:
+        return False
+
+
+def normalize(params):
+    """
+    {фильтр: отсортированный кортеж значений} из QueryDict: только фильтры
+    каталога и допустимые значения, ?genre=1&genre=2 и ?genre=2,1 дают одно и то же.
+    """
+    normalized = {}
+    for name in FILTER_PARAMS:
+        values = {
+            value.strip() for raw in params.getlist(name) for value in raw.split(',')
+            if value.strip() and _valid(name, value.strip())
+        }
+        if values:
+            normalized[name] = tuple(sorted(values))
+    return normalized
+
+
+def filter_books(filters, queryset=None):
+    """Книги, подходящие под нормализованные фильтры (через BookFilter)."""
+    data = {name: ','.join(values) for name, values in filters.items()}
+    return BookFilter(data, queryset=Book.objects.all() if queryset is None else queryset).qs
+
+
+def _grouped(queryset, facet):
+    queryset = queryset.order_by()
+    if facet == 'price':
+        # Корзины — условная агрегация одной строкой: GROUP BY по CASE сортировал бы во временном B-дереве
+        counts = queryset.aggregate(**{
+            key: Count('pk', filter=price_bucket_q(key)) for key in PRICE_BUCKETS
+        })
+        return [(key, count) for key, count in counts.items() if count]
+    column = {'genre': 'genre_id', 'author': 'author_id', 'category': 'category_id'}.get(facet, facet)
+    rows = queryset.values_list(column).annotate(count=Count('pk'))
+    return [(value, count) for value, count in rows if value is not None]
+
+
+def _label(facet, value):
+    if facet in ('genre', 'author', 'category'):
+        obj = caching.dimension(facet).get(value)
+        return str(obj) if obj is not None else str(value)
+    if facet == 'status':
+        return dict(Book.STATUS_CHOICES).get(value, value)
+    if facet == 'price':
+        return PRICE_BUCKETS[value][0]
+    return str(value)
+
+
+def _sort_key(facet, item):
+    value, label, count = item
+    if facet == 'price':
+        return list(PRICE_BUCKETS).index(value)
+    if facet == 'year':
+        return -value
+    if facet == 'author':
+        return (-count, label)
+    return label
+
+
+def compute(facet, filters):
+    """[(значение, подпись, число книг)] фасета facet для фильтров без его собственного."""
+    queryset = filter_books({name: values for name, values in filters.items() if name != facet})
+    rows = _grouped(queryset, facet)
+    if facet == 'author':
+        # Top-N отбираем здесь: ORDER BY по счётчику в SQL потребовал бы сортировки во временном B-дереве
+        rows = sorted(rows, key=lambda row: (-row[1], row[0]))[:AUTHOR_LIMIT]
+    items = [(value, _label(facet, value), count) for value, count in rows]
+    return sorted(items, key=lambda item: _sort_key(facet, item))
+
+
+def _key(facet, filters, version):
+    others = sorted((name, values) for name, values in filters.items() if name != facet)
+    digest = hashlib.md5(repr(others).encode(), usedforsecurity=False).hexdigest()
+    return f'{CACHE_PREFIX}{facet}:v{version}:{digest}'
+
+
+def facet_counts(filters, request=None):
+    """
+    {фасет: [(значение, подпись, число книг)]}. Кэшируемые фасеты читаются
+    одним обращением к кэшу; версия каталога берётся из запроса, если её уже
+    прочитал catalog_condition.
+    """
+    if request is not None:
+        version = versioning.request_versions(request, [versioning.GLOBAL])[versioning.GLOBAL][0]
+    else:
+        version = versioning.get_versions([versioning.GLOBAL])[versioning.GLOBAL][0]
+    cacheable = {
+        facet: _key(facet, filters, version) for facet in FACETS
+        if sum(1 for name in filters if name != facet) <= CACHE_MAX_FILTERS
+    }
+    cached = cache.get_many(cacheable.values())
+    result, missing = {}, {}
+    for facet in FACETS:
+        key = cacheable.get(facet)
+        if key in cached:
+            result[facet] = cached[key]
+            continue
+        result[facet] = compute(facet, filters)
+        if key is not None:
+            missing[key] = result[facet]
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+    return result
+
+
+def with_links(counts, filters):
+    """
+    Фасеты для шаблона: у каждого значения — выбран ли он и строка запроса,
+    которая его включает или выключает (курсор сбрасывается на первую страницу).
+    """
+    facets = []
+    for facet, items in counts.items():
+        selected = set(filters.get(facet, ()))
+        entries = []
+        for value, label, count in items:
+            chosen = set(selected)
+            chosen.symmetric_difference_update({str(value)})
+            toggled = {**filters, facet: tuple(sorted(chosen))}
+            query = urlencode({name: ','.join(values) for name, values in toggled.items() if values})
+            entries.append({
+                'value': value, 'label': label, 'count': count,
+                'selected': str(value) in selected, 'query': query,
+            })
+        facets.append({'name': facet, 'title': TITLES[facet], 'entries': entries})
+    return facets
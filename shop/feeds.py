@@ -0,0 +1,92 @@
+"""
+Потоковая выгрузка каталога (JSON Lines) для внешних потребителей фида.
+
+Строки читаются через values() пачками, без создания моделей и
+ModelSerializer на каждую книгу; encode_book_row() выдаёт тот же набор
+полей и форматы, что и BookSerializer.
+"""
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Book
+from .pricing import active_promos, discounted, ensure_prices_current
+
+CHUNK_SIZE = 2000
+
+BOOK_FEED_COLUMNS = (
+    'id', 'title', 'author__full_name', 'category__name',
+    'price', 'discount', 'status',
+    'price_index__effective_price', 'price_index__valid_from', 'price_index__valid_until',
+)
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    # Как serializers.DecimalField(decimal_places=2) при COERCE_DECIMAL_TO_STRING
+    return f'{value.quantize(CENT):f}'
+
+
+def _fresh_effective_price(row, today):
+    valid_from, valid_until = row['price_index__valid_from'], row['price_index__valid_until']
+    if valid_from is not None and valid_from <= today <= valid_until:
+        return row['price_index__effective_price']
+    return None
+
+
+def encode_book_row(row, discounted_price):
+    """Словарь из values() в контракте BookSerializer."""
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'author_name': row['author__full_name'],
+        'category_name': row['category__name'],
+        'price': _money(row['price']),
+        'discount': _money(row['discount']),
+        # SerializerMethodField отдаёт Decimal, который JSON-кодировщик DRF пишет как float
+        'discounted_price': float(discounted_price),
+        'status': row['status'],
+    }
+
+
+def encode_chunk(rows, today):
+    """Кодирует пачку строк; акции для книг без актуальной BookPrice — одним запросом."""
+    prices = {row['id']: _fresh_effective_price(row, today) for row in rows}
+    stale = [book_id for book_id, price in prices.items() if price is None]
+    promos = active_promos(stale, today) if stale else {}
+    for row in rows:
+        price = prices[row['id']]
+        if price is None:
+            promo = promos.get(row['id'])
+            price = discounted(row['price'], promo.discount_percent) if promo else row['price']
+        yield encode_book_row(row, price)
+
+
+def iter_book_rows(queryset=None, chunk_size=CHUNK_SIZE):
+    ensure_prices_current()
+    today = timezone.localdate()
+    if queryset is None:
+        queryset = Book.objects.all()
+    rows = queryset.order_by('pk').values(*BOOK_FEED_COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from encode_chunk(chunk, today)
+
+
+def iter_json_lines(queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Генератор байтов JSON Lines: одна книга — одна строка,
+    в ответ пишется по пачке строк за раз.
+    """
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    rows = iter_book_rows(queryset, chunk_size)
+    while True:
+        lines = [dumps(row) for row in islice(rows, chunk_size)]
+        if not lines:
+            return
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
@@ -1,13 +1,86 @@
 import django_filters
+from django.db.models import Q
+
 from .models import Book
 
+# Ценовые корзины фасета: ключ -> (подпись, от включительно, до не включая)
+PRICE_BUCKETS = {
+    'lt300': ("до 300 ₽", None, 300),
+    '300-600': ("300–600 ₽", 300, 600),
+    '600-1000': ("600–1000 ₽", 600, 1000),
+    'gte1000': ("от 1000 ₽", 1000, None),
+}
+
+
+def price_bucket_q(key):
+    _, low, high = PRICE_BUCKETS[key]
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+# Наибольшее целое SQLite: id и год вне диапазона отбрасываются, а не роняют запрос OverflowError
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def parse_id(value):
+    """Целое из диапазона SQLite или None."""
+    value = value.strip()
+    if not value.isdigit():
+        return None
+    number = int(value)
+    return number if number <= MAX_INTEGER else None
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """?genre=1,3 — несколько значений через запятую."""
+
+
+class IdInFilter(NumberInFilter):
+    """Список неотрицательных целых в пределах SQLite INTEGER."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('min_value', 0)
+        kwargs.setdefault('max_value', MAX_INTEGER)
+        kwargs.setdefault('decimal_places', 0)
+        super().__init__(*args, **kwargs)
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
 class BookFilter(django_filters.FilterSet):
+    """
+    Фильтры каталога. Справочники фильтруются по id (?author=3,7): условие
+    ложится на индекс внешнего ключа, без JOIN и LIKE по имени. Внутри одного
+    фильтра значения объединяются через ИЛИ, разные фильтры — через И.
+    Выбор значений — через списки id, а не ChoiceFilter: на этой версии
+    django-filter поля выбора несовместимы с Django 5.
+    """
     min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
-    author = django_filters.CharFilter(field_name='author__full_name', lookup_expr='icontains')
-    genre = django_filters.CharFilter(field_name='genre__name', lookup_expr='icontains')
-    status = django_filters.ChoiceFilter(field_name='status', choices=Book.STATUS_CHOICES)
+    author = IdInFilter(field_name='author_id')
+    genre = IdInFilter(field_name='genre_id')
+    category = IdInFilter(field_name='category_id')
+    status = CharInFilter(method='filter_status')
+    year = IdInFilter(field_name='year')
+    price = CharInFilter(method='filter_price')
 
     class Meta:
         model = Book
-        fields = ['min_price', 'max_price', 'author', 'genre', 'status']
+        fields = ['min_price', 'max_price', 'author', 'genre', 'category', 'status', 'year', 'price']
+
+    def filter_status(self, queryset, name, value):
+        statuses = dict(Book.STATUS_CHOICES)
+        return queryset.filter(status__in=[status for status in value if status in statuses])
+
+    def filter_price(self, queryset, name, value):
+        condition = Q(pk__in=[])
+        for key in value:
+            if key in PRICE_BUCKETS:
+                condition |= price_bucket_q(key)
+        return queryset.filter(condition)
@@ -0,0 +1,91 @@
+"""
+Блоки главной страницы (популярное, новинки, акции) с кэшированием.
+
+Каждый блок хранится в кэше отдельно и сбрасывается сигналами
+при изменении заказов, книг и акций (см. shop.signals). Дата входит
+в ключ, чтобы акции сменялись в полночь без ручного сброса.
+"""
+import secrets
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Book, PromoBook
+from .pricing import prime_prices, with_prices
+
+BLOCKS = ('popular_books', 'new_books', 'promo_books')
+BLOCK_SIZE = 5
+CACHE_TIMEOUT = 60 * 15
+
+
+def _key(block):
+    return f'shop:home:{block}:{timezone.localdate():%Y%m%d}'
+
+
+def popular_books():
+    # Индекс BookStats (-sold_count, book) отдаёт top-N готовым порядком, без агрегации и сортировки;
+    # второй ключ — stats__book_id, а не pk, чтобы весь ORDER BY шёл по одному индексу
+    books = with_prices(Book.objects.select_related('author'))
+    popular = list(
+        books.filter(stats__sold_count__gt=0).order_by('-stats__sold_count', 'stats__book_id')[:BLOCK_SIZE]
+    )
+    if len(popular) < BLOCK_SIZE:
+        # Продаж меньше, чем мест в блоке (новый каталог): добираем непроданными книгами
+        popular += books.exclude(pk__in=[book.pk for book in popular]).order_by('pk')[:BLOCK_SIZE - len(popular)]
+    return prime_prices(popular)
+
+
+def new_books():
+    return prime_prices(with_prices(Book.objects.select_related('author')).order_by('-id')[:BLOCK_SIZE])
+
+
+def promo_books():
+    today = timezone.localdate()
+    links = list(
+        PromoBook.objects
+        .filter(promotion__start_date__lte=today, promotion__end_date__gte=today)
+        .select_related('promotion', 'book__author', 'book__price_index__promotion')
+        .order_by('-promotion__discount_percent', 'pk')[:BLOCK_SIZE]
+    )
+    prime_prices(link.book for link in links)
+    return links
+
+
+BUILDERS = {
+    'popular_books': popular_books,
+    'new_books': new_books,
+    'promo_books': promo_books,
+}
+
+
+def get_blocks():
+    """Все блоки главной: из кэша, недостающие — из БД с записью в кэш."""
+    keys = {block: _key(block) for block in BLOCKS}
+    cached = cache.get_many(keys.values())
+    blocks, missing = {}, {}
+    for block, key in keys.items():
+        if key in cached:
+            blocks[block] = cached[key]
+        else:
+            blocks[block] = missing[key] = BUILDERS[block]()
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+    return blocks
+
+
+GENERATION_KEY = 'shop:home:generation'
+
+
+def generation():
+    """Метка состава главной: меняется при каждом сбросе блоков (ключ кэша страницы целиком)."""
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, secrets.token_hex(4), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def invalidate(*blocks):
+    """Сбрасывает указанные блоки (по умолчанию — все)."""
+    cache.delete_many([_key(block) for block in blocks or BLOCKS])
+    cache.set(GENERATION_KEY, secrets.token_hex(4), None)
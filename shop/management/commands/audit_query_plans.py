@@ -0,0 +1,169 @@
+import logging
+import re
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+
+from shop import api_urls, stock, urls
+from shop.models import Author, Book, Cart, Category, Favorite, Order, OrderItem, User
+
+# Маршруты с параметрами, которые не подставить числом из каталога
+SKIP = {'rendition'}
+
+# Справочники целиком загружаются в кэш (shop.caching) — полный проход по ним ожидаем
+ALLOWED_SCANS = {'shop_author', 'shop_genre', 'shop_series', 'shop_category'}
+
+# Известные и принятые замечания: (маршрут, замечание) -> почему это не нужно исправлять
+ALLOWED = {
+    ('index', 'временное B-дерево для order by'):
+        "акции главной сортируются по скидке после отбора действующих — строк единицы",
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+
+
+def _problems(detail, sql):
+    """Замечания к строке EXPLAIN QUERY PLAN: полный проход по таблице и сортировка во временном B-дереве."""
+    found = []
+    match = _SCAN.match(detail)
+    # Проход без условия — это выгрузка целиком или первые N строк по rowid, а не пропущенный индекс
+    if match and match.group(1) not in ALLOWED_SCANS and _WHERE.search(sql):
+        found.append(f"полный проход по {match.group(1)}")
+    if 'USE TEMP B-TREE' in detail:
+        found.append(detail.lower().replace('use temp b-tree for', 'временное B-дерево для'))
+    return found
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Открывает каждый маршрут shop/urls.py и shop/api_urls.py на сгенерированных данных в тестовой БД, "
+        "прогоняет его SQL через EXPLAIN QUERY PLAN и сообщает о полных проходах по таблицам "
+        "и сортировках во временном B-дереве"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=500, help="Книг в тестовом каталоге")
+        parser.add_argument('--urls', nargs='+', help="Только эти маршруты (имена)")
+        parser.add_argument('--report-only', action='store_true', help="Не завершаться с ошибкой при замечаниях")
+        parser.add_argument('--verbose-sql', action='store_true', help="Печатать SQL запросов с замечаниями")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN есть только у SQLite")
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # 404/405/500 видны в отчёте по коду ответа; журналы запросов и SQL-семплы только мешают
+        logging.disable(logging.CRITICAL)
+        try:
+            with override_settings(SHOP_SQL_SAMPLE_RATE=0.0):
+                findings = self._run(options)
+        finally:
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if not findings:
+            self.stdout.write(self.style.SUCCESS("Полных проходов и временных сортировок нет"))
+        elif options['report_only']:
+            self.stdout.write(self.style.WARNING(f"Маршрутов с замечаниями: {len(findings)}"))
+        else:
+            raise CommandError(f"Маршрутов с замечаниями: {len(findings)}: {', '.join(findings)}")
+
+    def _fixtures(self, options):
+        call_command(
+            'generate_catalog', stdout=StringIO(), flush=True, seed=options['seed'],
+            books=options['books'], authors=max(10, options['books'] // 10), users=10,
+            order_items=options['books'], reviews=options['books'], favorites=options['books'] // 5,
+            promotions=max(5, options['books'] // 50),
+        )
+        # Сотрудник видит все страницы; корзина, избранное, заказ и резерв — чтобы страницы были не пустыми
+        user = User.objects.create_user('audit', is_staff=True, is_superuser=True)
+        book = Book.objects.order_by('pk').first()
+        # Корзины у всех покупателей: по таблице из одной строки планировщик честно выберет полный проход
+        book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        Cart.objects.bulk_create([
+            Cart(user=customer, book_id=book_id, quantity=1)
+            for customer in User.objects.all() for book_id in book_ids
+        ])
+        Favorite.objects.create(user=user, book=book)
+        order = Order.objects.create(user=user, delivery_address="Москва", payment_method="card")
+        OrderItem.objects.create(order=order, book=book, quantity=1, price=book.price)
+        stock.set_stock(book.pk, 10)
+        reservation = stock.reserve(user, book.pk)
+        # Без статистики (ANALYZE) планировщик SQLite гадает о селективности и выбирает другие планы
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        samples = {
+            'pk': book.pk,
+            'book_id': book.pk,
+            'category_id': Category.objects.order_by('pk').values_list('pk', flat=True).first(),
+        }
+        overrides = {
+            'edit_author': {'pk': Author.objects.order_by('pk').values_list('pk', flat=True).first()},
+            'delete_author': {'pk': Author.objects.order_by('pk').values_list('pk', flat=True).first()},
+            'api_reservation': {'pk': reservation.pk},
+        }
+        return user, samples, overrides
+
+    def _routes(self, names, samples, overrides):
+        for patterns in (urls.urlpatterns, api_urls.urlpatterns):
+            for pattern in patterns:
+                if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIP:
+                    continue
+                if names and pattern.name not in names:
+                    continue
+                kwargs = overrides.get(pattern.name) or {
+                    name: samples[name] for name in pattern.pattern.converters
+                }
+                yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+    def _run(self, options):
+        user, samples, overrides = self._fixtures(options)
+        # Сломанная страница (500) не прерывает аудит: её запросы до ошибки тоже проверяются
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+
+        findings = []
+        for name, url in self._routes(options['urls'], samples, overrides):
+            # Маршруты с побочными эффектами на GET (корзина, избранное) не меняют данные для следующих
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                plans = {}
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')) and sql not in plans:
+                        plans[sql] = explain(sql)
+                transaction.set_rollback(True)
+
+            problems = []
+            for sql, plan in plans.items():
+                for detail in plan:
+                    for problem in _problems(detail, sql):
+                        if (name, problem) not in ALLOWED:
+                            problems.append((problem, sql))
+            self.stdout.write(
+                f"{name:<22} {response.status_code:>3} запросов: {len(captured.captured_queries):>3} {url}"
+            )
+            for problem, sql in dict.fromkeys(problems):
+                self.stdout.write(self.style.WARNING(f"    {problem}"))
+                if options['verbose_sql']:
+                    self.stdout.write(f"        {sql}")
+            if problems:
+                findings.append(name)
+        return findings
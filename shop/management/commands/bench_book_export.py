@@ -0,0 +1,65 @@
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from shop.feeds import BOOK_FEED_COLUMNS, encode_chunk
+from shop.models import Author, Book, BookPrice, Category
+from shop.serializers import BookSerializer
+
+
+def _dataset(count):
+    """Синтетические книги в памяти: модели для BookSerializer и строки values() для фида."""
+    today = timezone.localdate()
+    until = today + datetime.timedelta(days=30)
+    authors = [Author(pk=i, full_name=f"Автор {i}") for i in range(1, 101)]
+    categories = [Category(pk=i, name=f"Категория {i}") for i in range(1, 11)]
+    books, rows = [], []
+    for pk in range(1, count + 1):
+        price = Decimal(100 + pk % 900).quantize(Decimal('0.01'))
+        effective = (price * Decimal('0.9')).quantize(Decimal('0.01'))
+        author, category = authors[pk % len(authors)], categories[pk % len(categories)]
+        book = Book(pk=pk, title=f"Книга {pk}", author=author, category=category,
+                    price=price, discount=Decimal('0.00'), status='available')
+        book.price_index = BookPrice(book_id=pk, effective_price=effective, discount_percent=Decimal('10'),
+                                     valid_from=today, valid_until=until)
+        books.append(book)
+        rows.append(dict(zip(BOOK_FEED_COLUMNS, (
+            pk, book.title, author.full_name, category.name, price, book.discount, book.status,
+            effective, today, until,
+        ))))
+    return books, rows
+
+
+class Command(BaseCommand):
+    help = "Сравнивает BookSerializer и потоковый кодировщик фида на синтетических данных (без БД)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        self.stdout.write(f"{'строк':>10} {'serializer, с':>15} {'фид, с':>10} {'ускорение':>10}")
+        for count in options['rows']:
+            books, rows = _dataset(count)
+
+            started = time.perf_counter()
+            JSONRenderer().render(BookSerializer(books, many=True).data)
+            serializer_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            size = options['chunk_size']
+            for offset in range(0, count, size):
+                chunk = rows[offset:offset + size]
+                '\n'.join(dumps(row) for row in encode_chunk(chunk, today))
+            feed_time = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{count:>10} {serializer_time:>15.3f} {feed_time:>10.3f} {serializer_time / feed_time:>9.1f}x"
+            )
@@ -0,0 +1,156 @@
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shop import cart, database
+from shop.models import Book, Review, User
+from shop.pricing import with_prices
+
+from .bench_views import _percentile
+
+# Профиль -> (PRAGMA, постоянные соединения, чтения через реплику)
+PROFILES = {
+    # Как было: журнал отката, fsync на каждый коммит, соединение на запрос
+    'baseline': ({'journal_mode': 'delete', 'synchronous': 'full'}, False, False),
+    'tuned': (database.DEFAULT_PRAGMAS, True, False),
+    'replica': (database.DEFAULT_PRAGMAS, True, True),
+}
+
+
+def _read(book_ids):
+    # Страница каталога и отзывы книги
+    list(with_prices(Book.objects.select_related('author')).order_by('-id')[:24])
+    list(Review.objects.filter(book_id=random.choice(book_ids))[:10])
+
+
+def _write(user, book_ids):
+    book_id = random.choice(book_ids)
+    if random.random() < 0.5:
+        cart.add_item(user, book_id)
+    else:
+        Review.objects.create(book_id=book_id, user=user, text="Нагрузочный отзыв", rating=random.randint(1, 5))
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест SQLite: потоки одновременно читают каталог и пишут в корзины и отзывы. "
+        "Сравнивает профили соединения (baseline — как раньше, tuned — WAL и PRAGMA, "
+        "replica — плюс чтения через соединение только для чтения) в отдельной тестовой БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help="Параллельных потоков")
+        parser.add_argument('--ops', type=int, default=2000, help="Операций в раунде")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Доля записей")
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Тест рассчитан на SQLite")
+        setup_test_environment()
+        tmp = tempfile.TemporaryDirectory()
+        # Потокам нужна общая БД в файле: у in-memory базы своя копия на соединение
+        connection.settings_dict['TEST']['NAME'] = str(Path(tmp.name) / 'bench_sqlite.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            tmp.cleanup()
+
+    def _run(self, options):
+        call_command(
+            'generate_catalog', stdout=StringIO(), flush=True, seed=options['seed'],
+            books=options['books'], authors=max(10, options['books'] // 10), users=10,
+            order_items=options['books'], reviews=options['books'], favorites=0,
+            promotions=max(5, options['books'] // 200),
+        )
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        users = User.objects.bulk_create([User(username=f'bench-sqlite-{i}') for i in range(64)])
+
+        self.stdout.write(
+            f"{'профиль':>9} {'потоков':>8} {'оп/с':>8} {'p50, мс':>8} {'p95, мс':>8} "
+            f"{'запись p95':>11} {'ошибок':>7}"
+        )
+        for name in options['profiles']:
+            pragmas, persistent, replica = PROFILES[name]
+            for workers in options['workers']:
+                with self._profile(pragmas, replica):
+                    result = self._round(options, workers, users, book_ids, persistent)
+                self.stdout.write(
+                    f"{name:>9} {workers:>8} {result['ops_per_s']:>8.0f} {result['p50_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['write_p95_ms']:>11.2f} {result['errors']:>7}"
+                )
+
+    def _profile(self, pragmas, replica):
+        connections.close_all()
+        overrides = {'SHOP_SQLITE_PRAGMAS': pragmas, 'SHOP_DB_REPLICA': 'readonly' if replica else ''}
+        if replica:
+            connections.settings[database.REPLICA] = {
+                **connection.settings_dict,
+                'NAME': f"file:{connection.settings_dict['NAME']}?mode=ro",
+                'OPTIONS': {},
+            }
+        elif database.REPLICA in connections.settings:
+            del connections.settings[database.REPLICA]
+        # Режим журнала хранится в файле: переключаем его до старта потоков
+        with override_settings(**overrides):
+            database.configure_connection(connection)
+        connection.close()
+        return override_settings(**overrides)
+
+    def _round(self, options, workers, users, book_ids, persistent):
+        cache.clear()
+        rng = random.Random(options['seed'])
+        plan = [rng.random() < options['write_ratio'] for _ in range(options['ops'])]
+        reads, writes, errors = [], [], []
+        lock = threading.Lock()
+
+        def op(args):
+            index, is_write = args
+            started = time.perf_counter()
+            try:
+                if is_write:
+                    _write(users[index % len(users)], book_ids)
+                else:
+                    _read(book_ids)
+            except DatabaseError:  # "database is locked" после busy timeout
+                with lock:
+                    errors.append(index)
+                return
+            finally:
+                # Без постоянных соединений каждый «запрос» открывает своё (и заново применяет PRAGMA);
+                # постоянные закрываются, когда завершается поток пула
+                if not persistent:
+                    connections.close_all()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                (writes if is_write else reads).append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(op, enumerate(plan)))
+        elapsed = time.perf_counter() - started
+        samples = sorted(reads + writes) or [0.0]
+        return {
+            'ops_per_s': len(plan) / elapsed,
+            'p50_ms': _percentile(samples, 50),
+            'p95_ms': _percentile(samples, 95),
+            'write_p95_ms': _percentile(writes, 95) if writes else 0.0,
+            'errors': len(errors),
+        }
@@ -0,0 +1,107 @@
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shop import stock
+from shop.models import Author, Book, BookStock, Category, Genre, StockReservation, User
+
+MODES = ('buy', 'reserve', 'naive')
+
+
+def _naive_buy(user, book_id):
+    # Прочитать-проверить-записать: так делать нельзя, режим для сравнения
+    row = BookStock.objects.get(book_id=book_id)
+    if row.quantity < 1:
+        raise stock.OutOfStock()
+    row.quantity -= 1
+    row.save(update_fields=['quantity'])
+
+
+def _attempt(mode, user, book_id):
+    try:
+        if mode == 'buy':
+            with transaction.atomic():
+                stock.consume(user, {book_id: 1})
+        elif mode == 'reserve':
+            stock.reserve(user, book_id)
+        else:
+            _naive_buy(user, book_id)
+        return 'ok'
+    except stock.OutOfStock:
+        return 'out'
+    except DatabaseError:  # на SQLite — "database is locked" после busy timeout
+        return 'error'
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест остатков: много покупателей одновременно берут одну горячую книгу. "
+        "Показывает пропускную способность, отказы и перепродажу в отдельной тестовой БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help="Параллельных потоков")
+        parser.add_argument('--stock', type=int, default=200, help="Начальный остаток горячей книги")
+        parser.add_argument('--buyers', type=int, default=500, help="Попыток покупки в раунде")
+        parser.add_argument('--mode', choices=MODES, nargs='+', default=['buy', 'reserve'])
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        tmp = None
+        if connection.vendor == 'sqlite':
+            # Потокам нужна общая БД в файле: у in-memory базы своя копия на соединение
+            tmp = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmp.name) / 'bench_stock.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            failures = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if tmp is not None:
+                tmp.cleanup()
+        if failures:
+            raise CommandError("Перепродажа или потеря остатка:\n" + '\n'.join(failures))
+
+    def _run(self, options):
+        author = Author.objects.create(full_name="Автор")
+        book = Book.objects.create(
+            title="Горячая книга", author=author, genre=Genre.objects.create(name="Жанр"),
+            category=Category.objects.create(name="Категория"), year=2024, isbn='bench-stock', price=100,
+        )
+        users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(options['buyers'])])
+
+        self.stdout.write(
+            f"{'режим':>8} {'потоков':>8} {'продано':>8} {'отказов':>8} {'ошибок':>7} "
+            f"{'остаток':>8} {'оп/с':>8}"
+        )
+        failures = []
+        for mode in options['mode']:
+            for workers in options['workers']:
+                StockReservation.objects.all().delete()
+                stock.set_stock(book.pk, options['stock'])
+
+                def buy(user):
+                    try:
+                        return _attempt(mode, user, book.pk)
+                    finally:
+                        connection.close()
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    outcomes = list(pool.map(buy, users))
+                elapsed = time.perf_counter() - started
+
+                sold, out, errors = (outcomes.count(kind) for kind in ('ok', 'out', 'error'))
+                left = BookStock.objects.get(book=book).quantity
+                self.stdout.write(
+                    f"{mode:>8} {workers:>8} {sold:>8} {out:>8} {errors:>7} {left:>8} {len(users) / elapsed:>8.0f}"
+                )
+                if mode != 'naive' and (sold > options['stock'] or sold + left != options['stock']):
+                    failures.append(f"{mode}, {workers} потоков: продано {sold}, остаток {left}")
+        return failures
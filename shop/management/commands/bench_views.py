@@ -0,0 +1,169 @@
+import json
+import statistics
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from shop.models import Book, BookStats, Cart, User
+
+BUDGETS_FILE = Path(__file__).resolve().parents[2] / 'benchmarks.json'
+
+# Горячие пути каталога: имя -> функция (контекст) -> URL
+VIEWS = {
+    'index': lambda ctx: reverse('index'),
+    'book_list': lambda ctx: reverse('book_list'),
+    'book_detail': lambda ctx: reverse('book_detail', args=[ctx['hot_book']]),
+    'cart_detail': lambda ctx: reverse('cart_detail'),
+    'search_books': lambda ctx: reverse('search_books') + f"?q={ctx['query']}",
+    'author_list': lambda ctx: reverse('author_list'),
+    'api_books': lambda ctx: reverse('api_books'),
+    'api_authors': lambda ctx: reverse('api_authors'),
+    'api_reviews': lambda ctx: reverse('api_reviews', args=[ctx['hot_book']]),
+}
+
+
+def _percentile(samples, percent):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[percent - 1]
+
+
+def _rows_fetched(queries):
+    # Сколько строк вернули SELECT-запросы: повторяем их под COUNT(*) вне замера
+    rows = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(f"SELECT COUNT(*) FROM ({sql}) AS bench_rows")
+            rows += cursor.fetchone()[0]
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет горячие представления каталога на сгенерированных данных в тестовой БД: "
+        "перцентили времени, число запросов и строк; сравнение с бюджетами и базой из shop/benchmarks.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1_000, 10_000], help="Число книг")
+        parser.add_argument('--views', nargs='+', choices=sorted(VIEWS), help="Только эти представления")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE), help="JSON с бюджетами и базой")
+        parser.add_argument('--update-baseline', action='store_true', help="Записать результаты как новую базу")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        path = Path(options['budgets'])
+        config = json.loads(path.read_text(encoding='utf-8')) if path.exists() else {}
+        names = options['views'] or list(VIEWS)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Инструментирование SQL (shop.middleware) искажало бы замеры и печатало строку на запрос
+        try:
+            with override_settings(SHOP_SQL_SAMPLE_RATE=0.0):
+                results = {str(scale): self._run_scale(scale, names, options) for scale in options['scales']}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['update_baseline']:
+            baseline = config.setdefault('baseline', {})
+            for scale, views in results.items():
+                baseline.setdefault(scale, {}).update(views)
+            path.write_text(json.dumps(config, ensure_ascii=False, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"База записана в {path}"))
+            return
+
+        violations = self._check(results, config)
+        if violations:
+            raise CommandError("Превышены бюджеты:\n" + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS("Все представления в пределах бюджетов"))
+
+    def _run_scale(self, scale, names, options):
+        call_command(
+            'generate_catalog', stdout=StringIO(), flush=True, seed=options['seed'],
+            books=scale, authors=max(10, scale // 10), users=max(10, scale // 10),
+            order_items=scale * 5, reviews=scale * 2, favorites=scale, promotions=max(5, scale // 200),
+        )
+        # Пользователи переживают --flush, корзины — нет
+        user, _ = User.objects.get_or_create(username='bench')
+        hot_books = list(BookStats.objects.order_by('-sold_count').values_list('book_id', flat=True)[:5])
+        Cart.objects.bulk_create([Cart(user=user, book_id=book_id, quantity=1) for book_id in hot_books])
+        title = Book.objects.filter(pk=hot_books[0]).values_list('title', flat=True).get()
+        ctx = {'hot_book': hot_books[0], 'query': title.split()[0]}
+
+        client = Client()
+        client.force_login(user)
+        self.stdout.write(f"\nКниг: {scale}")
+        self.stdout.write(f"{'представление':>14} {'p50, мс':>9} {'p95, мс':>9} {'max, мс':>9} {'запросов':>9} {'строк':>8}")
+        results = {}
+        for name in names:
+            url = VIEWS[name](ctx)
+            cache.clear()
+            for _ in range(options['warmup']):
+                client.get(url)
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code != 200:
+                raise CommandError(f"{name}: {url} ответил {response.status_code}")
+            queries = len(captured.captured_queries)
+            rows = _rows_fetched(captured.captured_queries)
+
+            samples = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                client.get(url)
+                samples.append((time.perf_counter() - started) * 1000)
+            result = {
+                'p50_ms': round(_percentile(samples, 50), 2),
+                'p95_ms': round(_percentile(samples, 95), 2),
+                'max_ms': round(max(samples), 2),
+                'queries': queries,
+                'rows': rows,
+            }
+            results[name] = result
+            self.stdout.write(
+                f"{name:>14} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['max_ms']:>9.2f} "
+                f"{queries:>9} {rows:>8}"
+            )
+        return results
+
+    def _check(self, results, config):
+        """Запросы и строки — не больше бюджета и базы; p95 — не больше бюджета и базы с допуском."""
+        budgets = config.get('budgets', {})
+        baseline = config.get('baseline', {})
+        tolerance = config.get('latency_tolerance', 1.5)
+        # Быстрые представления шумят на единицы миллисекунд
+        slack = config.get('latency_slack_ms', 5)
+        violations = []
+        for scale, views in results.items():
+            for name, result in views.items():
+                budget = budgets.get(name, {})
+                base = baseline.get(scale, {}).get(name, {})
+                for metric in ('queries', 'rows'):
+                    if metric in budget and result[metric] > budget[metric]:
+                        violations.append(f"{scale} книг, {name}: {metric} {result[metric]} > бюджета {budget[metric]}")
+                    if metric in base and result[metric] > base[metric]:
+                        violations.append(f"{scale} книг, {name}: {metric} {result[metric]} > базы {base[metric]}")
+                if 'p95_ms' in budget and result['p95_ms'] > budget['p95_ms']:
+                    violations.append(f"{scale} книг, {name}: p95 {result['p95_ms']} мс > бюджета {budget['p95_ms']} мс")
+                if 'p95_ms' in base and result['p95_ms'] > base['p95_ms'] * tolerance + slack:
+                    violations.append(
+                        f"{scale} книг, {name}: p95 {result['p95_ms']} мс > базы {base['p95_ms']} мс x{tolerance} + {slack}"
+                    )
+        return violations
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import exports
+from shop.models import Book, ExportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает книги в PDF (весь каталог или --ids) в MEDIA_ROOT/exports/. "
+        "С --queue выполняет задачи, поставленные из админки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='+', help="Только эти книги")
+        parser.add_argument('--workers', type=int, default=1,
+                            help=f"Процессов для больших выгрузок (не больше {exports.MAX_WORKERS})")
+        parser.add_argument('--queue', action='store_true', help="Выполнить задачи из очереди и выйти")
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help="С --queue: не выходить, проверять очередь раз в SECONDS секунд")
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            self._process_queue(options['loop'])
+            return
+        queryset = Book.objects.filter(pk__in=options['ids']).order_by('pk') if options['ids'] else None
+        job = ExportJob.objects.create(
+            book_ids=None if queryset is None else list(queryset.values_list('pk', flat=True)),
+            workers=max(1, min(options['workers'], exports.MAX_WORKERS)),
+        )
+        exports.run_export(job.pk)
+        self._report(job)
+
+    def _process_queue(self, interval):
+        while True:
+            stale = exports.fail_stale()
+            if stale:
+                self.stderr.write(self.style.WARNING(f"Брошенных задач помечено ошибкой: {stale}"))
+            while (job_id := exports.claim_next()) is not None:
+                exports.run_export(job_id)
+                self._report(ExportJob.objects.get(pk=job_id))
+            if interval is None:
+                return
+            time.sleep(interval)
+
+    def _report(self, job):
+        job.refresh_from_db()
+        if job.status == 'done':
+            self.stdout.write(self.style.SUCCESS(f"Выгрузка #{job.pk}: {job.processed} книг -> {job.file.path}"))
+        else:
+            self.stderr.write(self.style.ERROR(f"Выгрузка #{job.pk} не удалась: {job.error}"))
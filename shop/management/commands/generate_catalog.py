@@ -0,0 +1,325 @@
+import datetime
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import connection, connections
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.utils import timezone
+from faker import Faker
+
+from shop import homepage, pricing, search, stats, versioning
+from shop.models import (
+    Author, AuthorStats, Book, BookPrice, BookStats, BookStock, Cart, Category, ExportJob, Favorite, Genre,
+    Order, OrderItem, PriceChange, PromoBook, Promotion, Repricing, Review, Series, StockReservation, User,
+)
+
+# Порядок генерации: каждая фаза ссылается только на уже созданные
+PHASES = (
+    ('categories', Category), ('genres', Genre), ('series', Series), ('authors', Author),
+    ('users', User), ('books', Book), ('promotions', Promotion), ('promo_books', PromoBook),
+    ('orders', Order), ('order_items', OrderItem), ('reviews', Review), ('favorites', Favorite),
+)
+
+# Очищаются при --flush (сначала зависимые); пользователи не удаляются, а версии каталога
+# (CatalogVersion) только растут — иначе кэши страниц и справочников под прежними версиями ожили бы
+FLUSH_MODELS = (
+    PriceChange, Repricing, ExportJob, StockReservation, BookStock, PromoBook, BookPrice, BookStats,
+    AuthorStats, Favorite, Cart, Review, OrderItem, Order, Book, Promotion, Series, Author, Genre, Category,
+)
+
+ORDER_STATUSES = (('completed', 70), ('shipped', 10), ('processing', 8), ('new', 7), ('cancelled', 5))
+PAYMENT_METHODS = ('card', 'cash', 'sbp')
+PROMOTION_TYPES = ('sale', 'season', 'bundle', 'clearance')
+REVIEW_TEXTS = ("Отличная книга", "Рекомендую", "Неплохо", "На один раз", "Не понравилось")
+
+
+class Plan:
+    """Параметры запуска: объёмы, первые id и seed; передаётся в дочерние процессы."""
+
+    def __init__(self, counts, first_ids, seed, skew, batch_size, today):
+        self.counts = counts
+        self.first_ids = first_ids
+        self.seed = seed
+        self.skew = skew
+        self.batch_size = batch_size
+        self.today = today
+
+    def ids(self, phase, offset):
+        return self.first_ids[phase] + offset
+
+
+class Zipf:
+    """
+    Выбор id с распределением Ципфа: ранг r выбирается с весом 1 / r**skew,
+    а ранги перемешаны по id умножением на взаимно простое число, чтобы
+    популярные книги и авторы не были просто первыми по id.
+    """
+
+    def __init__(self, first_id, count, skew):
+        self.first_id = first_id
+        self.count = count
+        self.population = range(count)
+        self.cum_weights = list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+        step = 7_919 * 104_729
+        while math.gcd(step, count) != 1:
+            step += 1
+        self.step = step
+
+    def sample(self, rng, k=1):
+        ranks = rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+        return [self.first_id + rank * self.step % self.count for rank in ranks]
+
+    def one(self, rng):
+        return self.sample(rng)[0]
+
+
+class Generator:
+    """Строит модели для пачки [lo, hi) одной фазы; одна пачка — один bulk_create."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.counts = plan.counts
+        self._zipf = {}
+        words = Faker('ru_RU')
+        words.seed_instance(plan.seed)
+        self.words = sorted({word for word in words.words(3000)})
+
+    def zipf(self, phase):
+        if phase not in self._zipf:
+            self._zipf[phase] = Zipf(self.plan.first_ids[phase], self.counts[phase], self.plan.skew)
+        return self._zipf[phase]
+
+    def uniform(self, rng, phase):
+        return self.plan.first_ids[phase] + rng.randrange(self.counts[phase])
+
+    def phrase(self, rng, words):
+        return ' '.join(rng.choice(self.words) for _ in range(words)).capitalize()
+
+    def price(self, book_id):
+        # Цена — чистая функция id: позиции заказа знают её без чтения книг
+        cents = 10_000 + (book_id * 2_654_435_761 + self.plan.seed) % 290_000
+        return Decimal(cents // 10 * 10).scaleb(-2)
+
+    def build(self, phase, lo, hi, rng, fake):
+        return [getattr(self, phase)(self.plan.ids(phase, i), rng, fake) for i in range(lo, hi)]
+
+    def categories(self, pk, rng, fake):
+        return Category(pk=pk, name=f"{self.phrase(rng, 1)} {pk}")
+
+    def genres(self, pk, rng, fake):
+        return Genre(pk=pk, name=f"{self.phrase(rng, 1)} {pk}", description=self.phrase(rng, 8))
+
+    def series(self, pk, rng, fake):
+        return Series(pk=pk, name=self.phrase(rng, 2))
+
+    def authors(self, pk, rng, fake):
+        return Author(pk=pk, full_name=fake.name(), bio=self.phrase(rng, rng.randint(5, 30)))
+
+    def users(self, pk, rng, fake):
+        return User(pk=pk, username=f"user{pk}", email=f"user{pk}@example.com", password='!')
+
+    def books(self, pk, rng, fake):
+        created = self.plan.today - datetime.timedelta(days=rng.randrange(3 * 365))
+        return Book(
+            pk=pk,
+            title=self.phrase(rng, rng.randint(1, 5)),
+            # Популярные авторы пишут много книг
+            author_id=self.zipf('authors').one(rng),
+            genre_id=self.uniform(rng, 'genres'),
+            category_id=self.uniform(rng, 'categories'),
+            series_id=self.uniform(rng, 'series') if self.counts['series'] and rng.random() < 0.1 else None,
+            year=rng.randint(1950, self.plan.today.year),
+            isbn=f"979{pk:010d}",
+            price=self.price(pk),
+            description=self.phrase(rng, rng.randint(10, 60)),
+            published_date=created,
+            created_at=timezone.make_aware(datetime.datetime.combine(created, datetime.time(12))),
+            status=rng.choices(('available', 'out_of_stock', 'discontinued'), (90, 8, 2))[0],
+        )
+
+    def promotions(self, pk, rng, fake):
+        # Треть акций уже прошла, треть идёт сейчас, треть впереди
+        start = self.plan.today + datetime.timedelta(days=rng.randint(-90, 30))
+        return Promotion(
+            pk=pk,
+            description=self.phrase(rng, 3),
+            promotion_type=rng.choice(PROMOTION_TYPES),
+            start_date=start,
+            end_date=start + datetime.timedelta(days=rng.randint(7, 60)),
+            discount_percent=Decimal(rng.choice((5, 10, 15, 20, 25, 30, 50))),
+        )
+
+    def promo_books(self, pk, rng, fake):
+        return PromoBook(pk=pk, promotion_id=self.uniform(rng, 'promotions'), book_id=self.uniform(rng, 'books'))
+
+    def orders(self, pk, rng, fake):
+        statuses, weights = zip(*ORDER_STATUSES)
+        return Order(
+            pk=pk,
+            # Немногие покупатели делают большую часть заказов
+            user_id=self.zipf('users').one(rng),
+            status=rng.choices(statuses, weights)[0],
+            delivery_address=f"г. Москва, ул. {self.phrase(rng, 1)}, д. {rng.randint(1, 200)}",
+            payment_method=rng.choice(PAYMENT_METHODS),
+        )
+
+    def order_items(self, pk, rng, fake):
+        offset = pk - self.plan.first_ids['order_items']
+        book_id = self.zipf('books').one(rng)
+        return OrderItem(
+            pk=pk,
+            order_id=self.plan.first_ids['orders'] + offset * self.counts['orders'] // self.counts['order_items'],
+            book_id=book_id,
+            quantity=rng.choices((1, 2, 3, 5), (80, 12, 6, 2))[0],
+            price=self.price(book_id),
+        )
+
+    def reviews(self, pk, rng, fake):
+        book_id = self.zipf('books').one(rng)
+        # У каждой книги своё «качество», оценки разбросаны вокруг него
+        quality = 2 + book_id * 2_654_435_761 % 3
+        rating = min(5, max(1, quality + rng.choice((-1, 0, 0, 1, 1))))
+        return Review(
+            pk=pk, book_id=book_id, user_id=self.zipf('users').one(rng),
+            rating=rating, text=REVIEW_TEXTS[5 - rating],
+        )
+
+    def favorites(self, pk, rng, fake):
+        return Favorite(pk=pk, user_id=self.uniform(rng, 'users'), book_id=self.zipf('books').one(rng))
+
+
+# Генератор на процесс: таблицы весов Ципфа строятся один раз
+_generator = None
+
+
+def _init_worker(plan):
+    global _generator
+    import django
+    django.setup()
+    connections.close_all()
+    _generator = Generator(plan)
+
+
+def run_batch(phase, batch):
+    """Генерирует и вставляет пачку batch фазы phase. Результат детерминирован seed, фазой и номером пачки."""
+    plan = _generator.plan
+    lo = batch * plan.batch_size
+    hi = min(lo + plan.batch_size, plan.counts[phase])
+    rng = random.Random(f"{plan.seed}:{phase}:{batch}")
+    fake = None
+    if phase == 'authors':
+        fake = Faker('ru_RU')
+        fake.seed_instance(f"{plan.seed}:{phase}:{batch}")
+    objects = _generator.build(phase, lo, hi, rng, fake)
+    model = type(objects[0])
+    # Избранное уникально по (пользователь, книга): повторы горячих книг пропускаются
+    model.objects.bulk_create(objects, batch_size=plan.batch_size, ignore_conflicts=model is Favorite)
+    return len(objects)
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует детерминированный синтетический каталог заданного объёма "
+        "(bulk_create пачками, распределение Ципфа для популярных авторов и книг)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--authors', type=int, default=1_000)
+        parser.add_argument('--genres', type=int, default=30)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--series', type=int, default=500)
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--orders', type=int, help="По умолчанию — треть позиций заказов")
+        parser.add_argument('--order-items', type=int, default=50_000)
+        parser.add_argument('--reviews', type=int, default=20_000)
+        parser.add_argument('--favorites', type=int, default=20_000)
+        parser.add_argument('--promotions', type=int, default=50)
+        parser.add_argument('--promo-books', type=int, help="По умолчанию — 5%% книг")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skew', type=float, default=1.1, help="Показатель распределения Ципфа")
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--processes', type=int, default=1, help="Процессов генерации")
+        parser.add_argument('--flush', action='store_true', help="Удалить каталог, заказы и отзывы перед генерацией")
+
+    def handle(self, *args, **options):
+        counts = {phase: options[phase] for phase, _ in PHASES if options.get(phase) is not None}
+        counts.setdefault('orders', max(1, options['order_items'] // 3))
+        counts.setdefault('promo_books', options['books'] // 20)
+        for parent, children in (('books', ('promo_books', 'order_items', 'reviews', 'favorites')),
+                                 ('users', ('orders', 'reviews', 'favorites')),
+                                 ('authors', ('books',)), ('genres', ('books',)), ('categories', ('books',)),
+                                 ('promotions', ('promo_books',)), ('orders', ('order_items',))):
+            if not counts[parent] and any(counts[child] for child in children):
+                raise CommandError(f"--{parent.replace('_', '-')} должно быть больше нуля")
+
+        if options['flush']:
+            self._flush()
+        first_ids = {
+            phase: (model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+            for phase, model in PHASES
+        }
+        plan = Plan(counts, first_ids, options['seed'], options['skew'], options['batch_size'],
+                    timezone.localdate())
+
+        processes = max(1, options['processes'])
+        if processes > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                "SQLite пишет в один поток: процессы ускоряют только генерацию строк"
+            ))
+        started = time.perf_counter()
+        total = 0
+        if processes > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(plan,)) as pool:
+                for phase, _ in PHASES:
+                    total += self._phase(phase, plan, lambda p, batches: pool.map(run_batch, [p] * len(batches), batches))
+        else:
+            global _generator
+            _generator = Generator(plan)
+            for phase, _ in PHASES:
+                total += self._phase(phase, plan, lambda p, batches: (run_batch(p, b) for b in batches))
+
+        self._derive()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Всего: {total} строк за {elapsed:.1f} с ({total / elapsed:,.0f} строк/с)"
+        ))
+
+    def _phase(self, phase, plan, run):
+        count = plan.counts[phase]
+        if not count:
+            return 0
+        started = time.perf_counter()
+        batches = list(range(math.ceil(count / plan.batch_size)))
+        rows = sum(run(phase, batches))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{phase:>12}: {rows:>10} строк за {elapsed:7.2f} с ({rows / elapsed:>10,.0f} строк/с)")
+        return rows
+
+    def _flush(self):
+        with connection.cursor() as cursor:
+            for model in FLUSH_MODELS:
+                cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+        self.stdout.write("Старые данные удалены")
+
+    def _derive(self):
+        # bulk_create не вызывает сигналы: счётчики, цены, поиск и версии — целиком
+        started = time.perf_counter()
+        # id заданы явно — последовательности (PostgreSQL) переводятся за них
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model for _, model in PHASES]):
+                cursor.execute(sql)
+        stats.reconcile_book_stats()
+        stats.reconcile_author_stats()
+        pricing.refresh_book_prices()
+        if search.fts_enabled():
+            search.rebuild_index()
+        versioning.bump(versioning.GLOBAL, versioning.DIMENSIONS)
+        homepage.invalidate()
+        self.stdout.write(f"{'производные':>12}: статистика, цены и поиск за {time.perf_counter() - started:.2f} с")
@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from shop import renditions
+from shop.models import Author, Book
+
+
+class Command(BaseCommand):
+    help = "Создаёт недостающие уменьшенные копии обложек и фото авторов (JPEG и WebP)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Pillow отпускает GIL при сжатии")
+
+    def handle(self, *args, **options):
+        sources = [
+            *Book.objects.exclude(cover='').exclude(cover=None).values_list('cover', flat=True),
+            *Author.objects.exclude(photo='').exclude(photo=None).values_list('photo', flat=True),
+        ]
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            written = sum(pool.map(renditions.generate_all, sources))
+        self.stdout.write(self.style.SUCCESS(f"Картинок: {len(sources)}, создано файлов: {written}"))
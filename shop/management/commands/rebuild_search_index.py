@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = "Полностью перестраивает полнотекстовый индекс книг (FTS5)"
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            self.stdout.write(self.style.WARNING("FTS5 доступен только на SQLite, индекс не используется"))
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано книг: {count}"))
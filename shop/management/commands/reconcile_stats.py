@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from shop import stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованную статистику книг и авторов и сообщает о расхождениях"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только отчёт, без исправления")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Книг (авторов) в одном диапазоне пересчёта")
+
+    def handle(self, *args, **options):
+        fix = not options['dry_run']
+        drift = 0
+        for label, reconcile in (("Книга", stats.reconcile_book_stats), ("Автор", stats.reconcile_author_stats)):
+            found = reconcile(chunk_size=options['chunk_size'], fix=fix)
+            for pk, diff in found[:50]:
+                changes = ', '.join(f"{field}: {old} -> {new}" for field, (old, new) in diff.items())
+                self.stdout.write(f"{label} #{pk}: {changes}")
+            if len(found) > 50:
+                self.stdout.write(f"... и ещё {len(found) - 50}")
+            drift += len(found)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Расхождений: {drift} (не исправлены)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Исправлено расхождений: {drift}"))
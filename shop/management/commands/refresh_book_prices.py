@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shop import pricing
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает материализованные цены книг (BookPrice)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale', action='store_true',
+            help="Только цены с истёкшим сроком действия (для ежедневного запуска по cron)",
+        )
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            count = pricing.refresh_stale_prices()
+        else:
+            count = pricing.refresh_book_prices()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано цен: {count}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop import stock
+
+
+class Command(BaseCommand):
+    help = "Освобождает истёкшие резервы и возвращает экземпляры в остаток (для запуска по cron)"
+
+    def handle(self, *args, **options):
+        count = stock.release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Освобождено резервов: {count}"))
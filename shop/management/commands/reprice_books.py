@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import repricing
+from shop.models import Book
+
+
+class Command(BaseCommand):
+    help = "Массовая переоценка книг: один UPDATE на пачку, с историей цен"
+
+    def add_arguments(self, parser):
+        change = parser.add_mutually_exclusive_group(required=True)
+        change.add_argument('--percent', help="Изменение в процентах, например -10 или 5.5")
+        change.add_argument('--amount', help="Изменение в рублях, например -50")
+        parser.add_argument('--category', type=int, help="id категории")
+        parser.add_argument('--author', type=int, help="id автора")
+        parser.add_argument('--genre', type=int, help="id жанра")
+        parser.add_argument('--status', choices=[value for value, _ in Book.STATUS_CHOICES])
+        parser.add_argument('--reason', default='')
+        parser.add_argument('--batch-size', type=int, default=repricing.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать изменения")
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        for field in ('category', 'author', 'genre'):
+            if options[field] is not None:
+                books = books.filter(**{f'{field}_id': options[field]})
+        if options['status']:
+            books = books.filter(status=options['status'])
+
+        try:
+            result = repricing.reprice(
+                books, percent=options['percent'], amount=options['amount'], reason=options['reason'],
+                dry_run=options['dry_run'], batch_size=options['batch_size'],
+            )
+        except (repricing.RepricingError, ArithmeticError) as exc:
+            raise CommandError(str(exc))
+
+        for pk, old, new in result.sample:
+            self.stdout.write(f"Книга #{pk}: {old} -> {new}")
+        summary = f"{result.count} книг, сумма цен {result.old_total} -> {result.new_total}"
+        if result.dry_run:
+            self.stdout.write(self.style.WARNING(f"Пробный запуск: {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Переоценка #{result.repricing.pk}: {summary}"))
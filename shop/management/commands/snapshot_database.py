@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import database
+
+
+class Command(BaseCommand):
+    help = (
+        "Снимает согласованную копию основной базы для реплики чтения "
+        "(SHOP_DB_REPLICA=<путь>); запускать по cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Куда записать снимок (по умолчанию SHOP_DB_REPLICA)")
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.SHOP_DB_REPLICA
+        if not path or path == 'readonly':
+            raise CommandError("Укажите путь снимка аргументом или в SHOP_DB_REPLICA")
+        try:
+            database.snapshot(path)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Снимок записан в {path}"))
@@ -0,0 +1,145 @@
+"""
+Инструментирование SQL по запросам.
+
+Для выбранной доли запросов (SHOP_SQL_SAMPLE_RATE) middleware считает
+число и суммарное время SQL, группирует запросы по нормализованному
+тексту и месту вызова (строка шаблона, поле сериализатора или строка
+кода проекта) и помечает подозрения на N+1: один и тот же запрос из одного
+места SHOP_SQL_N_PLUS_ONE_THRESHOLD раз и больше. Итог уходит в заголовок
+Server-Timing и одной JSON-строкой в лог shop.sql. Запросы вне выборки
+обходятся одним вызовом random().
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import Serializer
+
+logger = logging.getLogger('shop.sql')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THIS_FILE = os.path.abspath(__file__)
+
+_IN_LIST = re.compile(r'\bIN \(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Текст запроса без литералов и длины IN-списков: одинаков для повторов N+1."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _is_project_file(filename):
+    return (
+        filename.startswith(PROJECT_DIR)
+        and filename != THIS_FILE
+        and 'site-packages' not in filename
+    )
+
+
+def query_origin(frame):
+    """
+    (место, строка кода): ближайший узел шаблона или поле сериализатора,
+    из которого выполнен запрос, и первая строка кода проекта на стеке.
+    """
+    place = code_line = None
+    while frame is not None and (place is None or code_line is None):
+        code = frame.f_code
+        if place is None and code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                place = f'{origin.template_name}:{token.lineno}'
+        elif place is None and code.co_name == 'to_representation':
+            serializer, field = frame.f_locals.get('self'), frame.f_locals.get('field')
+            if isinstance(serializer, Serializer) and field is not None:
+                place = f'{type(serializer).__name__}.{field.field_name}'
+        if code_line is None and _is_project_file(code.co_filename):
+            code_line = f'{os.path.relpath(code.co_filename, PROJECT_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return place or code_line or '?', code_line or '?'
+
+
+class QueryRecorder:
+    """execute_wrapper: время каждого запроса и группы (отпечаток, место вызова)."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            place, code_line = query_origin(sys._getframe(1))
+            group = self.groups.setdefault((fingerprint(sql), place), {'count': 0, 'duration': 0.0, 'code': code_line})
+            group['count'] += 1
+            group['duration'] += elapsed
+
+    def suspects(self, threshold):
+        found = [
+            {'sql': sql[:300], 'origin': place, 'code': group['code'], 'count': group['count'],
+             'db_ms': round(group['duration'] * 1000, 2)}
+            for (sql, place), group in self.groups.items() if group['count'] >= threshold
+        ]
+        return sorted(found, key=lambda item: -item['count'])
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SHOP_SQL_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        # Доля читается на каждый запрос: команды аудита и бенчмарков выключают выборку через override_settings
+        if random.random() >= getattr(settings, 'SHOP_SQL_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.01):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        suspects = recorder.suspects(self.threshold)
+        timings = [
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"',
+            f'app;dur={total * 1000:.2f}',
+        ]
+        if suspects:
+            timings.append(f'nplusone;desc="{len(suspects)} suspects"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        # Потоковые ответы выполняют запросы уже после выхода из middleware и здесь не видны
+        logger.log(
+            logging.WARNING if suspects else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_ms': round(recorder.duration * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+                'n_plus_one': suspects,
+            }, ensure_ascii=False),
+        )
+        return response
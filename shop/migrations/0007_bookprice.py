@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_alter_user_managers_remove_user_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPrice',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='price_index', serialize=False, to='shop.book', verbose_name='Книга')),
+                ('discount_percent', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='Скидка (%)')),
+                ('effective_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена со скидкой')),
+                ('valid_from', models.DateField(verbose_name='Действует с')),
+                ('valid_until', models.DateField(db_index=True, verbose_name='Действует по')),
+                ('promotion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.promotion', verbose_name='Акция')),
+            ],
+            options={
+                'verbose_name': 'Цена книги',
+                'verbose_name_plural': 'Цены книг',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+FTS_TABLE = 'shop_book_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    # Полнотекстовый индекс есть только на SQLite (FTS5); на других СУБД поиск идёт через LIKE
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, author, genre, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, author, genre, description) "
+        "SELECT b.id, b.title, a.full_name, g.name, b.description FROM shop_book b "
+        "JOIN shop_author a ON a.id = b.author_id JOIN shop_genre g ON g.id = b.genre_id"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_bookprice'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_sold_count(apps, schema_editor):
+    # Начальные значения счётчика из уже существующих позиций заказов
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    BookStats = apps.get_model('shop', 'BookStats')
+    totals = OrderItem.objects.values('book_id').annotate(total=Sum('quantity'))
+    BookStats.objects.bulk_create(
+        [BookStats(book_id=row['book_id'], sold_count=row['total'] or 0) for row in totals],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_book_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='shop.book', verbose_name='Книга')),
+                ('sold_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Продано экземпляров')),
+            ],
+            options={
+                'verbose_name': 'Статистика книги',
+                'verbose_name_plural': 'Статистика книг',
+            },
+        ),
+        migrations.RunPython(fill_sold_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:38
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_review_and_favorite_counts(apps, schema_editor):
+    Review = apps.get_model('shop', 'Review')
+    Favorite = apps.get_model('shop', 'Favorite')
+    BookStats = apps.get_model('shop', 'BookStats')
+    rows = {}
+    for row in Review.objects.values('book_id').annotate(count=Count('id'), total=Sum('rating')):
+        rows[row['book_id']] = BookStats(book_id=row['book_id'], review_count=row['count'], rating_sum=row['total'] or 0)
+    for row in Favorite.objects.values('book_id').annotate(count=Count('id')):
+        rows.setdefault(row['book_id'], BookStats(book_id=row['book_id'])).favorites_count = row['count']
+    BookStats.objects.bulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['book'],
+        update_fields=['review_count', 'rating_sum', 'favorites_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_bookstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookstats',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='bookstats',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='bookstats',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_review_and_favorite_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_author_stats(apps, schema_editor):
+    # Строка статистики заводится для каждого автора, чтобы сортировка шла по одной таблице
+    Author = apps.get_model('shop', 'Author')
+    Book = apps.get_model('shop', 'Book')
+    Review = apps.get_model('shop', 'Review')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    AuthorStats = apps.get_model('shop', 'AuthorStats')
+    rows = {pk: AuthorStats(author_id=pk) for pk in Author.objects.values_list('pk', flat=True)}
+    for row in Book.objects.values('author_id').annotate(count=Count('id')):
+        rows[row['author_id']].books_count = row['count']
+    for row in Review.objects.values('book__author_id').annotate(count=Count('id'), total=Sum('rating')):
+        rows[row['book__author_id']].review_count = row['count']
+        rows[row['book__author_id']].rating_sum = row['total'] or 0
+    for row in OrderItem.objects.values('book__author_id').annotate(total=Sum('quantity')):
+        rows[row['book__author_id']].sold_count = row['total'] or 0
+    AuthorStats.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='shop.author', verbose_name='Автор')),
+                ('books_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество книг')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('sold_count', models.PositiveIntegerField(default=0, verbose_name='Продано экземпляров')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_authorstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('book_ids', models.JSONField(blank=True, null=True, verbose_name='Книги')),
+                ('workers', models.PositiveSmallIntegerField(default=1, verbose_name='Процессов')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего книг')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка в PDF',
+                'verbose_name_plural': 'Выгрузки в PDF',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
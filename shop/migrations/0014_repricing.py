@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Repricing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата')),
+                ('percent', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Изменение, %')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Изменение, руб.')),
+                ('reason', models.CharField(blank=True, max_length=200, verbose_name='Причина')),
+                ('books_count', models.PositiveIntegerField(default=0, verbose_name='Книг изменено')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Выполнил')),
+            ],
+            options={
+                'verbose_name': 'Переоценка',
+                'verbose_name_plural': 'Переоценки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Старая цена')),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Новая цена')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_changes', to='shop.book', verbose_name='Книга')),
+                ('repricing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='shop.repricing', verbose_name='Переоценка')),
+            ],
+            options={
+                'verbose_name': 'Изменение цены',
+                'verbose_name_plural': 'Изменения цен',
+            },
+        ),
+    ]
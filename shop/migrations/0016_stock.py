@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_order_checkout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStock',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='shop.book', verbose_name='Книга')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Свободный остаток')),
+            ],
+            options={
+                'verbose_name': 'Остаток',
+                'verbose_name_plural': 'Остатки',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='shop.book', verbose_name='Книга')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Резерв',
+                'verbose_name_plural': 'Резервы',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['full_name', 'id'], name='shop_author_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='shop_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', 'price', 'id'], name='shop_book_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', 'price', 'id'], name='shop_book_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookstats',
+            index=models.Index(fields=['-sold_count', 'book'], name='shop_bookstats_top_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promobook',
+            index=models.Index(fields=['book', 'promotion'], name='shop_promobook_book_promo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['end_date', 'start_date'], name='shop_promotion_dates_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['year'], name='shop_book_year_idx'),
+        ),
+    ]
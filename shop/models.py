@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Case, F, When
+from django.db.models.functions import Cast, Coalesce
 from django.utils import timezone
 from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
@@ -34,15 +36,44 @@ class BookManager(models.Manager):
         return self.filter(status='available')
 
 
+# Менеджер авторов со статистикой из AuthorStats
+class AuthorManager(models.Manager):
+    DIRECTORY_SORTS = {
+        'name': ('full_name', 'id'),
+        '-name': ('-full_name', '-id'),
+        'books': ('stats__books_count', 'id'),
+        '-books': ('-stats__books_count', 'id'),
+    }
+
+    def with_stats(self):
+        return self.annotate(
+            books_count=Coalesce('stats__books_count', 0),
+            avg_rating=Case(
+                When(stats__review_count__gt=0,
+                     then=Cast('stats__rating_sum', models.FloatField()) / F('stats__review_count')),
+                output_field=models.FloatField(),
+            ),
+            sold_count=Coalesce('stats__sold_count', 0),
+        )
+
+    def directory(self, sort='name'):
+        ordering = self.DIRECTORY_SORTS.get(sort, self.DIRECTORY_SORTS['name'])
+        return self.with_stats().order_by(*ordering)
+
+
 # Модель автора
 class Author(models.Model):
     full_name = models.CharField("ФИО", max_length=200)
     bio = models.TextField("Биография", blank=True)
     photo = models.ImageField("Фото", upload_to='authors/', null=True, blank=True)
 
+    objects = AuthorManager()
+
     class Meta:
         verbose_name = "Автор"
         verbose_name_plural = "Авторы"
+        # Справочник авторов по умолчанию отсортирован по имени (AuthorManager.DIRECTORY_SORTS)
+        indexes = [models.Index(fields=['full_name', 'id'], name='shop_author_name_id_idx')]
 
     def __str__(self):
         return self.full_name
@@ -110,6 +141,14 @@ class Book(models.Model):
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
         ordering = ['price']
+        # Каталог листается keyset-пагинацией по (price, id): индекс отдаёт страницу без сортировки
+        indexes = [
+            models.Index(fields=['price', 'id'], name='shop_book_price_id_idx'),
+            models.Index(fields=['status', 'price', 'id'], name='shop_book_status_price_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='shop_book_category_price_idx'),
+            # Фасет «год издания» (shop.facets) группирует по индексу
+            models.Index(fields=['year'], name='shop_book_year_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -122,19 +161,38 @@ class Book(models.Model):
             return self.price * Decimal('0.1')
         return Decimal('0.0')
 
+    def _fresh_price_index(self):
+        # Строка BookPrice, загруженная через select_related и актуальная на сегодня
+        related = type(self).price_index.related
+        index = related.get_cached_value(self, default=None)
+        if index is not None and index.is_valid_on(timezone.localdate()):
+            return index
+        return None
+
     @property
     def active_promo(self):
-        now = timezone.now().date()
+        # Акция, подставленная пакетно (shop.pricing), не требует запроса
+        if hasattr(self, '_active_promo'):
+            return self._active_promo
+        index = self._fresh_price_index()
+        if index is not None:
+            return index.promotion
+        now = timezone.localdate()
         return self.promotions.filter(
             start_date__lte=now,
             end_date__gte=now
-        ).first()
+        ).order_by('-discount_percent').first()
 
     @property
     def discounted_price(self):
+        from .pricing import discounted
+        if not hasattr(self, '_active_promo'):
+            index = self._fresh_price_index()
+            if index is not None:
+                return index.effective_price
         promo = self.active_promo
-        if promo and promo.discount_percent > 0:
-            return self.price * (Decimal('1.0') - promo.discount_percent / Decimal('100'))
+        if promo:
+            return discounted(self.price, promo.discount_percent)
         return self.price
 
     def get_absolute_url(self):
@@ -187,10 +245,16 @@ class Order(models.Model):
     status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default='new')
     delivery_address = models.CharField("Адрес доставки", max_length=255)
     payment_method = models.CharField("Способ оплаты", max_length=50)
+    total = models.DecimalField("Сумма", max_digits=12, decimal_places=2, default=0)
+    # Ключ идемпотентности от клиента: повтор оформления возвращает тот же заказ
+    idempotency_key = models.CharField("Ключ идемпотентности", max_length=64, null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_user_idempotency_key'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.user}"
@@ -237,6 +301,8 @@ class Promotion(models.Model):
     class Meta:
         verbose_name = 'Акция'
         verbose_name_plural = 'Акции'
+        # Действующие и будущие акции: end_date >= сегодня отсекает почти все прошедшие
+        indexes = [models.Index(fields=['end_date', 'start_date'], name='shop_promotion_dates_idx')]
 
     def __str__(self):
         return f"{self.description} — {self.discount_percent}%"
@@ -250,6 +316,210 @@ class PromoBook(models.Model):
     class Meta:
         verbose_name = "Книга в акции"
         verbose_name_plural = "Книги в акциях"
+        # Акции пачки книг (shop.pricing) читаются из индекса, без обращения к таблице
+        indexes = [models.Index(fields=['book', 'promotion'], name='shop_promobook_book_promo_idx')]
 
     def __str__(self):
         return f"{self.book} - {self.promotion}"
+
+
+# Материализованная цена книги с учётом лучшей активной акции
+class BookPrice(models.Model):
+    book = models.OneToOneField(
+        Book, verbose_name="Книга", primary_key=True,
+        on_delete=models.CASCADE, related_name='price_index'
+    )
+    promotion = models.ForeignKey(
+        Promotion, verbose_name="Акция", null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
+    discount_percent = models.DecimalField("Скидка (%)", max_digits=5, decimal_places=2, default=0)
+    effective_price = models.DecimalField("Цена со скидкой", max_digits=10, decimal_places=2)
+    valid_from = models.DateField("Действует с")
+    valid_until = models.DateField("Действует по", db_index=True)
+
+    class Meta:
+        verbose_name = "Цена книги"
+        verbose_name_plural = "Цены книг"
+
+    def __str__(self):
+        return f"{self.book_id}: {self.effective_price}"
+
+    def is_valid_on(self, day):
+        return self.valid_from <= day <= self.valid_until
+
+
+# Денормализованная статистика книги, обновляется инкрементально (shop.stats)
+class BookStats(models.Model):
+    book = models.OneToOneField(
+        Book, verbose_name="Книга", primary_key=True,
+        on_delete=models.CASCADE, related_name='stats'
+    )
+    sold_count = models.PositiveIntegerField("Продано экземпляров", default=0, db_index=True)
+    review_count = models.PositiveIntegerField("Количество отзывов", default=0)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0)
+    favorites_count = models.PositiveIntegerField("В избранном", default=0)
+
+    class Meta:
+        verbose_name = "Статистика книги"
+        verbose_name_plural = "Статистика книг"
+        # Популярные на главной: top-N по убыванию продаж, при равенстве — по книге
+        indexes = [models.Index(fields=['-sold_count', 'book'], name='shop_bookstats_top_sold_idx')]
+
+    def __str__(self):
+        return f"{self.book_id}: продано {self.sold_count}"
+
+    @property
+    def avg_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+
+# Счётчики версий каталога для ETag / Last-Modified (см. shop.versioning)
+class CatalogVersion(models.Model):
+    name = models.CharField("Ключ", max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField("Версия", default=0)
+    updated_at = models.DateTimeField("Изменено", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версии каталога"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+# Денормализованная статистика автора, обновляется инкрементально (shop.stats)
+class AuthorStats(models.Model):
+    author = models.OneToOneField(
+        Author, verbose_name="Автор", primary_key=True,
+        on_delete=models.CASCADE, related_name='stats'
+    )
+    books_count = models.PositiveIntegerField("Количество книг", default=0, db_index=True)
+    review_count = models.PositiveIntegerField("Количество отзывов", default=0)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0)
+    sold_count = models.PositiveIntegerField("Продано экземпляров", default=0)
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+
+    def __str__(self):
+        return f"{self.author_id}: книг {self.books_count}"
+
+    @property
+    def avg_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+
+# Фоновая выгрузка каталога в PDF (см. shop.exports)
+class ExportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    created_by = models.ForeignKey(
+        User, verbose_name="Создал", null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    # None — весь каталог
+    book_ids = models.JSONField("Книги", null=True, blank=True)
+    workers = models.PositiveSmallIntegerField("Процессов", default=1)
+    total = models.PositiveIntegerField("Всего книг", default=0)
+    processed = models.PositiveIntegerField("Обработано", default=0)
+    file = models.FileField("Файл", upload_to='exports/', blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    finished_at = models.DateTimeField("Завершено", null=True, blank=True)
+    # Последний признак жизни обработчика: по нему находятся брошенные задачи
+    heartbeat_at = models.DateTimeField("Последний прогресс", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Выгрузка в PDF"
+        verbose_name_plural = "Выгрузки в PDF"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Выгрузка #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == 'done' else 0
+        return min(100, self.processed * 100 // self.total)
+
+
+# Массовое изменение цен (см. shop.repricing)
+class Repricing(models.Model):
+    created_by = models.ForeignKey(
+        User, verbose_name="Выполнил", null=True, blank=True,
+        on_delete=models.SET_NULL, related_name='+'
+    )
+    created_at = models.DateTimeField("Дата", default=timezone.now)
+    percent = models.DecimalField("Изменение, %", max_digits=5, decimal_places=2, null=True, blank=True)
+    amount = models.DecimalField("Изменение, руб.", max_digits=10, decimal_places=2, null=True, blank=True)
+    reason = models.CharField("Причина", max_length=200, blank=True)
+    books_count = models.PositiveIntegerField("Книг изменено", default=0)
+
+    class Meta:
+        verbose_name = "Переоценка"
+        verbose_name_plural = "Переоценки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        change = f"{self.percent:+}%" if self.percent is not None else f"{self.amount:+} руб."
+        return f"Переоценка #{self.pk}: {change}"
+
+
+# История цен: одна строка на книгу в переоценке
+class PriceChange(models.Model):
+    repricing = models.ForeignKey(Repricing, verbose_name="Переоценка", on_delete=models.CASCADE, related_name='changes')
+    book = models.ForeignKey(Book, verbose_name="Книга", on_delete=models.CASCADE, related_name='price_changes')
+    old_price = models.DecimalField("Старая цена", max_digits=10, decimal_places=2)
+    new_price = models.DecimalField("Новая цена", max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Изменение цены"
+        verbose_name_plural = "Изменения цен"
+
+    def __str__(self):
+        return f"{self.book_id}: {self.old_price} -> {self.new_price}"
+
+
+# Остаток книги на складе (см. shop.stock); книги без строки продаются без ограничений
+class BookStock(models.Model):
+    book = models.OneToOneField(
+        Book, verbose_name="Книга", primary_key=True,
+        on_delete=models.CASCADE, related_name='stock'
+    )
+    # Свободный остаток: зарезервированные экземпляры уже вычтены
+    quantity = models.PositiveIntegerField("Свободный остаток", default=0)
+
+    class Meta:
+        verbose_name = "Остаток"
+        verbose_name_plural = "Остатки"
+
+    def __str__(self):
+        return f"{self.book_id}: {self.quantity}"
+
+
+# Временный резерв экземпляров под покупателя
+class StockReservation(models.Model):
+    book = models.ForeignKey(Book, verbose_name="Книга", on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, verbose_name="Пользователь", on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField("Количество")
+    created_at = models.DateTimeField("Создан", default=timezone.now)
+    expires_at = models.DateTimeField("Истекает", db_index=True)
+
+    class Meta:
+        verbose_name = "Резерв"
+        verbose_name_plural = "Резервы"
+
+    def __str__(self):
+        return f"{self.book_id} x {self.quantity} до {self.expires_at:%H:%M}"
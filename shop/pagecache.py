@@ -0,0 +1,123 @@
+"""
+Кэш страниц каталога целиком для анонимных посетителей.
+
+Гость без сессионной cookie получает HTML из кэша: ни сессии, ни ORM,
+ни шаблона. Ключ — представление, путь, значимые GET-параметры в
+нормализованном порядке (трекинговые метки и пустые значения
+отбрасываются), версии каталога, от которых зависит страница (см.
+shop.versioning), и текущая дата — акции сменяются в полночь. Изменение
+книги, отзыва, акции или справочника поднимает версию, и старые записи
+перестают читаться; TIMEOUT лишь страхует от бесконечного хранения.
+
+CSRF-токены форм (логин в шапке) в кэш не попадают: при сохранении они
+заменяются заглушкой, при выдаче — токеном текущего посетителя.
+Вошедшие пользователи видят страницу, собранную для них, как раньше.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils import timezone
+
+from . import database, versioning
+
+CACHE_PREFIX = 'shop:page:'
+TIMEOUT = getattr(settings, 'SHOP_PAGE_CACHE_TIMEOUT', 60 * 60)
+CSRF_PLACEHOLDER = b'__shop_csrf_token__'
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def is_anonymous(request):
+    # Без сессионной cookie посетитель точно гость — сессию и пользователя не загружаем
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated
+
+
+def page_key(request, view_name, params, names, extra=''):
+    query = sorted(
+        (name, value) for name in params for value in request.GET.getlist(name) if value
+    )
+    versions = versioning.request_versions(request, names)
+    parts = [
+        request.path,
+        urlencode(query),
+        *(f'{name}={versions[name][0]}' for name in names),
+        timezone.localdate().isoformat(),
+        extra,
+    ]
+    digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'{CACHE_PREFIX}{view_name}:{digest}'
+
+
+def _cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Cache-Control')
+    )
+
+
+def _freeze(response):
+    return {
+        'content': _CSRF_INPUT.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content),
+        'content_type': response['Content-Type'],
+    }
+
+
+def _restore(request, frozen):
+    content = frozen['content']
+    if CSRF_PLACEHOLDER in content:
+        # get_token() заодно выставит посетителю CSRF-cookie (CsrfViewMiddleware)
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, content_type=frozen['content_type'])
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def cache_anonymous_page(names_func, params=(), extra_func=None):
+    """
+    Декоратор: кэширует страницу для гостей. names_func(request, *args, **kwargs)
+    возвращает ключи версий каталога, params — GET-параметры, меняющие страницу,
+    extra_func(request) — дополнительная часть ключа (состояние вне версий каталога).
+    Ставится под декоратором условного GET (catalog_condition/book_condition):
+    версии для ETag и ключа читаются один раз.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                not getattr(settings, 'SHOP_PAGE_CACHE', True)
+                or request.method not in ('GET', 'HEAD')
+                or not is_anonymous(request)
+            ):
+                return view(request, *args, **kwargs)
+            key = page_key(
+                request, view.__name__, params, names_func(request, *args, **kwargs),
+                extra_func(request) if extra_func else '',
+            )
+            frozen = cache.get(key)
+            if frozen is not None:
+                return _restore(request, frozen)
+            response = view(request, *args, **kwargs)
+            # Страница из отстающего снимка осталась бы в кэше под свежей версией каталога
+            if _cacheable(response) and not database.read_from_snapshot():
+                cache.set(key, _freeze(response), TIMEOUT)
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
+
+
+def catalog_names(request, *args, **kwargs):
+    return [versioning.GLOBAL]
+
+
+def book_names(request, pk, **kwargs):
+    return [versioning.book_key(pk), versioning.DIMENSIONS, versioning.PRICES]
@@ -0,0 +1,145 @@
+"""
+Keyset-пагинация (seek method) для каталога.
+
+Вместо OFFSET и COUNT страница выбирается условием по ключу сортировки
+последней показанной строки, поэтому стоимость страницы не зависит
+от её номера и размера каталога.
+"""
+from django.core import signing
+from django.db.models import Q
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_SALT = 'shop.pagination.cursor'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по уникальному набору полей ordering (по умолчанию price, id —
+    как Book.Meta.ordering плюс pk для однозначности). Курсор непрозрачен
+    и подписан, поэтому подделанный курсор просто открывает первую страницу.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('price', 'id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def encode_cursor(self, obj, backwards=False):
+        position = [str(getattr(obj, field)) for field in self.ordering]
+        return signing.dumps({'p': position, 'b': backwards}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None, False
+        position = data.get('p')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            return None, False
+        return position, bool(data.get('b'))
+
+    def _seek(self, position, backwards):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        lookup = 'lt' if backwards else 'gt'
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            step = Q(**{f'{field}__{lookup}': position[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], position[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def get_page(self, cursor=None):
+        position, backwards = self.decode_cursor(cursor)
+        queryset = self.queryset
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, backwards))
+        prefix = '-' if backwards else ''
+        queryset = queryset.order_by(*(prefix + field for field in self.ordering))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        has_next = position is not None if backwards else has_more
+        has_previous = has_more if backwards else position is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], backwards=True) if rows and has_previous else None,
+        )
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Курсорная пагинация DRF поверх KeysetPaginator: тот же порядок (price, id)
+    и те же подписанные курсоры, что и в HTML-каталоге.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('price', 'id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), self.ordering)
+        self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+
+class AuthorPagination(PageNumberPagination):
+    """Постраничный справочник авторов: авторов на порядки меньше, чем книг, COUNT дёшев."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -1,42 +1,28 @@
+"""
+Небольшой демонстрационный каталог для разработки.
+
+Обёртка над manage.py generate_catalog: для нагрузочных данных
+вызывайте команду напрямую с нужными объёмами.
+"""
 import os
+
 import django
-import random
-from decimal import Decimal
-from faker import Faker
-from datetime import datetime
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookie.settings')
-django.setup()
-
-from shop.models import Author, Genre, Book, Category
-
-fake = Faker()
-
-# Очистка старых данных
-Author.objects.all().delete()
-Genre.objects.all().delete()
-Category.objects.all().delete()
-Book.objects.all().delete()
-
-# Создаём категории
-categories = [Category.objects.create(name=fake.word().capitalize()) for _ in range(5)]
-
-# Создаём жанры
-genres = [Genre.objects.create(name=fake.word().capitalize()) for _ in range(5)]
-
-# Создаём авторов
-authors = [Author.objects.create(full_name=fake.name()) for _ in range(5)]
-
-# Создаём 30 книг
-for _ in range(30):
-    Book.objects.create(
-        title=fake.sentence(nb_words=3),
-        author=random.choice(authors),
-        genre=random.choice(genres),
-        category=random.choice(categories),
-        price=Decimal(random.randint(100, 1000)),
-        year=random.randint(1990, datetime.now().year),
-        isbn=fake.unique.isbn13()  # уникальный ISBN
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookie.settings')
+    django.setup()
+
+    from django.core.management import call_command
+
+    # Очистка старых данных и 30 книг, как раньше
+    call_command(
+        'generate_catalog', flush=True,
+        books=30, authors=5, genres=5, categories=5, series=0, users=5,
+        order_items=0, orders=0, reviews=0, favorites=0, promotions=0, promo_books=0,
     )
+    print("База данных успешно заполнена!")
+
 
-print("База данных успешно заполнена!")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Ценообразование каталога.
+
+Лучшая активная акция подбирается пакетно — одним запросом на страницу
+или на пачку книг, — а итоговая цена материализуется в таблицу BookPrice,
+чтобы списки и API читали её простым JOIN без запросов на каждую строку.
+"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.utils import timezone
+
+from .models import Book, BookPrice, PromoBook
+
+CENT = Decimal('0.01')
+
+# Дата последней проверки устаревших цен в этом процессе
+_checked_on = None
+
+
+def discounted(price, percent):
+    """Цена со скидкой percent%, округлённая до копеек."""
+    if not percent or percent <= 0:
+        return price
+    return (price * (Decimal('1') - percent / Decimal('100'))).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _promo_windows(book_ids, day):
+    # Текущие и будущие акции для пачки книг — один запрос
+    return (
+        PromoBook.objects
+        .filter(book_id__in=book_ids, promotion__end_date__gte=day)
+        .select_related('promotion')
+        .order_by('book_id', '-promotion__discount_percent', 'promotion_id')
+    )
+
+
+def _resolve(book_ids, day):
+    """
+    Возвращает {book_id: (лучшая акция или None, дата окончания действия цены)}.
+    Цена меняется, когда заканчивается активная акция или начинается будущая.
+    """
+    resolved = {}
+    for link in _promo_windows(book_ids, day):
+        promo = link.promotion
+        best, until = resolved.get(link.book_id, (None, datetime.date.max))
+        if promo.start_date <= day:
+            if best is None:
+                best = promo
+            until = min(until, promo.end_date)
+        else:
+            until = min(until, promo.start_date - datetime.timedelta(days=1))
+        resolved[link.book_id] = (best, until)
+    return resolved
+
+
+def active_promos(book_ids, day=None):
+    """Лучшая активная акция для каждой книги: {book_id: Promotion}."""
+    day = day or timezone.localdate()
+    return {
+        book_id: promo
+        for book_id, (promo, _) in _resolve(list(book_ids), day).items()
+        if promo is not None
+    }
+
+
+def attach_active_promos(books, day=None):
+    """
+    Подставляет каждой книге её лучшую активную акцию (или None),
+    после чего active_promo и discounted_price не делают запросов.
+    """
+    books = list(books)
+    best = active_promos([book.pk for book in books], day)
+    for book in books:
+        book._active_promo = best.get(book.pk)
+    return books
+
+
+def prime_prices(books, day=None):
+    """
+    Книгам без актуальной строки BookPrice (например, созданным bulk-операциями)
+    подставляет акции одним запросом, чтобы шаблон не делал запрос на каждую.
+    """
+    books = list(books)
+    missing = [
+        book for book in books
+        if not hasattr(book, '_active_promo') and book._fresh_price_index() is None
+    ]
+    if missing:
+        attach_active_promos(missing, day)
+    return books
+
+
+def _iter_chunks(queryset, size):
+    # Постраничный обход по pk без OFFSET
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def refresh_book_prices(book_ids=None, day=None, chunk_size=500):
+    """
+    Пересчитывает BookPrice для указанных книг (или всего каталога).
+    Каждая пачка — один запрос за акциями и один upsert.
+    """
+    day = day or timezone.localdate()
+    books = Book.objects.values_list('pk', 'price')
+    if book_ids is not None:
+        book_ids = list(book_ids)
+        if not book_ids:
+            return 0
+        books = books.filter(pk__in=book_ids)
+
+    total = 0
+    for chunk in _iter_chunks(books, chunk_size):
+        resolved = _resolve([pk for pk, _ in chunk], day)
+        rows = []
+        for pk, price in chunk:
+            promo, until = resolved.get(pk, (None, datetime.date.max))
+            percent = promo.discount_percent if promo else Decimal('0')
+            rows.append(BookPrice(
+                book_id=pk,
+                promotion=promo,
+                discount_percent=percent,
+                effective_price=discounted(price, percent),
+                valid_from=day,
+                valid_until=until,
+            ))
+        BookPrice.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['book'],
+            update_fields=['promotion', 'discount_percent', 'effective_price', 'valid_from', 'valid_until'],
+        )
+        total += len(rows)
+    return total
+
+
+def refresh_stale_prices(day=None):
+    """Пересчитывает только цены, у которых закончился срок действия."""
+    day = day or timezone.localdate()
+    stale = BookPrice.objects.filter(valid_until__lt=day).values_list('book_id', flat=True)
+    return refresh_book_prices(list(stale), day=day)
+
+
+def ensure_prices_current():
+    """Смена даты: один раз в сутки на процесс досчитывает устаревшие цены."""
+    global _checked_on
+    today = timezone.localdate()
+    if _checked_on != today:
+        refresh_stale_prices(today)
+        _checked_on = today
+
+
+def with_prices(queryset):
+    """Добавляет к выборке книг материализованную цену и её акцию."""
+    ensure_prices_current()
+    return queryset.select_related('price_index__promotion')
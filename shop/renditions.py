@@ -0,0 +1,128 @@
+"""
+Уменьшенные копии обложек и фото авторов (JPEG и WebP).
+
+Для каждого размера из SIZES хранятся варианты 1x и 2x в обоих форматах
+в MEDIA_ROOT/renditions/ — это и есть дисковый кэш: однажды созданный
+файл отдаётся веб-сервером как обычная статика. Копии создаются в фоновом
+потоке после сохранения книги или автора; если их ещё нет, тег
+{% rendition %} ведёт на представление, которое создаёт их при первом
+запросе. Досоздать копии для уже загруженных картинок —
+manage.py generate_renditions.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# имя -> (ширина, высота, обрезать ли под пропорции)
+SIZES = {
+    'thumb': (60, 90, True),     # список на главной
+    'card': (420, 250, True),    # карточки каталога и авторов
+    'detail': (400, 600, False),  # страница книги: вписывается, без обрезки
+}
+DENSITIES = (1, 2)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Маркер готовности размера — последний записываемый вариант
+VARIANTS = [(density, fmt) for fmt in FORMATS for density in DENSITIES]
+ROOT = 'renditions'
+# Каталоги загрузки, из которых можно делать копии (upload_to у Book.cover и Author.photo) — точно,
+# без подкаталогов: в books/files/ лежат защищённые файлы книг (shop.downloads)
+SOURCE_DIRS = ('books', 'authors')
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def variant_name(source, size, density, fmt):
+    stem = posixpath.splitext(source)[0]
+    return f'{ROOT}/{stem}/{size}-{density}x.{fmt}'
+
+
+def is_ready(source, size):
+    density, fmt = VARIANTS[-1]
+    return default_storage.exists(variant_name(source, size, density, fmt))
+
+
+def is_allowed_source(source):
+    return (
+        posixpath.dirname(source) in SOURCE_DIRS
+        and '..' not in source.split('/')
+        and not posixpath.isabs(source)
+    )
+
+
+def _resize(image, size, density):
+    width, height, crop = SIZES[size]
+    box = (width * density, height * density)
+    if crop:
+        return ImageOps.fit(image, box, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(box, Image.LANCZOS)
+    return image
+
+
+def generate(source, size):
+    """Создаёт недостающие варианты размера size; возвращает число записанных файлов."""
+    if not is_allowed_source(source):
+        raise SuspiciousFileOperation(f"Недопустимый источник: {source}")
+    missing = [
+        (density, fmt) for density, fmt in VARIANTS
+        if not default_storage.exists(variant_name(source, size, density, fmt))
+    ]
+    if not missing:
+        return 0
+    with default_storage.open(source, 'rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image = image.convert('RGB')
+    for density, fmt in missing:
+        pil_format, _, params = FORMATS[fmt]
+        buffer = io.BytesIO()
+        _resize(image, size, density).save(buffer, pil_format, **params)
+        name = variant_name(source, size, density, fmt)
+        if not default_storage.exists(name):  # параллельный процесс мог успеть раньше
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return len(missing)
+
+
+def generate_all(source):
+    written = 0
+    for size in SIZES:
+        try:
+            written += generate(source, size)
+        except (OSError, SuspiciousFileOperation):
+            logger.exception("Не удалось создать копии %s (%s)", source, size)
+    return written
+
+
+def _generate_pending(source):
+    try:
+        generate_all(source)
+    finally:
+        with _pending_lock:
+            _pending.discard(source)
+
+
+def schedule(source):
+    """Создаёт копии в фоновом потоке, вне обработки запроса; повторные вызовы не дублируют работу."""
+    global _executor
+    if not source or not is_allowed_source(source):
+        return
+    with _pending_lock:
+        if source in _pending:
+            return
+        _pending.add(source)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='renditions')
+    _executor.submit(_generate_pending, source)
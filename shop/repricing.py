@@ -0,0 +1,138 @@
+"""
+Массовая переоценка книг.
+
+Новая цена считается в самой базе одним UPDATE ... SET price = <выражение>
+на пачку книг (диапазон pk внутри отобранного queryset), без загрузки и
+save() каждой модели. Арифметика ведётся в целых копейках, поэтому
+округление точное и совпадает с Decimal ROUND_HALF_UP из shop.pricing.
+История пишется одной вставкой PriceChange на пачку; вся переоценка —
+одна транзакция.
+"""
+from contextlib import nullcontext
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Greatest, Round
+
+from . import homepage, versioning
+from .models import PriceChange, Repricing
+from .pricing import CENT, refresh_book_prices
+
+BATCH_SIZE = 5000
+# Сколько изменений показывать в отчёте пробного запуска
+SAMPLE_SIZE = 20
+
+
+class RepricingError(ValueError):
+    pass
+
+
+class RepricingResult:
+    def __init__(self, repricing=None, count=0, old_total=Decimal('0'), new_total=Decimal('0'), sample=None):
+        self.repricing = repricing
+        self.count = count
+        self.old_total = old_total
+        self.new_total = new_total
+        self.sample = sample or []
+
+    @property
+    def dry_run(self):
+        return self.repricing is None
+
+
+class Rule:
+    """Изменение цены на percent процентов или на amount рублей (со знаком)."""
+
+    def __init__(self, percent=None, amount=None):
+        if (percent is None) == (amount is None):
+            raise RepricingError("Нужно указать либо процент, либо сумму изменения")
+        if percent is not None:
+            percent = Decimal(percent)
+            if percent != percent.quantize(CENT) or percent < -100:
+                raise RepricingError("Процент — не меньше -100 и не более двух знаков после запятой")
+        if amount is not None:
+            amount = Decimal(amount)
+            if amount != amount.quantize(CENT):
+                raise RepricingError("Сумма — не более двух знаков после запятой")
+        self.percent = percent
+        self.amount = amount
+
+    def apply(self, price):
+        """Новая цена для Decimal price — эталон для SQL-выражения."""
+        if self.percent is not None:
+            return (price * (100 + self.percent) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+        return max(price + self.amount, Decimal('0.00'))
+
+    def expression(self):
+        """То же в SQL: целые копейки, деление нацело с прибавкой половины делителя."""
+        cents = Cast(Round(F('price') * 100), models.BigIntegerField())
+        if self.percent is not None:
+            # (копейки * (10000 + базисные пункты) + 5000) // 10000 — ROUND_HALF_UP для неотрицательных
+            factor = 10000 + int(self.percent * 100)
+            new_cents = (cents * Value(factor) + Value(5000)) / Value(10000)
+        else:
+            new_cents = Greatest(cents + Value(int(self.amount * 100)), Value(0))
+        return models.ExpressionWrapper(
+            new_cents * Value(CENT), output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+
+
+def reprice(queryset, percent=None, amount=None, reason='', user=None, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Переоценивает книги queryset (любой фильтр, не список id) в одной
+    транзакции. Каждая пачка — один SELECT (pk, цена), один UPDATE по
+    диапазону pk и одна вставка истории. При dry_run ничего не пишет и
+    возвращает сводку с примерами изменений.
+    """
+    rule = Rule(percent, amount)
+    # Переоценка целиком — одна транзакция: сбой посреди пачек не оставит часть цен
+    # изменёнными, а запись истории — без числа книг. Пачки лишь ограничивают память
+    with nullcontext() if dry_run else transaction.atomic():
+        return _reprice(queryset.order_by(), rule, reason, user, dry_run, batch_size)
+
+
+def _reprice(queryset, rule, reason, user, dry_run, batch_size):
+    result = RepricingResult()
+    if not dry_run:
+        result.repricing = Repricing.objects.create(
+            created_by=user if user is not None and user.is_authenticated else None,
+            percent=rule.percent, amount=rule.amount, reason=reason,
+        )
+
+    rows = queryset.order_by('pk').values_list('pk', 'price')
+    if not dry_run:
+        rows = rows.select_for_update(of=('self',))
+    last_pk = None
+    while True:
+        # Пачка (pk, цена) по возрастанию pk, без OFFSET; строки заблокированы до конца транзакции
+        batch = list((rows if last_pk is None else rows.filter(pk__gt=last_pk))[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        changes = [(pk, price, rule.apply(price)) for pk, price in batch]
+        changes = [change for change in changes if change[1] != change[2]]
+        result.count += len(changes)
+        for pk, old, new in changes:
+            result.old_total += old
+            result.new_total += new
+        if len(result.sample) < SAMPLE_SIZE:
+            result.sample.extend(changes[:SAMPLE_SIZE - len(result.sample)])
+        if dry_run or not changes:
+            continue
+
+        queryset.filter(pk__range=(batch[0][0], last_pk)).update(price=rule.expression())
+        PriceChange.objects.bulk_create([
+            PriceChange(repricing=result.repricing, book_id=pk, old_price=old, new_price=new)
+            for pk, old, new in changes
+        ])
+        refresh_book_prices([pk for pk, _, _ in changes])
+
+    if not dry_run:
+        Repricing.objects.filter(pk=result.repricing.pk).update(books_count=result.count)
+        result.repricing.books_count = result.count
+        if result.count:
+            # update() не вызывает сигналы: сбрасываем версии и главную явно; справочники не менялись
+            versioning.bump(versioning.GLOBAL, versioning.PRICES)
+            transaction.on_commit(homepage.invalidate)
+    return result
@@ -0,0 +1,151 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+На SQLite используется виртуальная таблица FTS5 (см. миграцию 0008_book_fts)
+по названию, автору, жанру и описанию книги; её синхронизируют сигналы
+из shop.signals, а полная перестройка — manage.py rebuild_search_index.
+На других СУБД поиск откатывается на icontains по тем же полям.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Author, Book, Genre
+
+FTS_TABLE = 'shop_book_fts'
+
+# Веса столбцов для bm25: title, author, genre, description
+RANK_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(text):
+    """
+    Превращает пользовательский ввод в безопасное выражение MATCH:
+    каждое слово — префиксный терм в кавычках, термы объединяются через AND.
+    """
+    terms = _TERM_RE.findall(text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _source_sql(where):
+    book, author, genre = Book._meta.db_table, Author._meta.db_table, Genre._meta.db_table
+    return (
+        f"SELECT b.id, b.title, a.full_name, g.name, b.description FROM {book} b "
+        f"JOIN {author} a ON a.id = b.author_id JOIN {genre} g ON g.id = b.genre_id "
+        f"WHERE {where}"
+    )
+
+
+def _reindex(where, params):
+    # Одна пара DELETE + INSERT ... SELECT на любое число книг
+    if not fts_enabled():
+        return
+    book = Book._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT b.id FROM {book} b WHERE {where})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, author, genre, description) {_source_sql(where)}",
+            params,
+        )
+
+
+def reindex_book(book_id):
+    _reindex('b.id = %s', [book_id])
+
+
+def reindex_author(author_id):
+    _reindex('b.author_id = %s', [author_id])
+
+
+def reindex_genre(genre_id):
+    _reindex('b.genre_id = %s', [genre_id])
+
+
+def remove_book(book_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rebuild_index():
+    """Полная перестройка индекса. Возвращает число проиндексированных книг."""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, title, author, genre, description) {_source_sql('1 = 1')}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+class SearchResults:
+    """
+    Ленивый результат полнотекстового поиска для Paginator:
+    count() и срезы выполняются внутри FTS-индекса, а из таблицы книг
+    загружается только текущая страница (в порядке релевантности).
+    """
+
+    def __init__(self, expression, queryset):
+        self.expression = expression
+        self.queryset = queryset
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self.expression])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(index.stop - start, 0)
+        weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                [self.expression, limit, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        books = self.queryset.in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+
+def search_books(text, queryset=None):
+    """
+    Ищет книги по названию, автору, жанру и описанию с учётом префиксов.
+    Возвращает объект, пригодный для django.core.paginator.Paginator.
+    """
+    if queryset is None:
+        queryset = Book.objects.all()
+    expression = build_match_expression(text)
+    if not expression:
+        return queryset.none()
+    if fts_enabled():
+        return SearchResults(expression, queryset)
+
+    condition = Q()
+    for term in _TERM_RE.findall(text):
+        condition &= (
+            Q(title__icontains=term) | Q(author__full_name__icontains=term)
+            | Q(genre__name__icontains=term) | Q(description__icontains=term)
+        )
+    return queryset.filter(condition).order_by('title', 'pk')
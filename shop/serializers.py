@@ -1,8 +1,79 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from .models import Book, Author, Category, Review
+from .models import Book, Author, Category, Order, OrderItem, Review, StockReservation
+
+
+# Разреженные наборы полей: ?fields=id,title,price
+class SparseFieldsetMixin:
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def _resolve_path(model, path):
+    """
+    Разбирает ORM-путь ('author__full_name') на связи для select_related
+    и prefetch_related. Для путей, не ведущих к полю модели
+    (свойства, методы), возвращает None.
+    """
+    select, prefetch = [], []
+    parts = path.split('__')
+    try:
+        for i, part in enumerate(parts):
+            field = model._meta.get_field(part)
+            if i == len(parts) - 1 or not field.is_relation:
+                break
+            prefix = '__'.join(parts[:i + 1])
+            if field.many_to_many or field.one_to_many:
+                prefetch.append(prefix)
+                break
+            select.append(prefix)
+            model = field.related_model
+    except FieldDoesNotExist:
+        return None
+    return select, prefetch
+
+
+def optimize_queryset(queryset, serializer, extra_fields=()):
+    """
+    Строит select_related/prefetch_related и only() по полям сериализатора:
+    source вида 'author.full_name' превращается в JOIN и одну колонку,
+    а SerializerMethodField берёт зависимости из Meta.method_field_sources.
+    """
+    sources = getattr(serializer.Meta, 'method_field_sources', {})
+    columns = list(extra_fields)
+    for name, field in serializer.fields.items():
+        if field.source == '*':
+            columns.extend(sources.get(name, ()))
+        else:
+            columns.append(field.source.replace('.', '__'))
+
+    select, prefetch, only = set(), set(), []
+    narrow = True
+    for column in columns:
+        resolved = _resolve_path(queryset.model, column)
+        if resolved is None:
+            # Вычисляемое свойство модели — сузить колонки нельзя
+            narrow = False
+            continue
+        related, prefetched = resolved
+        if prefetched:
+            prefetch.update(prefetched)
+            continue
+        select.update(related)
+        only.append(column)
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset.only(*only) if narrow else queryset
+
 
 # Сериализатор для книги
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     discounted_price = serializers.SerializerMethodField()  # вычисляемое поле
     author_name = serializers.CharField(source='author.full_name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -13,10 +84,21 @@ class BookSerializer(serializers.ModelSerializer):
             'id', 'title', 'author_name', 'category_name',
             'price', 'discount', 'discounted_price', 'status'
         ]
+        # Колонки, которые читает discounted_price (см. Book.discounted_price и BookPrice)
+        method_field_sources = {
+            'discounted_price': (
+                'price',
+                'price_index__effective_price',
+                'price_index__valid_from',
+                'price_index__valid_until',
+                'price_index__promotion__discount_percent',
+            ),
+        }
 
     def get_discounted_price(self, obj):
         # Через context можно передавать request или дополнительные данные
         request = self.context.get('request')
+        # При выборке через pricing.with_prices цена берётся из BookPrice без запроса
         return obj.discounted_price
 
 # Сериализатор для аннотированной книги
@@ -32,15 +114,14 @@ class BookAnnotatedSerializer(serializers.ModelSerializer):
 
 # Сериализатор для автора
 class AuthorSerializer(serializers.ModelSerializer):
-    books_count = serializers.SerializerMethodField()
+    # Аннотации Author.objects.with_stats() из AuthorStats, без COUNT на каждого автора
+    books_count = serializers.IntegerField(read_only=True)
+    avg_rating = serializers.FloatField(read_only=True)
+    sold_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Author
-        fields = ['id', 'full_name', 'books_count']
-
-    def get_books_count(self, obj):
-        # Считаем количество книг у автора
-        return obj.books.count()
+        fields = ['id', 'full_name', 'books_count', 'avg_rating', 'sold_count']
 
 
 # Сериализатор для отзывов
@@ -50,3 +131,55 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'user_name', 'text', 'rating', 'date']
+
+
+# Корзина: позиции и итоги из shop.cart.price_cart()
+class CartLineSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField(source='book.pk')
+    title = serializers.CharField(source='book.title')
+    author_name = serializers.CharField(source='book.author.full_name')
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    promotion = serializers.CharField(source='promo.description', default=None)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartSerializer(serializers.Serializer):
+    lines = CartLineSerializer(many=True)
+    items_count = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+# Оформление заказа (shop.checkout)
+class CheckoutSerializer(serializers.Serializer):
+    delivery_address = serializers.CharField(max_length=255)
+    payment_method = serializers.CharField(max_length=50)
+    idempotency_key = serializers.CharField(max_length=64, required=False)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['book_id', 'quantity', 'price']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(source='orderitem_set', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'date', 'status', 'delivery_address', 'payment_method', 'total', 'items']
+
+
+# Резерв экземпляров (shop.stock)
+class StockReservationSerializer(serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'book_id', 'quantity', 'expires_at']
+        read_only_fields = ['expires_at']
@@ -0,0 +1,298 @@
+from django.db import transaction
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, cart, database, homepage, pricing, renditions, search, stats, versioning
+from .models import (
+    Author, Book, Category, Favorite, Genre, OrderItem, PromoBook, Promotion, Review, Series,
+)
+
+
+def _refresh_prices_on_commit(book_ids):
+    book_ids = list(book_ids)
+    if book_ids:
+        transaction.on_commit(lambda: pricing.refresh_book_prices(book_ids))
+
+
+# ======================
+# Настройка соединений SQLite
+# ======================
+
+@receiver(connection_created)
+def sqlite_connection_created(sender, connection, **kwargs):
+    database.configure_connection(connection)
+
+
+# ======================
+# Материализованные цены
+# ======================
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh_prices_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=PromoBook)
+@receiver(post_delete, sender=PromoBook)
+def promo_book_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh_prices_on_commit([instance.book_id])
+
+
+@receiver(post_save, sender=Promotion)
+def promotion_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    book_ids = PromoBook.objects.filter(promotion=instance).values_list('book_id', flat=True)
+    _refresh_prices_on_commit(book_ids)
+
+
+@receiver(m2m_changed, sender=PromoBook)
+def book_promotions_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # book.promotions.add()/set() и promotion.books.add()/set() вставляют PromoBook через bulk_create,
+    # без post_save: цены, версии и главную обновляем здесь. remove()/clear() удаляют строки
+    # queryset.delete(), и их покрывают обработчики post_delete выше
+    if action != 'post_add' or not pk_set:
+        return
+    book_ids = list(pk_set) if reverse else [instance.pk]
+    _refresh_prices_on_commit(book_ids)
+    versioning.bump(versioning.GLOBAL, *(versioning.book_key(book_id) for book_id in book_ids))
+    _invalidate_homepage_on_commit()
+
+
+# ======================
+# Полнотекстовый индекс
+# ======================
+
+@receiver(post_save, sender=Book)
+def book_saved_search(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    book_id = instance.pk
+    transaction.on_commit(lambda: search.reindex_book(book_id))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_search(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: search.remove_book(book_id))
+
+
+@receiver(post_save, sender=Author)
+def author_saved_search(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    author_id = instance.pk
+    transaction.on_commit(lambda: search.reindex_author(author_id))
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved_search(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    genre_id = instance.pk
+    transaction.on_commit(lambda: search.reindex_genre(genre_id))
+
+
+# ======================
+# Счётчики BookStats
+# ======================
+
+@receiver(pre_save, sender=OrderItem)
+def order_item_before_save(sender, instance, raw=False, **kwargs):
+    # Запоминаем прежние книгу, автора и количество, чтобы учесть только разницу
+    instance._stats_previous = None
+    if not raw and instance.pk:
+        instance._stats_previous = (
+            OrderItem.objects.filter(pk=instance.pk)
+            .values_list('book_id', 'book__author_id', 'quantity').first()
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous is not None:
+        book_id, author_id, quantity = previous
+        stats.add_sales(book_id, -quantity, author_id=author_id)
+    stats.add_sales(instance.book_id, instance.quantity, author_id=stats.book_author_id(instance))
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    stats.add_sales(instance.book_id, -instance.quantity, author_id=stats.book_author_id(instance))
+
+
+@receiver(pre_save, sender=Review)
+def review_before_save(sender, instance, raw=False, **kwargs):
+    instance._stats_previous = None
+    if not raw and instance.pk:
+        instance._stats_previous = (
+            Review.objects.filter(pk=instance.pk)
+            .values_list('book_id', 'book__author_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous is not None:
+        book_id, author_id, rating = previous
+        stats.add_review(book_id, rating, sign=-1, author_id=author_id)
+    stats.add_review(instance.book_id, instance.rating, author_id=stats.book_author_id(instance))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    stats.add_review(instance.book_id, instance.rating, sign=-1, author_id=stats.book_author_id(instance))
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        stats.add_favorite(instance.book_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    stats.add_favorite(instance.book_id, sign=-1)
+
+
+@receiver(pre_save, sender=Book)
+def book_before_save_stats(sender, instance, raw=False, **kwargs):
+    instance._stats_previous_author = None
+    if not raw and instance.pk:
+        instance._stats_previous_author = (
+            Book.objects.filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+def book_saved_stats(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous_author', None)
+    if created or previous is None:
+        stats.add_author_book(instance.author_id)
+    elif previous != instance.author_id:
+        # Книга сменила автора — переносим вместе с ней отзывы и продажи
+        stats.add_author_book(previous, sign=-1, book_id=instance.pk)
+        stats.add_author_book(instance.author_id, book_id=instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_stats(sender, instance, **kwargs):
+    stats.add_author_book(instance.author_id, sign=-1)
+
+
+@receiver(post_save, sender=Author)
+def author_saved_stats(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        stats.create_author_stats(instance.pk)
+
+
+# ======================
+# Кэш главной страницы
+# ======================
+
+def _invalidate_homepage_on_commit(*blocks):
+    transaction.on_commit(lambda: homepage.invalidate(*blocks))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed_homepage(sender, raw=False, **kwargs):
+    if not raw:
+        _invalidate_homepage_on_commit('popular_books')
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=PromoBook)
+@receiver(post_delete, sender=PromoBook)
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(post_save, sender=Author)
+def catalog_changed_homepage(sender, raw=False, **kwargs):
+    # Цены, акции и имена авторов видны во всех трёх блоках
+    if not raw:
+        _invalidate_homepage_on_commit()
+
+
+# ======================
+# Версии каталога (ETag)
+# ======================
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        versioning.bump(versioning.GLOBAL, versioning.book_key(instance.pk))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=PromoBook)
+@receiver(post_delete, sender=PromoBook)
+def book_related_changed_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        versioning.bump(versioning.GLOBAL, versioning.book_key(instance.book_id))
+
+
+@receiver(post_save, sender=Promotion)
+def promotion_saved_version(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    book_ids = PromoBook.objects.filter(promotion=instance).values_list('book_id', flat=True)
+    versioning.bump(versioning.GLOBAL, *(versioning.book_key(book_id) for book_id in book_ids))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Series)
+@receiver(post_delete, sender=Series)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def dimension_changed_version(sender, raw=False, **kwargs):
+    if not raw:
+        versioning.bump(versioning.GLOBAL, versioning.DIMENSIONS)
+        caching.invalidate_local()
+
+
+# ======================
+# Корзина гостя при входе
+# ======================
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is not None:
+        cart.merge_anonymous_cart(request, user)
+
+
+# ======================
+# Уменьшенные копии картинок
+# ======================
+
+@receiver(post_save, sender=Book)
+def book_saved_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and instance.cover:
+        source = instance.cover.name
+        transaction.on_commit(lambda: renditions.schedule(source))
+
+
+@receiver(post_save, sender=Author)
+def author_saved_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and instance.photo:
+        source = instance.photo.name
+        transaction.on_commit(lambda: renditions.schedule(source))
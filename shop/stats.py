@@ -0,0 +1,204 @@
+"""
+Инкрементальные счётчики по книгам (BookStats) и авторам (AuthorStats).
+
+Счётчики меняются F()-выражениями в одной транзакции с исходной записью,
+поэтому чтение популярности, рейтинга и избранного не требует GROUP BY
+по заказам, отзывам и избранному. Расхождения находит и исправляет
+manage.py reconcile_stats.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from . import versioning
+from .models import Author, AuthorStats, Book, BookStats, Favorite, OrderItem, Review
+
+COUNTERS = ('sold_count', 'review_count', 'rating_sum', 'favorites_count')
+AUTHOR_COUNTERS = ('books_count', 'review_count', 'rating_sum', 'sold_count')
+
+
+def _increment(model, key, pk, **deltas):
+    # Не ниже нуля: разошедшийся счётчик не должен ронять удаление (CHECK), его исправит reconcile_stats
+    changes = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    with transaction.atomic():
+        if model is AuthorStats:
+            versioning.bump(versioning.AUTHOR_STATS)
+        if model.objects.filter(**{key: pk}).update(**changes):
+            return
+        # Строки нет: уменьшать нечего (например, при каскадном удалении книги/автора)
+        if any(delta < 0 for delta in deltas.values()):
+            return
+        model.objects.bulk_create([model(**{key: pk})], ignore_conflicts=True)
+        model.objects.filter(**{key: pk}).update(**changes)
+
+
+def book_author_id(instance):
+    """author_id книги отзыва/позиции заказа: из загруженной книги или одним запросом."""
+    if type(instance).book.is_cached(instance):
+        return instance.book.author_id
+    return Book.objects.filter(pk=instance.book_id).values_list('author_id', flat=True).first()
+
+
+def add_sales(book_id, quantity, author_id=None):
+    """Учитывает продажу (или возврат при отрицательном quantity)."""
+    _increment(BookStats, 'book_id', book_id, sold_count=quantity)
+    if author_id is not None:
+        _increment(AuthorStats, 'author_id', author_id, sold_count=quantity)
+
+
+def _increment_many(model, key, field, deltas):
+    # Одна вставка недостающих строк и один UPDATE с CASE по всем ключам
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    if model is AuthorStats:
+        versioning.bump(versioning.AUTHOR_STATS)
+    model.objects.bulk_create([model(**{key: pk}) for pk in deltas], ignore_conflicts=True)
+    model.objects.filter(**{f'{key}__in': list(deltas)}).update(**{
+        field: Greatest(F(field) + Case(
+            *[When(**{key: pk}, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+        ), 0),
+    })
+
+
+def add_sales_many(lines):
+    """
+    Учитывает продажи нескольких книг разом; lines — тройки (book_id, author_id, количество).
+    Четыре запроса на весь заказ вместо пары на каждую позицию.
+    """
+    books, authors = {}, {}
+    for book_id, author_id, quantity in lines:
+        books[book_id] = books.get(book_id, 0) + quantity
+        authors[author_id] = authors.get(author_id, 0) + quantity
+    with transaction.atomic(savepoint=False):
+        _increment_many(BookStats, 'book_id', 'sold_count', books)
+        _increment_many(AuthorStats, 'author_id', 'sold_count', authors)
+
+
+def add_review(book_id, rating, sign=1, author_id=None):
+    """Учитывает новый (sign=1) или удалённый (sign=-1) отзыв."""
+    _increment(BookStats, 'book_id', book_id, review_count=sign, rating_sum=sign * rating)
+    if author_id is not None:
+        _increment(AuthorStats, 'author_id', author_id, review_count=sign, rating_sum=sign * rating)
+
+
+def add_favorite(book_id, sign=1):
+    _increment(BookStats, 'book_id', book_id, favorites_count=sign)
+
+
+def add_author_book(author_id, sign=1, book_id=None):
+    """
+    Книга добавлена автору (sign=1) или убрана у него (sign=-1). Если передан
+    book_id, вместе с книгой переносятся её отзывы и продажи.
+    """
+    deltas = {'books_count': sign}
+    if book_id is not None:
+        book = BookStats.objects.filter(book_id=book_id).values('review_count', 'rating_sum', 'sold_count').first()
+        for field, value in (book or {}).items():
+            deltas[field] = sign * value
+    _increment(AuthorStats, 'author_id', author_id, **deltas)
+
+
+def create_author_stats(author_id):
+    AuthorStats.objects.bulk_create([AuthorStats(author_id=author_id)], ignore_conflicts=True)
+
+
+def annotate_stats(queryset):
+    """
+    Аннотирует книги avg_rating, sold_count и favorites_count из BookStats —
+    один LEFT JOIN по первичному ключу вместо трёх размножающих строки JOIN.
+    """
+    return queryset.annotate(
+        avg_rating=Case(
+            When(stats__review_count__gt=0,
+                 then=Cast('stats__rating_sum', FloatField()) / F('stats__review_count')),
+            output_field=FloatField(),
+        ),
+        sold_count=Coalesce('stats__sold_count', 0),
+        favorites_count=Coalesce('stats__favorites_count', 0),
+    )
+
+
+def _actual_book_counters(lo, hi):
+    # Отдельный GROUP BY по каждой таблице — без перемножения строк
+    actual = {}
+
+    def row(book_id):
+        return actual.setdefault(book_id, dict.fromkeys(COUNTERS, 0))
+
+    ranged = {'book_id__gte': lo, 'book_id__lt': hi}
+    for item in OrderItem.objects.filter(**ranged).values('book_id').annotate(total=Sum('quantity')):
+        row(item['book_id'])['sold_count'] = item['total'] or 0
+    for item in Review.objects.filter(**ranged).values('book_id').annotate(count=Count('id'), total=Sum('rating')):
+        row(item['book_id']).update(review_count=item['count'], rating_sum=item['total'] or 0)
+    for item in Favorite.objects.filter(**ranged).values('book_id').annotate(count=Count('id')):
+        row(item['book_id'])['favorites_count'] = item['count']
+    return actual
+
+
+def _actual_author_counters(lo, hi):
+    actual = {}
+
+    def row(author_id):
+        return actual.setdefault(author_id, dict.fromkeys(AUTHOR_COUNTERS, 0))
+
+    for item in Book.objects.filter(author_id__gte=lo, author_id__lt=hi).values('author_id').annotate(count=Count('id')):
+        row(item['author_id'])['books_count'] = item['count']
+    ranged = {'book__author_id__gte': lo, 'book__author_id__lt': hi}
+    for item in (Review.objects.filter(**ranged).values('book__author_id')
+                 .annotate(count=Count('id'), total=Sum('rating'))):
+        row(item['book__author_id']).update(review_count=item['count'], rating_sum=item['total'] or 0)
+    for item in OrderItem.objects.filter(**ranged).values('book__author_id').annotate(total=Sum('quantity')):
+        row(item['book__author_id'])['sold_count'] = item['total'] or 0
+    return actual
+
+
+def _reconcile(model, parent, key, counters, actual_counters, chunk_size, fix):
+    drift = []
+    bounds = parent.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return drift
+
+    for lo in range(first, last + 1, chunk_size):
+        hi = lo + chunk_size
+        actual = actual_counters(lo, hi)
+        stored = {
+            row[key]: row
+            for row in model.objects.filter(**{f'{key}__gte': lo, f'{key}__lt': hi}).values(key, *counters)
+        }
+        fixes = []
+        for pk in actual.keys() | stored.keys():
+            expected = actual.get(pk, dict.fromkeys(counters, 0))
+            current = stored.get(pk, dict.fromkeys(counters, 0))
+            diff = {
+                field: (current[field], expected[field])
+                for field in counters if current[field] != expected[field]
+            }
+            if diff:
+                drift.append((pk, diff))
+                fixes.append(model(**{key: pk}, **expected))
+        if fix and fixes:
+            model.objects.bulk_create(
+                fixes, update_conflicts=True, unique_fields=[key.removesuffix('_id')], update_fields=list(counters),
+            )
+    if fix and drift and model is AuthorStats:
+        versioning.bump(versioning.AUTHOR_STATS)
+    return drift
+
+
+def reconcile_book_stats(chunk_size=5000, fix=True):
+    """
+    Пересчитывает BookStats по диапазонам id книг и сравнивает с сохранёнными
+    значениями. Возвращает список расхождений (book_id, {поле: (было, стало)});
+    при fix=True исправляет их одним upsert на диапазон.
+    """
+    return _reconcile(BookStats, Book, 'book_id', COUNTERS, _actual_book_counters, chunk_size, fix)
+
+
+def reconcile_author_stats(chunk_size=5000, fix=True):
+    """То же для AuthorStats: книги, отзывы и продажи по авторам."""
+    return _reconcile(AuthorStats, Author, 'author_id', AUTHOR_COUNTERS, _actual_author_counters, chunk_size, fix)
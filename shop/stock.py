@@ -0,0 +1,171 @@
+"""
+Складские остатки и резервы.
+
+Остаток (BookStock.quantity) уменьшается только условным UPDATE
+"quantity = quantity - n WHERE quantity >= n": проверка и списание —
+одна атомарная операция в базе, поэтому параллельные покупатели не могут
+продать больше, чем есть, ни на SQLite, ни на серверной СУБД. Списание
+начинается с записи, а не с чтения: на SQLite транзакция сразу берёт
+блокировку записи и не упирается в повышение блокировки чтения.
+
+Резерв сразу вычитает экземпляры из свободного остатка и возвращает их,
+если истёк, не дойдя до заказа. Истёкшие резервы освобождаются при
+нехватке остатка и командой release_reservations (по cron).
+
+Когда свободный остаток доходит до нуля, книга получает статус
+out_of_stock, при пополнении — снова available. Книги без строки
+BookStock продаются без ограничений.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import versioning
+from .models import Book, BookStock, StockReservation
+
+RESERVATION_TTL = datetime.timedelta(minutes=getattr(settings, 'SHOP_RESERVATION_MINUTES', 15))
+
+
+class OutOfStock(ValueError):
+    pass
+
+
+def _by_book(quantities):
+    return Case(*[When(book_id=book_id, then=Value(n)) for book_id, n in quantities.items()], default=Value(0))
+
+
+def _take(quantities):
+    """
+    Списывает {book_id: n} одним условным UPDATE. Книги без BookStock не
+    ограничены. Вызывать внутри транзакции: при нехватке хотя бы одной
+    книги бросает OutOfStock, и откат возвращает уже списанное.
+    """
+    quantities = {book_id: n for book_id, n in quantities.items() if n > 0}
+    if not quantities:
+        return
+    if len(quantities) == 1:
+        [(book_id, n)] = quantities.items()
+        taken = BookStock.objects.filter(book_id=book_id, quantity__gte=n).update(quantity=F('quantity') - n)
+    else:
+        enough = Q()
+        for book_id, n in quantities.items():
+            enough |= Q(book_id=book_id, quantity__gte=n)
+        taken = BookStock.objects.filter(enough).update(quantity=F('quantity') - _by_book(quantities))
+    if taken < len(quantities):
+        tracked = BookStock.objects.filter(book_id__in=list(quantities)).count()
+        if taken < tracked:
+            raise OutOfStock("Недостаточно экземпляров на складе")
+    if taken:
+        _sync_status(quantities)
+
+
+def _give(quantities):
+    """Возвращает {book_id: n} в свободный остаток."""
+    quantities = {book_id: n for book_id, n in quantities.items() if n > 0}
+    if not quantities:
+        return
+    BookStock.objects.filter(book_id__in=list(quantities)).update(quantity=F('quantity') + _by_book(quantities))
+    _sync_status(quantities)
+
+
+def _sync_status(book_ids):
+    """Переключает available/out_of_stock по остатку; discontinued не трогает."""
+    book_ids = list(book_ids)
+    changed = Book.objects.filter(pk__in=book_ids, status='available', stock__quantity=0).update(status='out_of_stock')
+    changed += (
+        Book.objects.filter(pk__in=book_ids, status='out_of_stock', stock__quantity__gt=0).update(status='available')
+    )
+    if changed:
+        # update() не вызывает сигналы: списки «в наличии» и страницы книг меняются здесь
+        versioning.bump(versioning.GLOBAL, *(versioning.book_key(book_id) for book_id in book_ids))
+
+
+def set_stock(book_id, quantity):
+    """Задаёт свободный остаток книги (инвентаризация, поступление из учётной системы)."""
+    with transaction.atomic():
+        BookStock.objects.bulk_create(
+            [BookStock(book_id=book_id, quantity=quantity)],
+            update_conflicts=True, unique_fields=['book'], update_fields=['quantity'],
+        )
+        _sync_status([book_id])
+
+
+def restock(book_id, quantity):
+    """Пополнение: прибавляет к остатку, создавая строку при необходимости."""
+    with transaction.atomic():
+        BookStock.objects.bulk_create([BookStock(book_id=book_id)], ignore_conflicts=True)
+        _give({book_id: quantity})
+
+
+def reserve(user, book_id, quantity=1, ttl=None):
+    """Резервирует экземпляры на ttl (по умолчанию RESERVATION_TTL) или бросает OutOfStock."""
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                _take({book_id: quantity})
+        except OutOfStock:
+            # Возможно, остаток держат брошенные резервы
+            if not release_expired(book_ids=[book_id], now=now):
+                raise
+            _take({book_id: quantity})
+        return StockReservation.objects.create(
+            user=user, book_id=book_id, quantity=quantity,
+            created_at=now, expires_at=now + (ttl or RESERVATION_TTL),
+        )
+
+
+def _delete_reservations(reservations, skip_locked=False):
+    """
+    Удаляет резервы и возвращает {book_id: экземпляров}. Строки блокируются
+    до удаления (на SQLite транзакции и так сериализованы), поэтому один
+    резерв не вернут в остаток два параллельных процесса.
+    """
+    rows = list(
+        reservations.select_for_update(skip_locked=skip_locked, of=('self',))
+        .values_list('pk', 'book_id', 'quantity')
+    )
+    quantities = {}
+    for _, book_id, quantity in rows:
+        quantities[book_id] = quantities.get(book_id, 0) + quantity
+    if rows:
+        deleted, _ = StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        if deleted != len(rows):
+            raise OutOfStock("Резервы изменились параллельно, повторите операцию")
+    return quantities, len(rows)
+
+
+def _release(reservations):
+    quantities, count = _delete_reservations(reservations, skip_locked=True)
+    _give(quantities)
+    return count
+
+
+def release(reservation):
+    """Отменяет резерв и возвращает экземпляры в остаток."""
+    with transaction.atomic():
+        return _release(StockReservation.objects.filter(pk=reservation.pk))
+
+
+def release_expired(book_ids=None, now=None):
+    """Освобождает истёкшие резервы (всех книг или только book_ids); возвращает их число."""
+    expired = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    if book_ids is not None:
+        expired = expired.filter(book_id__in=book_ids)
+    with transaction.atomic():
+        return _release(expired)
+
+
+def consume(user, quantities):
+    """
+    Списывает {book_id: n} под заказ пользователя: сначала из его активных
+    резервов, недостающее — из свободного остатка. Вызывать внутри транзакции заказа.
+    """
+    active = StockReservation.objects.filter(user=user, book_id__in=list(quantities), expires_at__gt=timezone.now())
+    reserved, _ = _delete_reservations(active)
+    # Лишнее против заказа возвращаем в остаток
+    _give({book_id: n - quantities[book_id] for book_id, n in reserved.items()})
+    _take({book_id: n - reserved.get(book_id, 0) for book_id, n in quantities.items()})
@@ -0,0 +1,47 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import format_html
+
+from shop import renditions
+
+register = template.Library()
+
+
+def _url(source, size, density, fmt, ready):
+    if ready:
+        return default_storage.url(renditions.variant_name(source, size, density, fmt))
+    # Копий ещё нет: первый запрос к представлению создаст их
+    return reverse('rendition', args=[size, density, fmt, source])
+
+
+def _srcset(source, size, fmt, ready):
+    return ', '.join(f'{_url(source, size, density, fmt, ready)} {density}x' for density in renditions.DENSITIES)
+
+
+@register.simple_tag
+def rendition(image, size, alt='', default='shop/img/default_cover.jpg', loading='lazy', **attrs):
+    """
+    <picture> с WebP и JPEG размера size (1x и 2x) вместо оригинала.
+    {% rendition book.cover 'card' alt=book.title class='card-img-top' %}
+    """
+    width, height, crop = renditions.SIZES[size]
+    attrs.update(alt=alt, loading=loading, decoding='async')
+    if crop:
+        attrs.update(width=width, height=height)
+    if not image:
+        return format_html('<img src="{}"{}>', static(default), flatatt(attrs))
+
+    source = image.name
+    ready = renditions.is_ready(source, size)
+    if not ready:
+        renditions.schedule(source)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}" srcset="{}"{}></picture>',
+        _srcset(source, size, 'webp', ready),
+        _url(source, size, 1, 'jpg', ready),
+        _srcset(source, size, 'jpg', ready),
+        flatatt(attrs),
+    )
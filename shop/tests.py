@@ -3,6 +3,16 @@ from django.urls import reverse
 from .models import Book, Author, Category, Cart, OrderItem, Favorite, Review
 from decimal import Decimal
 from django.contrib.auth.models import User
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import Genre, Promotion, PromoBook, BookPrice
+from django.core.cache import cache as django_cache
+from . import caching
+from . import facets
+from . import pricing
 
 class ShopTests(TestCase):
 
@@ -96,3 +106,1737 @@ class ShopTests(TestCase):
         order_item = OrderItem(book=self.book, quantity=-1, user=self.user)
         with self.assertRaises(ValidationError):
             order_item.full_clean()
+
+
+# ======================
+# Ценообразование и материализованные цены
+# ======================
+
+
+class CatalogTestMixin:
+    """Минимальный каталог для тестов: автор, жанр, категория и книги."""
+
+    def make_book(self, **kwargs):
+        self._isbn = getattr(self, '_isbn', 0) + 1
+        defaults = {
+            'title': f"Книга {self._isbn}",
+            'author': self.author,
+            'genre': self.genre,
+            'category': self.category,
+            'year': 2020,
+            'isbn': f"isbn-{self._isbn}",
+            'price': Decimal('500.00'),
+        }
+        defaults.update(kwargs)
+        return Book.objects.create(**defaults)
+
+    def make_promo(self, book, percent, start=-1, end=1):
+        today = timezone.localdate()
+        promo = Promotion.objects.create(
+            description=f"Скидка {percent}",
+            promotion_type='sale',
+            start_date=today + datetime.timedelta(days=start),
+            end_date=today + datetime.timedelta(days=end),
+            discount_percent=Decimal(percent),
+        )
+        PromoBook.objects.create(promotion=promo, book=book)
+        return promo
+
+    def setUp(self):
+        # Кэши живут весь процесс, а версии в откатанной БД повторяются от теста к тесту
+        django_cache.clear()
+        caching.local.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='12345')
+        self.author = Author.objects.create(full_name="Автор Тест")
+        self.genre = Genre.objects.create(name="Жанр Тест")
+        self.category = Category.objects.create(name="Категория Тест")
+
+
+class PricingTests(CatalogTestMixin, TestCase):
+
+    def test_best_active_promo_is_attached_in_one_query(self):
+        first = self.make_book()
+        second = self.make_book()
+        self.make_promo(first, '10')
+        self.make_promo(first, '25')
+        self.make_promo(second, '50', start=2, end=5)  # ещё не началась
+        books = list(Book.objects.filter(pk__in=[first.pk, second.pk]))
+        with self.assertNumQueries(1):
+            pricing.attach_active_promos(books)
+        with self.assertNumQueries(0):
+            self.assertEqual(books[0].active_promo.discount_percent, Decimal('25'))
+            self.assertEqual(books[0].discounted_price, Decimal('375.00'))
+            self.assertIsNone(books[1].active_promo)
+            self.assertEqual(books[1].discounted_price, Decimal('500.00'))
+
+    def test_price_index_follows_promotion_changes(self):
+        book = self.make_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            promo = self.make_promo(book, '20')
+        index = BookPrice.objects.get(book=book)
+        self.assertEqual(index.effective_price, Decimal('400.00'))
+        self.assertEqual(index.valid_until, promo.end_date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promo.delete()
+        self.assertEqual(BookPrice.objects.get(book=book).effective_price, Decimal('500.00'))
+
+    def test_price_index_follows_m2m_promotion_changes(self):
+        book, other = self.make_book(), self.make_book()
+        promo = self.make_promo(other, '20')
+        pricing.refresh_book_prices()
+
+        def state():
+            return (
+                BookPrice.objects.get(book=book).effective_price,
+                versioning.get_versions([versioning.book_key(book.pk)])[versioning.book_key(book.pk)][0],
+            )
+
+        _, version = state()
+        generation = homepage.generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            book.promotions.add(promo)
+        self.assertEqual(state(), (Decimal('400.00'), version + 1))
+        self.assertNotEqual(homepage.generation(), generation)
+        with self.captureOnCommitCallbacks(execute=True):
+            promo.books.remove(book)
+        self.assertEqual(state(), (Decimal('500.00'), version + 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            promo.books.set([book, other])
+        self.assertEqual(state()[0], Decimal('400.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            promo.books.clear()
+        self.assertEqual(BookPrice.objects.get(book=other).effective_price, Decimal('500.00'))
+        self.assertEqual(state()[0], Decimal('500.00'))
+
+    def test_listing_reads_price_without_per_row_queries(self):
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_promo(self.make_book(), '10')
+        books = list(pricing.with_prices(Book.objects.all()))
+        with self.assertNumQueries(0):
+            prices = [book.discounted_price for book in books if book.active_promo]
+        self.assertEqual(prices, [Decimal('450.00')] * 3)
+
+    def test_stale_prices_are_refreshed_after_rollover(self):
+        book = self.make_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_promo(book, '10', start=1, end=3)
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        self.assertEqual(pricing.refresh_stale_prices(tomorrow), 1)
+        self.assertEqual(BookPrice.objects.get(book=book).effective_price, Decimal('450.00'))
+
+    def test_book_list_query_count_does_not_grow_with_promos(self):
+        for _ in range(5):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_promo(self.make_book(), '10')
+        pricing.ensure_prices_current()
+        caching.dimension('author')  # справочник авторов прогрет
+        facets.facet_counts({})  # и счётчики фасетов каталога без фильтров
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('book_list'))
+        self.assertContains(response, '450,00')
+
+
+# ======================
+# Keyset-пагинация каталога
+# ======================
+
+from .pagination import KeysetPaginator
+
+
+class KeysetPaginationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Одинаковые цены проверяют разрешение «ничьих» по id
+        self.books = [self.make_book(price=Decimal(100 + (i // 2) * 10)) for i in range(7)]
+
+    def test_walks_forward_and_back_over_price_ties(self):
+        paginator = KeysetPaginator(Book.objects.all(), 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        seen = [book.pk for page in (first, second, third) for book in page]
+        self.assertEqual(seen, [book.pk for book in self.books])
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual([book.pk for book in back], [book.pk for book in second])
+        self.assertEqual(paginator.get_page(back.previous_cursor).object_list, first.object_list)
+
+    def test_tampered_cursor_opens_first_page(self):
+        paginator = KeysetPaginator(Book.objects.all(), 3)
+        page = paginator.get_page('garbage')
+        self.assertEqual(page[0].pk, self.books[0].pk)
+
+    def test_book_list_page_costs_one_query(self):
+        extra = [self.make_book(price=Decimal('900.00')) for _ in range(5)]
+        pricing.refresh_book_prices()
+        response = self.client.get(reverse('book_list'))
+        next_cursor = response.context['page_obj'].next_cursor
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('book_list'), {'cursor': next_cursor})
+        self.assertEqual([book.pk for book in response.context['page_obj']],
+                         [book.pk for book in extra[3:]])
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertContains(response, '&laquo; Назад')
+
+
+# ======================
+# Полнотекстовый поиск
+# ======================
+
+from . import search
+
+
+class SearchTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tolstoy = Author.objects.create(full_name="Лев Толстой")
+            self.war = self.make_book(title="Война и мир", author=self.tolstoy)
+            self.anna = self.make_book(title="Анна Каренина", author=self.tolstoy,
+                                       description="Роман о войне чувств")
+            self.other = self.make_book(title="Мастер и Маргарита")
+
+    def test_prefix_match_on_title_ranks_title_first(self):
+        results = list(search.search_books("войн"))
+        self.assertEqual(results, [self.war, self.anna])
+
+    def test_matches_author_and_genre(self):
+        self.assertEqual(set(search.search_books("толст")), {self.war, self.anna})
+        self.assertEqual(len(search.search_books("жанр тест")), 3)
+
+    def test_index_follows_author_rename_and_book_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tolstoy.full_name = "Л. Н. Толстой-Американец"
+            self.tolstoy.save()
+            self.anna.delete()
+        self.assertEqual(list(search.search_books("американец")), [self.war])
+
+    def test_search_view_is_paginated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12):
+                self.make_book(title=f"Сказка {i}")
+        response = self.client.get(reverse('search_books'), {'q': 'сказ'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 12)
+        self.assertEqual(len(page_obj), 10)
+        self.assertContains(response, '?q=%D1%81%D0%BA%D0%B0%D0%B7&amp;page=2')
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('3', out.getvalue())
+
+
+# ======================
+# Счётчики продаж и главная страница
+# ======================
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from .models import Order, BookStats
+from . import homepage
+
+
+# Проверяется кэш блоков главной, а не страничный кэш над ним (см. PageCacheTests)
+@override_settings(SHOP_PAGE_CACHE=False)
+class HomepageTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.book = self.make_book()
+        self.order = Order.objects.create(user=self.user, delivery_address="Москва", payment_method="card")
+
+    def test_sales_counter_follows_order_items(self):
+        item = OrderItem.objects.create(order=self.order, book=self.book, quantity=3, price=self.book.price)
+        self.assertEqual(BookStats.objects.get(book=self.book).sold_count, 3)
+        item.quantity = 1
+        item.save()
+        self.assertEqual(BookStats.objects.get(book=self.book).sold_count, 1)
+        item.delete()
+        self.assertEqual(BookStats.objects.get(book=self.book).sold_count, 0)
+
+    def test_index_is_served_from_cache_until_invalidated(self):
+        other = self.make_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=self.order, book=self.book, quantity=1, price=self.book.price)
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        # Непроданная книга добирает блок после проданных
+        self.assertEqual(response.context['popular_books'], [self.book, other])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=self.order, book=other, quantity=5, price=other.price)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['popular_books'], [other, self.book])
+
+    def test_popular_block_is_topped_up_with_unsold_books(self):
+        other = self.make_book()
+        # Продаж нет — блок всё равно заполнен
+        self.assertEqual(homepage.popular_books(), [self.book, other])
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=self.order, book=other, quantity=1, price=other.price)
+        # Единственная проданная книга — первой, остальные места занимают непроданные
+        self.assertEqual(homepage.popular_books(), [other, self.book])
+        books = [self.make_book() for _ in range(homepage.BLOCK_SIZE)]
+        self.assertEqual(homepage.popular_books(), [other, self.book, *books[:homepage.BLOCK_SIZE - 2]])
+
+
+# ======================
+# Денормализованная статистика книг
+# ======================
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from rest_framework.test import APIClient
+
+from . import stats
+
+
+class BookStatsTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book()
+        self.other_user = get_user_model().objects.create_user(username='reader', password='12345')
+        order = Order.objects.create(user=self.user, delivery_address="Москва", payment_method="card")
+        OrderItem.objects.create(order=order, book=self.book, quantity=2, price=self.book.price)
+        OrderItem.objects.create(order=order, book=self.book, quantity=1, price=self.book.price)
+        Review.objects.create(book=self.book, user=self.user, text="Хорошо", rating=5)
+        Review.objects.create(book=self.book, user=self.other_user, text="Так себе", rating=2)
+        Favorite.objects.create(user=self.user, book=self.book)
+        Favorite.objects.create(user=self.other_user, book=self.book)
+
+    def test_counters_do_not_fan_out(self):
+        row = BookStats.objects.get(book=self.book)
+        self.assertEqual((row.sold_count, row.review_count, row.rating_sum, row.favorites_count), (3, 2, 7, 2))
+        self.assertEqual(row.avg_rating, 3.5)
+
+    def test_annotated_api_reads_stats_table(self):
+        self.make_book()  # книга без статистики
+        with self.assertNumQueries(1):
+            response = APIClient().get(reverse('books_annotated_api'))
+        data = {row['id']: row for row in response.data}
+        self.assertEqual(data[self.book.pk]['avg_rating'], 3.5)
+        self.assertEqual(data[self.book.pk]['sold_count'], 3)
+        self.assertEqual(data[self.book.pk]['favorites_count'], 2)
+        self.assertEqual(len(data), 2)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        BookStats.objects.filter(book=self.book).update(sold_count=10, favorites_count=0)
+        out = StringIO()
+        call_command('reconcile_stats', '--dry-run', stdout=out)
+        self.assertIn('sold_count: 10 -> 3', out.getvalue())
+        self.assertEqual(BookStats.objects.get(book=self.book).sold_count, 10)
+
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertEqual(stats.reconcile_book_stats(fix=False), [])
+        self.assertEqual(BookStats.objects.get(book=self.book).favorites_count, 2)
+
+    def test_delete_with_drifted_zero_counter(self):
+        # Запись в обход сигналов: счётчик остался нулём
+        third = get_user_model().objects.create_user(username='third', password='12345')
+        Favorite.objects.bulk_create([Favorite(user=third, book=self.book)])
+        BookStats.objects.filter(book=self.book).update(favorites_count=0, review_count=0, rating_sum=0, sold_count=0)
+        self.client.login(username='third', password='12345')
+        response = self.client.get(reverse('remove_from_favorites', args=[self.book.pk]))
+        self.assertLess(response.status_code, 500)
+        self.assertFalse(Favorite.objects.filter(user=third).exists())
+        Review.objects.filter(book=self.book).delete()
+        OrderItem.objects.filter(book=self.book).delete()
+        stats.add_sales_many([(self.book.pk, self.author.pk, -5)])
+        row = BookStats.objects.get(book=self.book)
+        self.assertEqual((row.sold_count, row.review_count, row.rating_sum, row.favorites_count), (0, 0, 0, 0))
+
+
+# ======================
+# API списка книг
+# ======================
+
+class BookListAPITests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books = [self.make_book(price=Decimal(100 + i)) for i in range(25)]
+            self.make_promo(self.books[0], '10')
+        self.api = APIClient()
+
+    def test_full_page_costs_one_query(self):
+        pricing.ensure_prices_current()
+        with self.assertNumQueries(1):
+            response = self.api.get(reverse('api_books'))
+        self.assertEqual(len(response.data['results']), 20)
+        first = response.data['results'][0]
+        self.assertEqual(first['author_name'], "Автор Тест")
+        self.assertEqual(first['category_name'], "Категория Тест")
+        self.assertEqual(first['discounted_price'], Decimal('90.00'))
+
+        response = self.api.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [book.pk for book in self.books[20:]])
+        self.assertIsNone(response.data['next'])
+
+    def test_sparse_fieldset_narrows_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(reverse('api_books'), {'fields': 'id,title,price', 'page_size': 5})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'price'})
+        self.assertEqual(len(response.data['results']), 5)
+        sql = queries[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('description', sql)
+
+
+# ======================
+# Потоковая выгрузка каталога
+# ======================
+
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import BookSerializer
+
+
+class BookExportTests(CatalogTestMixin, TestCase):
+
+    def test_feed_matches_serializer_contract(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            promoted = self.make_book(price=Decimal('333.33'))
+            self.make_promo(promoted, '15')
+        self.make_book(price=Decimal('120.50'))  # без строки BookPrice
+        response = self.client.get(reverse('api_books_export'))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        feed = [json.loads(line) for line in lines]
+
+        expected = json.loads(JSONRenderer().render(
+            BookSerializer(Book.objects.order_by('pk'), many=True).data
+        ))
+        self.assertEqual(feed, expected)
+        self.assertEqual(feed[0]['discounted_price'], 283.33)
+
+
+# ======================
+# Условные запросы (ETag / 304)
+# ======================
+
+from .models import CatalogVersion
+from . import versioning
+
+
+class ConditionalRequestTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = self.make_book()
+
+    def test_book_list_answers_304_without_queries(self):
+        response = self.client.get(reverse('book_list'))
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_book()
+        response = self.client.get(reverse('book_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_book_detail_depends_on_its_own_version(self):
+        other = self.make_book()
+        url = reverse('book_detail', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=other, user=self.user, text="Отлично", rating=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, user=self.user, text="Хорошо", rating=4)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_list_supports_if_none_match(self):
+        api = APIClient()
+        etag = api.get(reverse('api_books'))['ETag']
+        self.assertEqual(api.get(reverse('api_books'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.full_name = "Новое имя"
+            self.author.save()
+        self.assertEqual(api.get(reverse('api_books'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_api_etag_follows_sales(self):
+        url = reverse('api_authors')
+        api = APIClient()
+        etag = api.get(url)['ETag']
+        self.assertEqual(api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Продажа не меняет каталог, но меняет sold_count автора
+        order = Order.objects.create(user=self.user, delivery_address="Москва", payment_method="card")
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.create(order=order, book=self.book, quantity=3, price=self.book.price)
+        response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['sold_count'], 3)
+
+    def test_index_etag_follows_homepage_blocks(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Оформление заказа сбрасывает популярное, не трогая версию каталога
+        homepage.invalidate('popular_books')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_versions_are_monotonic(self):
+        before = CatalogVersion.objects.get(name=versioning.GLOBAL).version
+        versioning.bump(versioning.GLOBAL)
+        self.assertEqual(CatalogVersion.objects.get(name=versioning.GLOBAL).version, before + 1)
+
+
+# ======================
+# Справочник авторов
+# ======================
+
+from .models import AuthorStats
+
+
+class AuthorStatsTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book()
+        self.make_book()
+        order = Order.objects.create(user=self.user, delivery_address="Москва", payment_method="card")
+        OrderItem.objects.create(order=order, book=self.book, quantity=3, price=self.book.price)
+        Review.objects.create(book=self.book, user=self.user, text="Хорошо", rating=4)
+
+    def counters(self, author):
+        row = AuthorStats.objects.get(author=author)
+        return row.books_count, row.review_count, row.rating_sum, row.sold_count
+
+    def test_counters_follow_books_and_reviews(self):
+        self.assertEqual(self.counters(self.author), (2, 1, 4, 3))
+
+        other = Author.objects.create(full_name="Другой автор")
+        self.book.author = other
+        self.book.save()
+        self.assertEqual(self.counters(self.author), (1, 0, 0, 0))
+        self.assertEqual(self.counters(other), (1, 1, 4, 3))
+
+        Review.objects.filter(book=self.book).delete()
+        self.book.delete()
+        self.assertEqual(self.counters(other), (0, 0, 0, 0))
+
+    def test_api_is_paginated_without_per_author_queries(self):
+        for i in range(5):
+            Author.objects.create(full_name=f"Автор {i}")
+        versioning.get_versions([versioning.GLOBAL, versioning.AUTHOR_STATS])  # версии для ETag уже в кэше
+        # COUNT для пагинатора и одна страница с LEFT JOIN AuthorStats
+        with self.assertNumQueries(2):
+            response = APIClient().get(reverse('api_authors'), {'sort': '-books', 'page_size': 3})
+        self.assertEqual(response.data['count'], 6)
+        self.assertIsNotNone(response.data['next'])
+        first = response.data['results'][0]
+        self.assertEqual((first['id'], first['books_count'], first['avg_rating'], first['sold_count']),
+                         (self.author.pk, 2, 4.0, 3))
+
+    def test_html_directory_sorts_by_book_count(self):
+        Author.objects.create(full_name="Аааа")
+        response = self.client.get(reverse('author_list'), {'sort': '-books'})
+        self.assertEqual(response.context['page_obj'][0], self.author)
+        response = self.client.get(reverse('author_list'))
+        self.assertEqual(response.context['page_obj'][0].full_name, "Аааа")
+
+    def test_reconcile_fixes_author_drift(self):
+        AuthorStats.objects.filter(author=self.author).update(books_count=9)
+        self.assertEqual(stats.reconcile_author_stats(fix=False), [(self.author.pk, {'books_count': (9, 2)})])
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertEqual(self.counters(self.author), (2, 1, 4, 3))
+
+
+# ======================
+# Фоновая выгрузка в PDF
+# ======================
+
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock, skipIf
+
+from django.test import override_settings
+
+from .models import ExportJob
+from . import exports
+
+
+class ExportJobTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.books = [self.make_book() for _ in range(3)]
+
+    def test_admin_action_only_queues_job(self):
+        admin_user = get_user_model().objects.create_superuser(username='admin', password='12345')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('admin:shop_book_changelist'), {
+                'action': 'export_books_pdf',
+                '_selected_action': [book.pk for book in self.books[:2]],
+            })
+        self.assertEqual(response.status_code, 302)
+        job = ExportJob.objects.get()
+        self.assertEqual((job.status, job.total, sorted(job.book_ids)), ('pending', 2, [b.pk for b in self.books[:2]]))
+        self.assertEqual(callbacks, [])  # веб-воркер ничего не запускает
+
+    def test_queue_is_processed_by_command(self):
+        first = exports.start_export(Book.objects.filter(pk=self.books[0].pk))
+        second = exports.start_export()
+        out = StringIO()
+        call_command('export_books_pdf', queue=True, stdout=out)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.processed), ('done', 1))
+        self.assertEqual((second.status, second.processed), ('done', 3))
+        self.assertIsNone(exports.claim_next())
+        self.assertIn(f"Выгрузка #{second.pk}: 3 книг", out.getvalue())
+
+    def test_stale_running_job_is_failed(self):
+        stale = ExportJob.objects.create(status='running', heartbeat_at=timezone.now() - 2 * exports.STALE_AFTER)
+        alive = ExportJob.objects.create(status='running', heartbeat_at=timezone.now())
+        call_command('export_books_pdf', queue=True, stdout=StringIO(), stderr=StringIO())
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((stale.status, alive.status), ('failed', 'running'))
+        self.assertTrue(stale.error)
+        self.assertIsNotNone(stale.finished_at)
+
+    def test_run_export_writes_pdf_in_constant_queries(self):
+        job = ExportJob.objects.create(book_ids=None)
+        # задача, список id, статус, пачка книг с авторами, прогресс, завершение
+        with self.assertNumQueries(6):
+            exports.run_export(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.total, job.progress), ('done', 3, 3, 100))
+        with open(job.file.path, 'rb') as f:
+            self.assertTrue(f.read().startswith(b'%PDF'))
+
+    def test_parts_fall_back_to_zip_without_pypdf(self):
+        job = ExportJob.objects.create(book_ids=[b.pk for b in self.books])
+        parts = [
+            exports.render_part(job.pk, [self.books[0].pk], os.path.join(self.media, 'a.pdf')),
+            exports.render_part(job.pk, [b.pk for b in self.books[1:]], os.path.join(self.media, 'b.pdf')),
+        ]
+        with mock.patch.object(exports, 'PdfWriter', None):
+            path = exports.merge_parts(parts, os.path.join(self.media, 'books.pdf'))
+        self.assertTrue(path.endswith('books.zip'))
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(archive.namelist(), ['books-1.pdf', 'books-2.pdf'])
+        job.refresh_from_db()
+        self.assertEqual(job.processed, 3)
+
+    @skipIf(exports.PdfWriter is None, "pypdf не установлен")
+    def test_parts_are_merged_into_one_pdf(self):
+        job = ExportJob.objects.create(book_ids=[b.pk for b in self.books])
+        parts = [
+            exports.render_part(job.pk, [self.books[0].pk], os.path.join(self.media, 'a.pdf')),
+            exports.render_part(job.pk, [b.pk for b in self.books[1:]], os.path.join(self.media, 'b.pdf')),
+        ]
+        path = exports.merge_parts(parts, os.path.join(self.media, 'books.pdf'))
+        self.assertTrue(path.endswith('books.pdf'))
+        from pypdf import PdfReader
+        self.assertEqual(len(PdfReader(path).pages), 2)
+
+    def test_download_requires_admin(self):
+        job = ExportJob.objects.create(book_ids=[self.books[0].pk])
+        exports.run_export(job.pk)
+        url = reverse('admin:shop_exportjob_download', args=[job.pk])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(get_user_model().objects.create_superuser(username='admin', password='12345'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        response.close()
+
+
+# ======================
+# Массовая переоценка
+# ======================
+
+from django.db import transaction
+
+from .models import PriceChange, Repricing
+from . import repricing
+
+
+class RepricingTests(CatalogTestMixin, TestCase):
+
+    PRICES = ('0.05', '1.15', '10.05', '199.99', '333.33', '500.00')
+
+    def setUp(self):
+        super().setUp()
+        self.books = [self.make_book(price=Decimal(price)) for price in self.PRICES]
+
+    def prices(self):
+        return [book.price for book in Book.objects.order_by('pk')]
+
+    def test_sql_rounding_matches_decimal(self):
+        for kwargs in ({'percent': '-10'}, {'percent': '7.5'}, {'percent': '-33.33'}, {'amount': '-1.10'}):
+            rule = repricing.Rule(**kwargs)
+            expected = [rule.apply(price) for price in self.prices()]
+            with transaction.atomic():
+                repricing.reprice(Book.objects.all(), **kwargs)
+                self.assertEqual(self.prices(), expected, kwargs)
+                transaction.set_rollback(True)
+
+    def test_one_update_per_batch_with_history(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = repricing.reprice(Book.objects.filter(category=self.category), percent='-10', batch_size=4)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "shop_book"')]
+        self.assertEqual(len(updates), 2)
+        # 0.05 * 0.9 = 0.045 -> 0.05: цена не изменилась и в историю не попадает
+        self.assertEqual(result.count, 5)
+        self.assertEqual(Repricing.objects.get().books_count, 5)
+        self.assertFalse(PriceChange.objects.filter(book=self.books[0]).exists())
+        change = PriceChange.objects.get(book=self.books[1])
+        self.assertEqual((change.old_price, change.new_price), (Decimal('1.15'), Decimal('1.04')))
+        # материализованная цена пересчитана вместе с ценой
+        self.assertEqual(BookPrice.objects.get(book=self.books[1]).effective_price, Decimal('1.04'))
+
+    def test_failure_midway_rolls_back_whole_run(self):
+        calls = []
+
+        def refresh(book_ids):
+            calls.append(book_ids)
+            if len(calls) == 2:
+                raise RuntimeError("сбой во второй пачке")
+
+        with mock.patch.object(repricing, 'refresh_book_prices', refresh), self.assertRaises(RuntimeError):
+            repricing.reprice(Book.objects.all(), percent='-10', batch_size=3)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.prices(), [Decimal(price) for price in self.PRICES])
+        self.assertFalse(Repricing.objects.exists())
+        self.assertFalse(PriceChange.objects.exists())
+
+    def test_book_pages_change_but_dimensions_stay_cached(self):
+        url = reverse('book_detail', args=[self.books[1].pk])
+        etag = self.client.get(url)['ETag']
+        dimensions = CatalogVersion.objects.filter(name=versioning.DIMENSIONS).values_list('version', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            repricing.reprice(Book.objects.all(), percent='-10')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(
+            CatalogVersion.objects.filter(name=versioning.DIMENSIONS).values_list('version', flat=True).first(),
+            dimensions,
+        )
+
+    def test_dry_run_writes_nothing(self):
+        result = repricing.reprice(Book.objects.filter(price__gte=100), amount='10', dry_run=True)
+        self.assertEqual((result.count, result.new_total - result.old_total), (3, Decimal('30.00')))
+        self.assertEqual(self.prices(), [Decimal(price) for price in self.PRICES])
+        self.assertFalse(Repricing.objects.exists())
+
+    def test_rejects_invalid_rule(self):
+        with self.assertRaises(repricing.RepricingError):
+            repricing.Rule(percent='-150')
+        with self.assertRaises(repricing.RepricingError):
+            repricing.Rule(percent='10', amount='5')
+
+    def test_view_requires_staff_and_post(self):
+        url = reverse('apply_discount')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url, {'percent': '-10'}).status_code, 302)
+        self.assertEqual(self.prices(), [Decimal(price) for price in self.PRICES])
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.client.post(url, {'percent': '-10', 'min_price': '100'})
+        self.assertEqual(self.prices()[3:], [Decimal('179.99'), Decimal('300.00'), Decimal('450.00')])
+        self.assertEqual(self.prices()[0], Decimal('0.05'))
+
+
+# ======================
+# Генератор синтетического каталога
+# ======================
+
+from . import stock
+from .models import BookStock, StockReservation
+
+class GenerateCatalogTests(TestCase):
+
+    def generate(self, **options):
+        options = {
+            'books': 200, 'authors': 20, 'genres': 3, 'categories': 3, 'series': 5, 'users': 30,
+            'order_items': 600, 'reviews': 300, 'favorites': 200, 'promotions': 4, 'batch_size': 64,
+            **options,
+        }
+        call_command('generate_catalog', stdout=StringIO(), **options)
+
+    def test_counts_skew_and_derived_tables(self):
+        self.generate()
+        self.assertEqual(Book.objects.count(), 200)
+        self.assertEqual(OrderItem.objects.count(), 600)
+        self.assertEqual(Order.objects.count(), 200)
+        # самая продаваемая книга заметно опережает медиану
+        sold = sorted(BookStats.objects.values_list('sold_count', flat=True), reverse=True)
+        self.assertGreater(sold[0], 10 * sold[len(sold) // 2])
+        # производные таблицы согласованы без сигналов
+        self.assertEqual(stats.reconcile_book_stats(fix=False), [])
+        self.assertEqual(stats.reconcile_author_stats(fix=False), [])
+        self.assertEqual(BookPrice.objects.count(), 200)
+
+    def test_same_seed_gives_same_data(self):
+        self.generate(seed=7)
+        first = list(Book.objects.order_by('pk').values_list('title', 'author_id', 'price'))
+        self.generate(seed=7, flush=True)
+        second = list(Book.objects.order_by('pk').values_list('title', 'author_id', 'price'))
+        self.assertEqual(first, second)
+
+    def test_flush_keeps_versions_growing(self):
+        names = [versioning.GLOBAL, versioning.DIMENSIONS]
+        self.generate(seed=7)
+        first = dict(CatalogVersion.objects.filter(name__in=names).values_list('name', 'version'))
+        self.generate(seed=7, flush=True)
+        second = dict(CatalogVersion.objects.filter(name__in=names).values_list('name', 'version'))
+        # Иначе кэш страниц и справочников под прежними версиями отдал бы удалённые строки
+        for name in names:
+            self.assertGreater(second[name], first[name])
+
+    def test_flush_removes_stock_and_reservations(self):
+        self.generate()
+        book_id = Book.objects.order_by('pk').values_list('pk', flat=True).first()
+        stock.set_stock(book_id, 5)
+        stock.reserve(get_user_model().objects.order_by('pk').first(), book_id)
+        self.generate(flush=True)
+        self.assertFalse(BookStock.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Book.objects.count(), 200)
+
+
+# ======================
+# Бенчмарк представлений
+# ======================
+
+from .management.commands import bench_views
+
+
+class BenchViewsTests(CatalogTestMixin, TestCase):
+
+    def test_rows_fetched_counts_select_results(self):
+        for _ in range(3):
+            self.make_book()
+        with CaptureQueriesContext(connection) as ctx:
+            list(Book.objects.all())
+            Book.objects.filter(pk=0).update(title="x")
+        self.assertEqual(bench_views._rows_fetched(ctx.captured_queries), 3)
+
+    def test_check_compares_with_budgets_and_baseline(self):
+        config = {
+            'budgets': {'book_list': {'queries': 3, 'rows': 20, 'p95_ms': 100}},
+            'baseline': {'1000': {'book_list': {'queries': 2, 'rows': 13, 'p95_ms': 10}}},
+            'latency_tolerance': 1.5, 'latency_slack_ms': 5,
+        }
+        ok = {'1000': {'book_list': {'queries': 2, 'rows': 13, 'p95_ms': 19}}}
+        self.assertEqual(bench_views.Command()._check(ok, config), [])
+        slow = {'1000': {'book_list': {'queries': 3, 'rows': 13, 'p95_ms': 21}}}
+        violations = bench_views.Command()._check(slow, config)
+        self.assertEqual(len(violations), 2)
+        self.assertIn('queries 3 > базы 2', violations[0])
+
+
+# ======================
+# Инструментирование SQL
+# ======================
+
+from django.template import Context, Template
+
+from .middleware import QueryRecorder, fingerprint
+
+
+class QueryInstrumentationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            author = Author.objects.create(full_name=f"Автор {i}")
+            self.make_book(author=author)
+
+    def record(self, func):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            func()
+        return recorder
+
+    def test_fingerprint_ignores_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE id IN (%s, %s) AND x = \'a\' LIMIT 21'),
+            fingerprint('SELECT * FROM "t" WHERE id IN (%s) AND x = \'b\'  LIMIT 5'),
+        )
+
+    def test_template_line_is_flagged(self):
+        template = Template("{% for b in books %}\n{{ b.author.full_name }}\n{% endfor %}")
+        recorder = self.record(lambda: template.render(Context({'books': Book.objects.all()})))
+        suspects = recorder.suspects(threshold=5)
+        self.assertEqual(len(suspects), 1)
+        self.assertEqual(suspects[0]['count'], 6)
+        self.assertTrue(suspects[0]['origin'].endswith(':2'))
+
+    def test_serializer_field_is_flagged(self):
+        recorder = self.record(lambda: BookSerializer(Book.objects.all(), many=True).data)
+        origins = {suspect['origin'] for suspect in recorder.suspects(threshold=5)}
+        self.assertIn('BookSerializer.author_name', origins)
+
+    def test_select_related_is_clean(self):
+        pricing.refresh_book_prices()
+        recorder = self.record(lambda: BookSerializer(pricing.with_prices(Book.objects.select_related('author', 'category')), many=True).data)
+        self.assertEqual(recorder.suspects(threshold=5), [])
+
+    @override_settings(SHOP_SQL_SAMPLE_RATE=1.0)
+    def test_middleware_sets_server_timing_and_logs(self):
+        with self.assertLogs('shop.sql', level='INFO') as logs:
+            response = self.client.get(reverse('book_list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['path'], line['status'], line['n_plus_one']), ('/books/', 200, []))
+
+    @override_settings(SHOP_SQL_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('book_list')))
+
+
+# ======================
+# Расчёт корзины
+# ======================
+
+from . import cart
+
+
+class CartPricingTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = [self.make_book(price=Decimal('100.00') + i) for i in range(20)]
+        self.make_promo(self.books[0], 10)
+        self.make_promo(self.books[1], 50)
+        Cart.objects.bulk_create([Cart(user=self.user, book=book, quantity=2) for book in self.books])
+        pricing.refresh_book_prices()  # в TestCase on_commit-сигналы не срабатывают
+        pricing.ensure_prices_current()
+
+    def test_whole_cart_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = cart.price_cart(self.user)
+            [(line.promo, line.price, line.total_price) for line in summary]
+        self.assertEqual(len(summary), 20)
+        self.assertEqual(summary.items_count, 40)
+        self.assertEqual(summary.lines[0].price, Decimal('90.00'))
+        self.assertEqual(summary.discount, Decimal('20.00') + Decimal('101.00'))
+        self.assertEqual(summary.total, summary.subtotal - summary.discount)
+
+    def test_books_without_price_index_cost_one_more_query(self):
+        BookPrice.objects.all().delete()
+        with self.assertNumQueries(2):
+            summary = cart.price_cart(self.user)
+        self.assertEqual(summary.lines[1].price, Decimal('50.50'))
+
+    def test_totals_aggregate_matches_lines(self):
+        summary = cart.price_cart(self.user)
+        with self.assertNumQueries(1):
+            totals = cart.cart_totals(self.user)
+        self.assertEqual(totals, {'items_count': 40, 'subtotal': summary.subtotal, 'total': summary.total})
+        BookPrice.objects.filter(book=self.books[1]).delete()
+        self.assertEqual(cart.cart_totals(self.user)['total'], summary.total)
+
+    def test_cart_page_and_api(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(3):  # сессия, пользователь, корзина
+            response = self.client.get(reverse('cart_detail'))
+        self.assertContains(response, "Итого: 4259,00")
+        api = APIClient()
+        api.force_authenticate(self.user)
+        data = api.get(reverse('api_cart')).data
+        self.assertEqual((data['total'], data['lines'][0]['promotion']), ('4259.00', "Скидка 10"))
+        self.assertEqual(api.get(reverse('api_cart_totals')).data['total'], '4259.00')
+
+
+# ======================
+# Корзина гостя
+# ======================
+
+from django.contrib.auth import login as auth_login
+from django.test import RequestFactory
+
+
+class AnonymousCartTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = [self.make_book(price=Decimal('100.00')) for _ in range(3)]
+        pricing.refresh_book_prices()
+
+    def guest_add(self, book, times=1):
+        for _ in range(times):
+            response = self.client.get(reverse('add_to_cart', args=[book.pk]))
+        return response
+
+    def test_guest_cart_lives_in_cache(self):
+        with self.assertNumQueries(1):  # только проверка, что книга есть
+            response = self.guest_add(self.books[0])
+        token = response.cookies[cart.COOKIE_NAME].value
+        self.guest_add(self.books[0])
+        self.guest_add(self.books[1])
+        self.assertEqual(cache.get(cart.CACHE_PREFIX + token), {self.books[0].pk: 2, self.books[1].pk: 1})
+        self.assertFalse(Cart.objects.exists())
+        self.assertContains(self.client.get(reverse('cart_detail')), "Итого: 300,00")
+        self.assertEqual(self.client.get(reverse('api_cart_totals')).data['items_count'], 3)
+
+        self.client.get(reverse('remove_from_cart', args=[self.books[0].pk]))
+        self.assertEqual(cache.get(cart.CACHE_PREFIX + token), {self.books[1].pk: 1})
+        self.assertEqual(self.client.get(reverse('remove_from_cart', args=[self.books[0].pk])).status_code, 404)
+
+    def test_login_merges_guest_cart(self):
+        Cart.objects.create(user=self.user, book=self.books[0], quantity=1)
+        self.guest_add(self.books[0], times=2)
+        self.guest_add(self.books[2])
+        token = self.client.cookies[cart.COOKIE_NAME].value
+        request = RequestFactory().get('/')
+        request.COOKIES[cart.COOKIE_NAME] = token
+        request.session = self.client.session
+        auth_login(request, self.user)
+        self.assertEqual(
+            dict(Cart.objects.filter(user=self.user).values_list('book_id', 'quantity')),
+            {self.books[0].pk: 3, self.books[2].pk: 1},
+        )
+        self.assertIsNone(cache.get(cart.CACHE_PREFIX + token))
+
+    def test_merge_is_one_upsert(self):
+        self.guest_add(self.books[0])
+        request = RequestFactory().get('/')
+        request.COOKIES = dict((key, morsel.value) for key, morsel in self.client.cookies.items())
+        with self.assertNumQueries(5):  # savepoint, корзина пользователя, книги, upsert, release
+            cart.merge_anonymous_cart(request, self.user)
+
+    def test_user_add_is_atomic_increment(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('add_to_cart', args=[self.books[0].pk]))
+        self.client.get(reverse('add_to_cart', args=[self.books[0].pk]))
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 2)
+        self.client.get(reverse('remove_from_cart', args=[self.books[0].pk]))
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.get(reverse('add_to_cart', args=[999])).status_code, 404)
+
+
+# ======================
+# Оформление заказа
+# ======================
+
+from .checkout import CheckoutError, checkout
+from .models import Order, OrderItem
+
+
+class CheckoutTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = [self.make_book(price=Decimal('100.00')) for _ in range(10)]
+        self.make_promo(self.books[0], 10)
+        Cart.objects.bulk_create([Cart(user=self.user, book=book, quantity=2) for book in self.books])
+        pricing.refresh_book_prices()
+        pricing.ensure_prices_current()
+
+    def test_cart_becomes_order_in_constant_queries(self):
+        # ключ, savepoint, корзина, резервы, остатки (2), заказ, позиции, 4 на счётчики,
+        # 2 на версию счётчиков авторов, корзина, release
+        with self.assertNumQueries(16):
+            order, created = checkout(self.user, "Москва", 'card', 'key-1')
+        self.assertTrue(created)
+        self.assertEqual(order.total, Decimal('1980.00'))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 10)
+        self.assertEqual(OrderItem.objects.get(order=order, book=self.books[0]).price, Decimal('90.00'))
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(BookStats.objects.get(book=self.books[0]).sold_count, 2)
+        self.assertEqual(AuthorStats.objects.get(author=self.author).sold_count, 20)
+
+    def test_retry_with_same_key_returns_same_order(self):
+        order, _ = checkout(self.user, "Москва", 'card', 'key-1')
+        Cart.objects.create(user=self.user, book=self.books[0], quantity=1)
+        with self.assertNumQueries(1):
+            again, created = checkout(self.user, "Москва", 'card', 'key-1')
+        self.assertEqual((again.pk, created), (order.pk, False))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_empty_cart_and_missing_fields(self):
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, "", 'card')
+        Cart.objects.all().delete()
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, "Москва", 'card')
+        self.assertFalse(Order.objects.exists())
+
+    def test_api_and_form(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        payload = {'delivery_address': "Москва", 'payment_method': 'card'}
+        response = api.post(reverse('api_checkout'), payload, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual((response.status_code, response.data['total']), (201, '1980.00'))
+        self.assertEqual(len(response.data['items']), 10)
+        self.assertEqual(api.post(reverse('api_checkout'), payload, HTTP_IDEMPOTENCY_KEY='abc').status_code, 200)
+        self.assertEqual(api.post(reverse('api_checkout'), payload).status_code, 400)
+
+        Cart.objects.create(user=self.user, book=self.books[1], quantity=1)
+        self.client.force_login(self.user)
+        key = self.client.get(reverse('cart_detail')).context['idempotency_key']
+        form = dict(payload, idempotency_key=key)
+        self.client.post(reverse('checkout'), form)
+        self.client.post(reverse('checkout'), form)
+        self.assertEqual(Order.objects.count(), 2)
+
+
+# ======================
+# Остатки и резервы
+# ======================
+
+from . import stock
+from .models import BookStock, StockReservation
+
+
+class StockTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book()
+        stock.set_stock(self.book.pk, 3)
+
+    def quantity(self):
+        return BookStock.objects.get(book=self.book).quantity
+
+    def test_conditional_decrement_never_oversells(self):
+        with transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 2})
+        with self.assertRaises(stock.OutOfStock), transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 2})
+        self.assertEqual(self.quantity(), 1)
+        with transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 1})
+        self.book.refresh_from_db()
+        self.assertEqual((self.quantity(), self.book.status), (0, 'out_of_stock'))
+        stock.restock(self.book.pk, 5)
+        self.book.refresh_from_db()
+        self.assertEqual((self.quantity(), self.book.status), (5, 'available'))
+
+    def test_multi_book_shortage_rolls_back(self):
+        other = self.make_book()
+        untracked = self.make_book()
+        stock.set_stock(other.pk, 1)
+        with self.assertRaises(stock.OutOfStock), transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 1, other.pk: 2, untracked.pk: 10})
+        self.assertEqual((self.quantity(), BookStock.objects.get(book=other).quantity), (3, 1))
+        with transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 1, other.pk: 1, untracked.pk: 10})
+        self.assertEqual((self.quantity(), BookStock.objects.get(book=other).quantity), (2, 0))
+
+    def test_reservations_hold_and_expire(self):
+        other_user = get_user_model().objects.create_user(username='other')
+        stock.reserve(self.user, self.book.pk, 2)
+        self.assertEqual(self.quantity(), 1)
+        with self.assertRaises(stock.OutOfStock):
+            stock.reserve(other_user, self.book.pk, 2)
+        # Резерв покупателя засчитывается при оформлении
+        with transaction.atomic():
+            stock.consume(self.user, {self.book.pk: 3})
+        self.assertEqual((self.quantity(), StockReservation.objects.count()), (0, 0))
+
+        stock.restock(self.book.pk, 2)
+        stale = stock.reserve(self.user, self.book.pk, 2, ttl=datetime.timedelta(seconds=-1))
+        self.assertEqual(self.quantity(), 0)
+        # Нехватка освобождает брошенный резерв
+        fresh = stock.reserve(other_user, self.book.pk, 1)
+        self.assertFalse(StockReservation.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(self.quantity(), 1)
+        stock.release(fresh)
+        self.assertEqual(self.quantity(), 2)
+
+    def test_checkout_and_api(self):
+        Cart.objects.create(user=self.user, book=self.book, quantity=4)
+        pricing.refresh_book_prices()
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, "Москва", 'card')
+        self.assertEqual((self.quantity(), Order.objects.count()), (3, 0))
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post(reverse('api_reserve', args=[self.book.pk]), {'quantity': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(api.post(reverse('api_reserve', args=[self.book.pk])).status_code, 409)
+        self.assertEqual(api.delete(reverse('api_reservation', args=[response.data['id']])).status_code, 204)
+        self.assertEqual(self.quantity(), 3)
+
+        Cart.objects.filter(user=self.user).update(quantity=3)
+        checkout(self.user, "Москва", 'card')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.status, 'out_of_stock')
+
+
+# ======================
+# Уменьшенные копии обложек
+# ======================
+
+import io
+import random
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import override_settings
+from PIL import Image
+
+from . import renditions
+
+
+class RenditionTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        # Шумное изображение сжимается плохо — как настоящая фотография обложки
+        noise = random.Random(1).randbytes(1500 * 2250 * 3)
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (1500, 2250), noise).save(buffer, 'JPEG', quality=95)
+        self.original_size = buffer.tell()
+        self.book = self.make_book(cover=SimpleUploadedFile('cover.jpg', buffer.getvalue()))
+
+    def render(self, size):
+        return Template("{% load renditions %}{% rendition book.cover size alt='x' %}").render(
+            Context({'book': self.book, 'size': size})
+        )
+
+    def test_generates_small_jpeg_and_webp(self):
+        self.assertEqual(renditions.generate(self.book.cover.name, 'card'), 4)
+        self.assertEqual(renditions.generate(self.book.cover.name, 'card'), 0)
+        for density, fmt in renditions.VARIANTS:
+            with default_storage.open(renditions.variant_name(self.book.cover.name, 'card', density, fmt)) as f:
+                image = Image.open(f)
+                self.assertEqual((image.size, image.format), ((420 * density, 250 * density), fmt.upper().replace('JPG', 'JPEG')))
+                # Карточка каталога легче оригинала на порядок
+                self.assertLess(f.size * 10, self.original_size)
+        renditions.generate(self.book.cover.name, 'detail')
+        with default_storage.open(renditions.variant_name(self.book.cover.name, 'detail', 1, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (400, 600))
+
+    def test_tag_falls_back_to_lazy_view(self):
+        with mock.patch.object(renditions, 'schedule') as schedule:
+            html = self.render('thumb')
+        schedule.assert_called_once_with(self.book.cover.name)
+        lazy = reverse('rendition', args=['thumb', 2, 'webp', self.book.cover.name])
+        self.assertIn(f'{lazy} 2x', html)
+        self.assertNotIn(self.book.cover.url, html)
+
+        response = self.client.get(lazy)
+        variant = renditions.variant_name(self.book.cover.name, 'thumb', 2, 'webp')
+        self.assertRedirects(response, default_storage.url(variant), fetch_redirect_response=False)
+        html = self.render('thumb')
+        self.assertIn(f'srcset="{default_storage.url(variant.replace("-2x", "-1x"))} 1x', html)
+        self.assertIn('height="90" loading="lazy" width="60"', html)
+
+    def test_rejects_foreign_paths(self):
+        for args in (['thumb', 1, 'jpg', '../db.sqlite3'], ['huge', 1, 'jpg', self.book.cover.name],
+                     ['thumb', 3, 'jpg', self.book.cover.name], ['thumb', 1, 'jpg', 'books/missing.jpg']):
+            self.assertEqual(self.client.get(reverse('rendition', args=args)).status_code, 404)
+
+    def test_protected_book_files_are_not_sources(self):
+        default_storage.save('books/files/book.pdf', ContentFile(b'%PDF-1.4'))
+        for source in ('books/files/book.pdf', 'books/files/../files/book.pdf', 'authors/x/photo.jpg'):
+            self.assertFalse(renditions.is_allowed_source(source), source)
+            self.assertEqual(self.client.get(reverse('rendition', args=['thumb', 1, 'jpg', source])).status_code, 404)
+        self.assertTrue(renditions.is_allowed_source(self.book.cover.name))
+        self.assertFalse(default_storage.exists('renditions/books/files'))
+
+    def test_missing_image_uses_default(self):
+        self.book.cover = None
+        self.assertIn('shop/img/default_cover.jpg', self.render('card'))
+
+
+# ======================
+# Скачивание файлов книг
+# ======================
+
+class BookDownloadTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.content = bytes(range(256)) * 40
+        self.book = self.make_book(file=SimpleUploadedFile('book.pdf', self.content))
+        order = Order.objects.create(user=self.user, delivery_address="-", payment_method='card')
+        OrderItem.objects.create(order=order, book=self.book, quantity=1, price=self.book.price)
+        self.url = reverse('download_book', args=[self.book.pk])
+        self.client.force_login(self.user)
+
+    def test_only_buyers_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        other = get_user_model().objects.create_user(username='stranger')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        Order.objects.update(status='cancelled')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_range_and_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        # If-Range с устаревшим ETag — файл целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.content)}'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(SHOP_DOWNLOAD_OFFLOAD='x-accel-redirect')
+    def test_offload_to_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.book.file.name)
+        self.assertEqual(response.content, b'')
+        with override_settings(SHOP_DOWNLOAD_OFFLOAD='x-sendfile'):
+            self.assertEqual(self.client.get(self.url)['X-Sendfile'], self.book.file.path)
+
+    def test_parse_range(self):
+        from .downloads import RangeNotSatisfiable, parse_range
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=10-', 10)
+
+
+# ======================
+# Двухуровневый кэш справочников
+# ======================
+
+import threading
+
+
+class CachingTests(CatalogTestMixin, TestCase):
+
+    def test_lru_evicts_least_recently_used(self):
+        lru = caching.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_concurrent_misses_fill_once(self):
+        calls = []
+        started = threading.Event()
+
+        def fill():
+            calls.append(1)
+            started.wait(1)  # держим заполнение, пока остальные потоки подходят к ключу
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.get_or_fill('shop:test:key', fill)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['value'] * 8))
+        self.assertEqual(django_cache.get('shop:test:key'), 'value')
+
+    def test_cards_read_authors_from_cache(self):
+        book = self.make_book()
+        caching.dimension('author')
+        caching.dimension('genre')
+        caching.dimension('series')
+        with self.assertNumQueries(1):
+            [loaded] = caching.attach_dimensions(Book.objects.filter(pk=book.pk), 'author', 'genre', 'series')
+            self.assertEqual((loaded.author.full_name, loaded.genre.name, loaded.series), ("Автор Тест", "Жанр Тест", None))
+
+        # Новая версия справочников — новый ключ; LRU этого процесса сброшен сигналом
+        self.author.full_name = "Переименован"
+        self.author.save()
+        versioning._cache_versions([versioning.DIMENSIONS])  # то, что делает on_commit
+        self.assertContains(self.client.get(reverse('book_list')), "Переименован")
+
+        # Автор, которого ещё нет в кэше, дочитывается одним запросом
+        newcomer = self.make_book(author=Author.objects.create(full_name="Новичок"))
+        caching.local.clear()
+        django_cache.set(caching._dimension_key('author'), {self.author.pk: self.author})
+        self.assertEqual(caching.attach_dimensions([newcomer], 'author')[0].author.full_name, "Новичок")
+
+
+# ======================
+# Кэш страниц для гостей
+# ======================
+
+from . import pagecache
+from . import versioning
+
+
+class PageCacheTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book()
+
+    def test_second_anonymous_hit_skips_database(self):
+        first = self.client.get(reverse('book_list'))
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('book_list'))
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertContains(second, self.book.title)
+
+    def test_csrf_token_is_per_visitor(self):
+        self.client.get(reverse('book_list'))
+        response = self.client.get(reverse('book_list'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotContains(response, pagecache.CSRF_PLACEHOLDER.decode())
+        token = response.cookies['csrftoken'].value
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value="')
+        # Токен в форме проходит проверку CSRF для этого посетителя
+        client = Client(enforce_csrf_checks=True)
+        client.cookies = self.client.cookies
+        form_token = response.content.decode().split('name="csrfmiddlewaretoken" value="')[1].split('"')[0]
+        self.assertTrue(token)
+        login = client.post(reverse('login'), {
+            'username': 'buyer', 'password': '12345', 'csrfmiddlewaretoken': form_token,
+        })
+        self.assertNotEqual(login.status_code, 403)
+
+    def test_key_ignores_tracking_params_and_order(self):
+        url = reverse('search_books')
+        self.client.get(url, {'q': 'Книга', 'page': '1'})
+        response = self.client.get(url + '?utm_source=mail&page=1&q=Книга')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(url, {'q': 'Другое'})['X-Page-Cache'], 'miss')
+
+    def test_catalog_change_invalidates_pages(self):
+        self.client.get(reverse('book_list'))
+        self.client.get(reverse('book_detail', args=[self.book.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Новое название"
+            self.book.save()
+        response = self.client.get(reverse('book_list'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, "Новое название")
+        self.assertContains(self.client.get(reverse('book_detail', args=[self.book.pk])), "Новое название")
+
+    def test_review_invalidates_only_its_book(self):
+        other = self.make_book()
+        self.client.get(reverse('book_detail', args=[self.book.pk]))
+        self.client.get(reverse('book_detail', args=[other.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, user=self.user, text="Отличная книга", rating=5)
+        response = self.client.get(reverse('book_detail', args=[self.book.pk]))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, "Отличная книга")
+        self.assertEqual(self.client.get(reverse('book_detail', args=[other.pk]))['X-Page-Cache'], 'hit')
+
+    def test_index_follows_homepage_invalidation(self):
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('index'))['X-Page-Cache'], 'hit')
+        homepage.invalidate()
+        self.assertEqual(self.client.get(reverse('index'))['X-Page-Cache'], 'miss')
+
+    def test_authenticated_users_get_personal_pages(self):
+        self.client.get(reverse('book_list'))
+        self.client.login(username='buyer', password='12345')
+        response = self.client.get(reverse('book_list'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertContains(response, reverse('add_to_cart', args=[self.book.pk]))
+        self.assertContains(response, "Привет, buyer!")
+
+
+# ======================
+# Профиль SQLite и маршрутизация чтений
+# ======================
+
+import sqlite3
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase
+
+from . import database
+
+
+class DatabaseProfileTests(CatalogTestMixin, TestCase):
+
+    def test_connection_gets_pragmas(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for name in ('synchronous', 'busy_timeout', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        # synchronous=NORMAL — 1, temp_store=MEMORY — 2 (WAL и mmap у тестовой базы в памяти не применяются)
+        self.assertEqual(values, {'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -64 * 1024, 'temp_store': 2})
+
+    def test_writes_and_transactions_stay_on_primary(self):
+        router = database.ReadReplicaRouter()
+        with override_settings(SHOP_DB_REPLICA='readonly'):
+            self.assertEqual(router.db_for_write(Book), 'default')
+            # TestCase держит открытую транзакцию — чтения остаются в основном соединении
+            self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'shop'))
+
+
+# Снимок снимается вне транзакции: backup API ждёт, пока источник отпустит блокировку записи
+class DatabaseSnapshotTests(CatalogTestMixin, TransactionTestCase):
+
+    def test_snapshot_is_consistent_copy(self):
+        self.make_book()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'replica.sqlite3')
+            call_command('snapshot_database', path, stdout=StringIO())
+            snapshot = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                self.assertEqual(snapshot.execute('SELECT COUNT(*) FROM shop_book').fetchone(), (1,))
+                self.assertEqual(snapshot.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+            finally:
+                snapshot.close()
+            self.assertFalse(os.path.exists(path + '.tmp'))
+
+
+class ReadReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = database.ReadReplicaRouter()
+
+    def test_reads_go_to_replica_when_configured(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        with override_settings(SHOP_DB_REPLICA='readonly'):
+            self.assertEqual(self.router.db_for_read(Book), 'replica')
+            self.assertEqual(self.router.db_for_read(Cart), 'replica')
+
+    def view(self, request):
+        # Страница, которая читает книгу и корзину: какие соединения выбрал маршрутизатор
+        response = HttpResponse()
+        response['X-Routes'] = f'{self.router.db_for_read(Book)},{self.router.db_for_read(Cart)}'
+        response['ETag'] = '"catalog"'
+        return response
+
+    def test_snapshot_serves_only_catalog_in_read_only_pages(self):
+        view = database.snapshot_reads(self.view)
+        with override_settings(SHOP_DB_REPLICA='/var/lib/bookie/replica.sqlite3'):
+            # Вне помеченных страниц (проверка форм, команды) — основная база
+            self.assertEqual(self.router.db_for_read(Book), 'default')
+            response = view(RequestFactory().get('/books/'))
+            self.assertEqual(response['X-Routes'], 'replica,default')
+            self.assertFalse(response.has_header('ETag'))
+            self.assertFalse(database.read_from_snapshot())
+            self.assertEqual(view(RequestFactory().post('/books/'))['X-Routes'], 'default,default')
+            self.assertEqual(self.router.db_for_read(get_user_model()), 'default')
+
+    def test_writer_reads_primary_until_snapshot_catches_up(self):
+        middleware = database.PrimaryAfterWriteMiddleware(lambda request: HttpResponse())
+        view = database.snapshot_reads(self.view)
+        with override_settings(SHOP_DB_REPLICA='/var/lib/bookie/replica.sqlite3'):
+            cookie = middleware(RequestFactory().post('/books/create/')).cookies[database.READ_PRIMARY_COOKIE]
+            self.assertEqual(cookie['max-age'], database.STICKY_SECONDS)
+            request = RequestFactory().get('/books/')
+            request.COOKIES[database.READ_PRIMARY_COOKIE] = '1'
+            response = view(request)
+            self.assertEqual(response['X-Routes'], 'default,default')
+            self.assertEqual(response['ETag'], '"catalog"')
+        # Без снимка cookie не ставится
+        self.assertFalse(middleware(RequestFactory().post('/books/create/')).cookies)
+
+    def test_snapshot_pages_are_not_page_cached(self):
+        def page(request):
+            self.router.db_for_read(Book)
+            return HttpResponse('каталог')
+        view = database.snapshot_reads(pagecache.cache_anonymous_page(pagecache.catalog_names)(page))
+        with override_settings(SHOP_DB_REPLICA='/var/lib/bookie/replica.sqlite3'), \
+                mock.patch.object(versioning, 'get_versions', return_value={versioning.GLOBAL: (1, None)}), \
+                mock.patch.object(pagecache.cache, 'set') as cache_set:
+            view(RequestFactory().get('/books/'))
+        cache_set.assert_not_called()
+
+
+# ======================
+# Индексы и аудит планов запросов
+# ======================
+
+from .management.commands import audit_query_plans
+
+
+class QueryPlanTests(CatalogTestMixin, TestCase):
+
+    def test_problem_classification(self):
+        where = 'SELECT * FROM shop_cart WHERE user_id = 1'
+        self.assertEqual(audit_query_plans._problems('SCAN shop_cart', where), ["полный проход по shop_cart"])
+        # Выгрузка целиком и справочники — не замечание
+        self.assertEqual(audit_query_plans._problems('SCAN shop_book', 'SELECT * FROM shop_book ORDER BY id'), [])
+        self.assertEqual(audit_query_plans._problems('SCAN shop_genre', 'SELECT * FROM shop_genre WHERE id > 1'), [])
+        self.assertEqual(audit_query_plans._problems('SCAN shop_book USING INDEX shop_book_price_id_idx', where), [])
+        self.assertEqual(
+            audit_query_plans._problems('USE TEMP B-TREE FOR ORDER BY', where), ["временное B-дерево для order by"]
+        )
+
+    def test_catalog_pages_read_indexes_in_order(self):
+        for i in range(3):
+            self.make_book(price=Decimal(100 + i), status='available' if i else 'out_of_stock')
+        pricing.refresh_book_prices()
+        self.client.login(username='buyer', password='12345')
+        for url in (
+            reverse('book_list'), reverse('available_books'),
+            reverse('category_books', args=[self.category.pk]), reverse('author_list'),
+        ):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            for query in captured.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                problems = [
+                    problem for detail in audit_query_plans.explain(query['sql'])
+                    for problem in audit_query_plans._problems(detail, query['sql'])
+                ]
+                self.assertEqual(problems, [], f"{url}: {query['sql']}")
+
+
+# ======================
+# Фасеты каталога
+# ======================
+
+from django.http import QueryDict
+
+from . import versioning
+
+
+class FacetTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other_genre = Genre.objects.create(name="Другой жанр")
+        self.cheap = self.make_book(price=Decimal('250.00'), year=2019)
+        self.middle = self.make_book(price=Decimal('450.00'), genre=self.other_genre, status='out_of_stock')
+        self.expensive = self.make_book(price=Decimal('1200.00'))
+
+    def counts(self, filters, facet):
+        return {value: count for value, label, count in facets.facet_counts(filters)[facet]}
+
+    def test_normalize_merges_repeated_and_comma_values(self):
+        self.assertEqual(
+            facets.normalize(QueryDict('genre=3&genre=1,2&utm_source=mail&price=')),
+            {'genre': ('1', '2', '3')},
+        )
+
+    def test_counts_per_facet(self):
+        counts = facets.facet_counts({})
+        self.assertEqual(
+            {value: count for value, label, count in counts['genre']},
+            {self.genre.pk: 2, self.other_genre.pk: 1},
+        )
+        self.assertEqual(
+            [(label, count) for value, label, count in counts['price']],
+            [("до 300 ₽", 1), ("300–600 ₽", 1), ("от 1000 ₽", 1)],
+        )
+        self.assertEqual(self.counts({}, 'status'), {'available': 2, 'out_of_stock': 1})
+        self.assertEqual(self.counts({}, 'year'), {2020: 2, 2019: 1})
+
+    def test_selected_facet_keeps_its_alternatives(self):
+        filters = {'genre': (str(self.genre.pk),)}
+        # Свой фасет считается без своего фильтра, остальные — с ним
+        self.assertEqual(self.counts(filters, 'genre'), {self.genre.pk: 2, self.other_genre.pk: 1})
+        self.assertEqual(self.counts(filters, 'status'), {'available': 2})
+        self.assertEqual(
+            set(facets.filter_books({'genre': (str(self.genre.pk),), 'price': ('gte1000', 'lt300')})),
+            {self.cheap, self.expensive},
+        )
+
+    def test_second_call_is_served_from_cache(self):
+        facets.facet_counts({'genre': (str(self.genre.pk),)})
+        with self.assertNumQueries(0):
+            facets.facet_counts({'genre': (str(self.genre.pk),)})
+
+    def test_rare_combinations_are_not_cached(self):
+        filters = {'genre': (str(self.genre.pk),), 'year': ('2020',), 'status': ('available',)}
+        facets.facet_counts(filters)
+        version = versioning.get_versions([versioning.GLOBAL])[versioning.GLOBAL][0]
+        cached = {facet for facet in facets.FACETS if django_cache.get(facets._key(facet, filters, version))}
+        # У фасетов выбранных фильтров «прочих» фильтров два — они в кэше, у остальных три — нет
+        self.assertEqual(cached, {'genre', 'year', 'status'})
+
+    def test_catalog_change_updates_counts(self):
+        self.assertEqual(self.counts({}, 'genre')[self.genre.pk], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_book()
+        self.assertEqual(self.counts({}, 'genre')[self.genre.pk], 3)
+
+    def test_book_list_filters_by_id_and_shows_facets(self):
+        response = self.client.get(reverse('book_list'), {'genre': self.other_genre.pk})
+        self.assertContains(response, self.middle.title)
+        self.assertNotContains(response, self.cheap.title)
+        self.assertContains(response, "Другой жанр")
+        self.assertContains(response, "Сбросить фильтры")
+        # Фильтры входят в ключ кэша страниц
+        self.assertEqual(self.client.get(reverse('book_list'), {'genre': self.genre.pk})['X-Page-Cache'], 'miss')
+
+    def test_api_filters_and_facets(self):
+        url = reverse('api_books')
+        data = self.client.get(url, {'price': 'lt300'}).json()
+        self.assertNotIn('facets', data)
+        self.assertEqual([book['id'] for book in data['results']], [self.cheap.pk])
+        data = self.client.get(url, {'price': 'lt300', 'facets': '1'}).json()
+        self.assertIn({'value': 'lt300', 'label': "до 300 ₽", 'count': 1}, data['facets']['price'])
+
+    def test_out_of_range_and_malformed_ids_are_dropped(self):
+        self.assertEqual(
+            facets.normalize(QueryDict('genre=99999999999999999999,abc,-1,%s&price=cheap' % self.genre.pk)),
+            {'genre': (str(self.genre.pk),)},
+        )
+        for value in ('99999999999999999999', 'abc'):
+            response = self.client.get(reverse('book_list'), {'genre': value})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, self.middle.title)
+            self.assertNotContains(response, f'genre={value}')
+            self.assertEqual(self.client.get(reverse('api_books'), {'genre': value}).status_code, 400)
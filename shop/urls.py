@@ -16,6 +16,11 @@ urlpatterns = [
     path('books/available/', views.available_books, name='available_books'),
     path('books/category/<int:category_id>/', views.category_books, name='category_books'),
     path('books/<int:pk>/', views.book_detail, name='book_detail'),
+    path('books/<int:pk>/download/', views.download_book, name='download_book'),
+    path('books/reprice/', views.apply_discount, name='apply_discount'),
+
+    # Уменьшенные копии обложек (создаются при первом запросе)
+    path('renditions/<str:size>/<int:density>/<str:fmt>/<path:source>', views.rendition, name='rendition'),
 
     # CRUD автора 
     path('authors/', views.author_list, name='author_list'),
@@ -32,6 +37,7 @@ urlpatterns = [
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:book_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/checkout/', views.checkout, name='checkout'),
 
     # Избранное
     path('favorites/', views.favorites_list, name='favorites_list'),
@@ -54,4 +60,7 @@ urlpatterns = [
 
 # Подключение медиа-файлов для разработки
 if settings.DEBUG:
+    urlpatterns += [
+        path(settings.MEDIA_URL.lstrip('/') + 'books/files/<path:path>', views.protected_media),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
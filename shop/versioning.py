@@ -0,0 +1,122 @@
+"""
+Версии каталога для условных запросов (ETag / Last-Modified / 304).
+
+Глобальная версия и версии отдельных книг растут монотонно: их поднимают
+сигналы на изменение книг, авторов, жанров, категорий, акций и отзывов
+(см. shop.signals). Представления читают версии из кэша и отвечают 304
+раньше, чем выполняют запросы к каталогу.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import CatalogVersion
+
+GLOBAL = 'catalog'
+# Справочники (авторы, жанры, серии, категории) видны на странице каждой книги
+DIMENSIONS = 'dimensions'
+# Цены всех книг разом (массовая переоценка) — без сброса кэша справочников
+PRICES = 'prices'
+# Счётчики AuthorStats (продажи меняют их без изменения каталога) — справочник авторов в API
+AUTHOR_STATS = 'author_stats'
+
+CACHE_PREFIX = 'shop:version:'
+CACHE_TIMEOUT = 60 * 60
+
+
+def book_key(book_id):
+    return f'book:{book_id}'
+
+
+def _cache_versions(names):
+    rows = CatalogVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated_at')
+    cache.set_many({CACHE_PREFIX + name: (version, updated_at) for name, version, updated_at in rows}, CACHE_TIMEOUT)
+
+
+def bump(*names):
+    """Увеличивает версии; кэш обновляется после коммита транзакции."""
+    names = sorted(set(names))
+    if not names:
+        return
+    now = timezone.now()
+    CatalogVersion.objects.bulk_create(
+        [CatalogVersion(name=name, updated_at=now) for name in names], ignore_conflicts=True,
+    )
+    CatalogVersion.objects.filter(name__in=names).update(version=F('version') + 1, updated_at=now)
+    transaction.on_commit(lambda: _cache_versions(names))
+
+
+def get_versions(names):
+    """{ключ: (версия, время изменения)}; отсутствующие ключи — (0, None)."""
+    keys = {CACHE_PREFIX + name: name for name in names}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [name for name in names if name not in found]
+    if missing:
+        rows = {
+            name: (version, updated_at)
+            for name, version, updated_at in
+            CatalogVersion.objects.filter(name__in=missing).values_list('name', 'version', 'updated_at')
+        }
+        for name in missing:
+            found[name] = rows.get(name, (0, None))
+            # add(), а не set(): не затираем значение, записанное bump() после коммита
+            cache.add(CACHE_PREFIX + name, found[name], CACHE_TIMEOUT)
+    return found
+
+
+def request_versions(request, names):
+    # etag_func и last_modified_func вызываются для одного запроса — читаем версии один раз
+    memo = request.__dict__.setdefault('_catalog_versions', {})
+    key = tuple(names)
+    if key not in memo:
+        memo[key] = get_versions(names)
+    return memo[key]
+
+
+def _etag(request, names, extra=''):
+    versions = request_versions(request, names)
+    user = getattr(request, 'user', None)
+    parts = [
+        *(f'{name}={versions[name][0]}' for name in names),
+        extra,
+        timezone.localdate().isoformat(),  # акции меняются при смене даты
+        str(user.pk if user is not None and user.is_authenticated else 0),
+        request.META.get('HTTP_ACCEPT', ''),
+    ]
+    return hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _last_modified(request, names):
+    stamps = [updated_at for _, updated_at in request_versions(request, names).values() if updated_at]
+    return max(stamps) if stamps else None
+
+
+def versioned(names_func, extra_func=None):
+    """
+    Декоратор условного GET: names_func(request, *args, **kwargs) возвращает
+    ключи версий, от которых зависит ответ. extra_func(request) — метка
+    состояния вне версий (например, поколение блоков главной); она входит в
+    ETag, а Last-Modified тогда не отдаётся: времени её смены мы не знаем.
+    """
+    if extra_func is None:
+        return condition(
+            etag_func=lambda request, *args, **kwargs: _etag(request, names_func(request, *args, **kwargs)),
+            last_modified_func=lambda request, *args, **kwargs: _last_modified(
+                request, names_func(request, *args, **kwargs)
+            ),
+        )
+    return condition(
+        etag_func=lambda request, *args, **kwargs: _etag(
+            request, names_func(request, *args, **kwargs), str(extra_func(request))
+        ),
+    )
+
+
+catalog_condition = versioned(lambda request, *args, **kwargs: [GLOBAL])
+book_condition = versioned(lambda request, pk, **kwargs: [book_key(pk), DIMENSIONS, PRICES])
+author_directory_condition = versioned(lambda request, *args, **kwargs: [GLOBAL, AUTHOR_STATS])
+book_reviews_condition = versioned(lambda request, book_id, **kwargs: [book_key(book_id)])
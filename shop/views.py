@@ -1,34 +1,44 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
-from django.db.models import Count
+import uuid
 from decimal import Decimal
 
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation, ValidationError
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.views.decorators.http import require_POST, require_safe
 
-from .models import Book, Category, Author, PromoBook, Cart, Favorite, Review
+from .models import Book, Category, Author, Cart, Favorite, Review
 from .forms import AuthorForm, BookForm, ReviewForm
+from . import caching, cart, checkout as checkout_service, downloads, facets, homepage, renditions, repricing, search
+from .pagination import KeysetPaginator
+from .pricing import prime_prices, with_prices
+from .database import snapshot_reads
+from .pagecache import book_names, cache_anonymous_page, catalog_names
+from .versioning import GLOBAL, book_condition, catalog_condition, versioned
 
 
 # ======================
 # Основные views для книг
 # ======================
 
-def index(request):
-    # 1. Популярные книги: top-5 по количеству заказов
-    popular_books = Book.objects.annotate(order_count=Count('orderitem')).order_by('-order_count')[:5]
+def _homepage_generation(request):
+    return homepage.generation()
 
-    # 2. Новые поступления: последние 5 добавленных книг
-    new_books = Book.objects.all().order_by('-id')[:5]
 
-    # 3. Акции и скидки: книги с активными промо
-    promo_books = PromoBook.objects.select_related('book').all()[:5]
+# Блоки главной сбрасываются и без смены версии каталога (оформление заказа), поэтому поколение
+# блоков входит и в ETag, и в ключ кэша страницы
+@snapshot_reads
+@versioned(lambda request, *args, **kwargs: [GLOBAL], extra_func=_homepage_generation)
+@cache_anonymous_page(catalog_names, extra_func=_homepage_generation)
+def index(request):
+    # Популярные книги, новые поступления и акции — из кэша (shop.homepage)
+    return render(request, 'shop/index.html', homepage.get_blocks())
 
-    return render(request, 'shop/index.html', {
-        'popular_books': popular_books,
-        'new_books': new_books,
-        'promo_books': promo_books,
-    })
-    
 
 # =====================
 # Регистрация
@@ -68,39 +78,61 @@ def logout_view(request):
         logout(request)
     return redirect('index')
     
-# Добавление книги в корзину
+# Добавление книги в корзину: гостю — в кэш, пользователю — атомарный F()-инкремент
 def add_to_cart(request, book_id):
-    book = get_object_or_404(Book, pk=book_id)
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user,
-        book=book,
-        defaults={'quantity': 1}  # если объект новый, сразу ставим quantity = 1
-    )
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-    return redirect('cart_detail')
+    if not Book.objects.filter(pk=book_id).exists():
+        raise Http404
+    response = redirect('cart_detail')
+    if request.user.is_authenticated:
+        cart.add_item(request.user, book_id)
+        return response
+    anonymous = cart.AnonymousCart(request)
+    anonymous.add(book_id)
+    return anonymous.save(response)
 
 # Удаление книги из корзины
 def remove_from_cart(request, book_id):
-    cart_item = get_object_or_404(Cart, user=request.user, book_id=book_id)
-    cart_item.delete()
-    return redirect('cart_detail')
+    response = redirect('cart_detail')
+    if request.user.is_authenticated:
+        if not cart.remove_item(request.user, book_id):
+            raise Http404
+        return response
+    anonymous = cart.AnonymousCart(request)
+    if not anonymous.remove(book_id):
+        raise Http404
+    return anonymous.save(response)
 
 # Просмотр корзины
 def cart_detail(request):
-    items = Cart.objects.filter(user=request.user)
-    for item in items:
-        item.total_price = item.book.discounted_price * item.quantity
-
-    total = sum(item.total_price for item in items)
-
+    # Цены, скидки и итог всей корзины — фиксированное число запросов (shop.cart)
+    summary = cart.price_request_cart(request)
     return render(request, 'shop/cart.html', {
-        'items': items,
-        'total': total,
+        'items': summary,
+        'idempotency_key': uuid.uuid4().hex,
+        'summary': summary,
+        'total': summary.total,
     })
 
 
+# Оформление заказа: ключ идемпотентности выдаётся вместе со страницей корзины,
+# поэтому повторная отправка формы не создаёт второй заказ
+@login_required(login_url='login')
+@require_POST
+def checkout(request):
+    try:
+        order, created = checkout_service.checkout(
+            request.user,
+            delivery_address=request.POST.get('delivery_address', '').strip(),
+            payment_method=request.POST.get('payment_method', '').strip(),
+            idempotency_key=request.POST.get('idempotency_key') or None,
+        )
+    except checkout_service.CheckoutError as exc:
+        messages.error(request, f"Заказ не оформлен: {exc}")
+        return redirect('cart_detail')
+    messages.success(request, f"Заказ #{order.pk} оформлен на сумму {order.total} ₽")
+    return redirect('index')
+
+
 # Добавление книги в избранное
 def add_to_favorites(request, book_id):
     book = get_object_or_404(Book, pk=book_id)
@@ -117,7 +149,9 @@ def remove_from_favorites(request, book_id):
 
 # Список избранного
 def favorites_list(request):
-    favorites = Favorite.objects.filter(user=request.user).select_related('book')
+    favorites = Favorite.objects.filter(user=request.user).select_related(
+        'book__author', 'book__price_index__promotion'
+    )
     return render(request, 'shop/favorites.html', {'favorites': favorites})
 
 # Добавление отзыва
@@ -135,56 +169,88 @@ def add_review(request, book_id):
         form = ReviewForm()
     return render(request, 'shop/add_review.html', {'form': form, 'book': book})
 
-# Поиск книг по названию
+# Полнотекстовый поиск книг (название, автор, жанр, описание)
+@snapshot_reads
+@catalog_condition
+@cache_anonymous_page(catalog_names, params=('q', 'page'))
 def search_books(request):
-    query = request.GET.get('q', '')
-    books = Book.objects.filter(title__icontains=query) if query else []
-    for book in books:
-        book.discount_price = book.price - book.calculate_discount()
+    query = request.GET.get('q', '').strip()
+    page_obj = []
+    if query:
+        books = with_prices(Book.objects.all()).defer(*CATALOG_DEFERRED_FIELDS)
+        paginator = Paginator(search.search_books(query, books), 10)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        prime_prices(page_obj)
+        caching.attach_dimensions(page_obj, 'author')
+        for book in page_obj:
+            book.discount_price = book.price - book.calculate_discount()
     return render(request, 'shop/book_list.html', {
-        'page_obj': books,
+        'page_obj': page_obj,
         'query': query
     })
 
 
-def book_list(request):
-    books = Book.objects.all()
-    for book in books:
+# Тяжёлые колонки, которые карточки каталога не показывают
+CATALOG_DEFERRED_FIELDS = ('description',)
+
+
+def catalog_page(request, books, per_page=10):
+    """
+    Страница каталога через keyset-пагинацию по (price, id): без COUNT и OFFSET,
+    скидка за срок на полке считается только для видимых книг.
+    """
+    books = with_prices(books).defer(*CATALOG_DEFERRED_FIELDS)
+    page_obj = KeysetPaginator(books, per_page).get_page(request.GET.get('cursor'))
+    prime_prices(page_obj)
+    # Авторы — из кэша справочников (shop.caching), без JOIN
+    caching.attach_dimensions(page_obj, 'author')
+    for book in page_obj:
         book.discount_price = book.price - book.calculate_discount()
-    paginator = Paginator(books, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'shop/book_list.html', {'page_obj': page_obj})
+    return page_obj
+
 
+@snapshot_reads
+@catalog_condition
+@cache_anonymous_page(catalog_names, params=('cursor', *facets.FILTER_PARAMS))
+def book_list(request):
+    # Фасетный каталог: ?genre=1,2&status=available&price=300-600 (shop.filters, shop.facets)
+    filters = facets.normalize(request.GET)
+    page_obj = catalog_page(request, facets.filter_books(filters))
+    return render(request, 'shop/book_list.html', {
+        'page_obj': page_obj,
+        'facets': facets.with_links(facets.facet_counts(filters, request), filters),
+        'filters': filters,
+    })
 
+
+@snapshot_reads
+@catalog_condition
+@cache_anonymous_page(catalog_names, params=('cursor',))
 def available_books(request):
-    books = Book.objects.filter(status='available')
-    for book in books:
-        book.discount_price = book.price - book.calculate_discount()
-    paginator = Paginator(books, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, Book.objects.available())
     return render(request, 'shop/book_list.html', {'page_obj': page_obj})
 
 
+@snapshot_reads
+@catalog_condition
+@cache_anonymous_page(catalog_names, params=('cursor',))
 def category_books(request, category_id):
     category = get_object_or_404(Category, id=category_id)
-    books = category.books.all()
-    for book in books:
-        book.discount_price = book.price - book.calculate_discount()
-    paginator = Paginator(books, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = catalog_page(request, category.books.all())
     return render(request, 'shop/category_books.html', {
         'category': category,
         'page_obj': page_obj
     })
 
 
+@snapshot_reads
+@book_condition
+@cache_anonymous_page(book_names)
 def book_detail(request, pk):
-    book = get_object_or_404(Book, pk=pk)
+    book = get_object_or_404(with_prices(Book.objects.all()), pk=pk)
+    caching.attach_dimensions([book], 'author', 'genre', 'series')
     book.discount_price = book.price - book.calculate_discount()
-    reviews = book.review_set.all()        # связанные отзывы
+    reviews = book.review_set.select_related('user')  # связанные отзывы с авторами
     promos = book.promobook_set.all()      # связанные акции
     return render(request, 'shop/book_detail.html', {
         'book': book,
@@ -194,6 +260,40 @@ def book_detail(request, pk):
 
 
 
+# Уменьшенная копия обложки или фото: создаётся при первом запросе, дальше её отдаёт веб-сервер из MEDIA_ROOT
+def rendition(request, size, density, fmt, source):
+    if (
+        size not in renditions.SIZES or density not in renditions.DENSITIES or fmt not in renditions.FORMATS
+        or not renditions.is_allowed_source(source) or not default_storage.exists(source)
+    ):
+        raise Http404
+    try:
+        renditions.generate(source, size)
+    except (OSError, SuspiciousFileOperation):  # не картинка или повреждённый файл
+        raise Http404
+    return redirect(default_storage.url(renditions.variant_name(source, size, density, fmt)))
+
+
+# Файл книги — только купившим; Range, ETag и передача отдачи прокси (shop.downloads)
+@login_required(login_url='login')
+@require_safe
+def download_book(request, pk):
+    book = get_object_or_404(Book.objects.only('pk', 'file'), pk=pk)
+    if not book.file:
+        raise Http404
+    if not downloads.has_purchased(request.user, book):
+        raise PermissionDenied
+    try:
+        return downloads.serve(request, book.file)
+    except FileNotFoundError:
+        raise Http404
+
+
+# Файлы книг не раздаются как обычные медиа даже при DEBUG
+def protected_media(request, path):
+    raise Http404
+
+
 # ======================
 # CRUD для Book
 # ======================
@@ -269,8 +369,41 @@ def books_stats(request):
 
 
 # update() и delete()
+REPRICE_FILTERS = {
+    'category': 'category_id',
+    'author': 'author_id',
+    'genre': 'genre_id',
+    'status': 'status',
+    'min_price': 'price__gte',
+    'max_price': 'price__lte',
+}
+
+
+@staff_member_required
+@require_POST
 def apply_discount(request):
-    Book.objects.update(discount=10)
+    # Переоценка книг по фильтру (не по списку id): один UPDATE на пачку, с историей цен
+    books = Book.objects.all()
+    try:
+        for field, lookup in REPRICE_FILTERS.items():
+            if request.POST.get(field):
+                books = books.filter(**{lookup: request.POST[field]})
+        result = repricing.reprice(
+            books,
+            percent=request.POST.get('percent') or None,
+            amount=request.POST.get('amount') or None,
+            reason=request.POST.get('reason', ''),
+            user=request.user,
+            dry_run=bool(request.POST.get('dry_run')),
+        )
+    except (ValueError, ArithmeticError, ValidationError) as exc:  # RepricingError — подкласс ValueError
+        messages.error(request, f"Переоценка не выполнена: {exc}")
+        return redirect('book_list')
+    if result.dry_run:
+        messages.info(request, f"Пробный запуск: изменится {result.count} книг, "
+                               f"сумма цен {result.old_total} -> {result.new_total}")
+    else:
+        messages.success(request, f"Переоценено книг: {result.count}")
     return redirect('book_list')
 
 
@@ -283,9 +416,21 @@ def delete_old_books(request):
 # CRUD Author
 # ======================
 
+AUTHORS_PER_PAGE = 24
+
+
 def author_list(request):
-    authors = Author.objects.all()
-    return render(request, 'shop/author_list.html', {'authors': authors})
+    # Число книг, рейтинг и продажи — из AuthorStats; ?sort=name|books
+    sort = request.GET.get('sort', 'name')
+    if sort not in Author.objects.DIRECTORY_SORTS:
+        sort = 'name'
+    paginator = Paginator(Author.objects.directory(sort), AUTHORS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'shop/author_list.html', {
+        'authors': page_obj,
+        'page_obj': page_obj,
+        'sort': sort,
+    })
 
 
 def create_author(request):